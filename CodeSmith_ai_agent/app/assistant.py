@@ -0,0 +1,63 @@
+"""Flair のドキュメントについて質問に答えるアシスタントのチェーン (langserve で /assistant に公開)。
+
+入力は {"document": save_file と同じ形のデータ, "question": 質問}。ドキュメントから生成したコードを
+プロンプトに入れて LLM に渡します。コードの生成はサーバーのプロセスプールで行います
+(ast.parse をスレッドで並列に呼ぶと Python 3.11 では SystemError になることがあるため)。
+LLM は環境変数 FLAIR_ASSISTANT_LLM で選びます。
+    fake   : (既定) ネットワークを使わない決まった応答。テストや負荷試験用
+    openai : langchain_openai.ChatOpenAI (FLAIR_ASSISTANT_MODEL でモデルを指定)
+"""
+import os
+from typing import Any, List
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+
+from app import documents
+
+SYSTEM_PROMPT = (
+    "あなたは Flair というフローチャートエディタのアシスタントです。"
+    "ドキュメントの各フレームは1つの Python の関数に変換されています。"
+    "生成したコードと文法の誤りをもとに、質問に簡潔に答えてください。"
+)
+DEFAULT_MODEL = "gpt-4o-mini"
+
+
+class AssistantInput(BaseModel):
+    document: List[Any]
+    question: str
+
+
+# 決まった応答を返す LLM の代わり。プロンプトの中の関数の数と誤りの有無だけを答えます。
+def fake_llm(prompt):
+    text = prompt.to_string()
+    functions = text.count("\ndef ")
+    has_errors = "文法の誤り: なし" not in text
+    return f"{functions} 個の関数があります。" + ("文法の誤りがあります。" if has_errors else "文法の誤りはありません。")
+
+
+def create_llm():
+    name = os.environ.get("FLAIR_ASSISTANT_LLM", "fake")
+    if name == "fake":
+        return RunnableLambda(fake_llm)
+    if name == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=os.environ.get("FLAIR_ASSISTANT_MODEL", DEFAULT_MODEL), temperature=0)
+    raise ValueError(f"知らない FLAIR_ASSISTANT_LLM です: {name}")
+
+
+# run_in_pool は、関数と引数を受け取ってプロセスプールで実行するコルーチン関数です。
+def create_chain(run_in_pool, llm=None):
+    # ドキュメントからプロンプトの変数を作ります。
+    async def prepare(inputs):
+        context = await run_in_pool(documents.assistant_context, inputs["document"])
+        return {"question": inputs["question"], **context}
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", SYSTEM_PROMPT),
+        ("human", "{question}\n\n生成したコード:\n```python\n{code}```\n\n文法の誤り: {errors}"),
+    ])
+    chain = RunnableLambda(prepare) | prompt | (llm or create_llm()) | StrOutputParser()
+    return chain.with_types(input_type=AssistantInput, output_type=str)
@@ -0,0 +1,352 @@
+"""リクエストの中身のハッシュをキーにしたレスポンスのキャッシュ (ASGI のミドルウェア)。
+
+キーはメソッド・パス・クエリ (並べ替えたもの)・本文の blake2b です。/assistant のJSONの入力は
+キーの順序や空白が違っても同じキーになるように、並べ替えてから数えます。ドキュメントの本文は
+save_file が同じドキュメントに同じバイト列を書くので、バイト列のまま数えます (解析はイベントループでしない)。
+
+- メモリの LRU (max_bytes の予算を超えたら古いものから捨てる) と、任意でディスクの層 (disk_dir)
+- キーを ETag として返し、If-None-Match が一致してキャッシュにあれば 304 (本文なし)
+- 同じキーのリクエストが計算中なら、後から来たものは計算を待って同じ結果を返す (1回だけ計算する)
+- Cache-Control: no-cache のリクエストはキャッシュを読まずに計算し直す (結果は保存する)
+- キャッシュから返す /assistant の応答には、呼び出しごとに新しい run_id を付ける (renew_run_ids)
+200 のレスポンスだけを保存します。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+ENTRY_OVERHEAD = 256 # エントリ1つに加えるバイト数 (辞書とオブジェクトの分)
+CANONICAL_JSON_LIMIT = 1024 * 1024 # この大きさまでのJSONの入力は並べ替えてからキーにする
+CACHED_PREFIXES = ("/documents/", "/batch/", "/assistant/invoke", "/assistant/batch")
+CANONICAL_PREFIXES = ("/assistant/",)
+RUN_ID_PREFIXES = ("/assistant/",) # 本文の metadata に langserve の run_id が入るパス
+SKIPPED_HEADERS = {b"content-length", b"transfer-encoding", b"etag", b"x-cache"}
+
+
+class CachedResponse:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers # [(名前, 値)] (バイト列)。content-length などは返すときに付け直す
+        self.body = body
+
+    def size(self):
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers) + ENTRY_OVERHEAD
+
+    def to_bytes(self):
+        header = {"status": self.status, "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in self.headers]}
+        return json.dumps(header).encode("utf-8") + b"\n" + self.body
+
+    @classmethod
+    def from_bytes(cls, data):
+        header, _, body = data.partition(b"\n")
+        header = json.loads(header)
+        return cls(header["status"], [(name.encode("latin-1"), value.encode("latin-1")) for name, value in header["headers"]], body)
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024, disk_dir=None, max_disk_bytes=4 * 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 8 # これより大きいレスポンスはメモリに置かない (ディスクには置く)
+        self.entries = OrderedDict() # キー -> CachedResponse (最近使ったものが後ろ)
+        self.size = 0
+        self.inflight = {} # キー -> 計算中のレスポンスを待つ Future
+        self.metrics = dict.fromkeys(
+            ("hits", "disk_hits", "misses", "coalesced", "not_modified", "stored", "evictions", "disk_evictions", "uncacheable"), 0
+        )
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_entries = OrderedDict() # キー -> ファイルの大きさ (古いものが前)
+        self.disk_size = 0
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            for path in sorted(self.disk_dir.glob("*.entry"), key=lambda path: path.stat().st_mtime):
+                size = path.stat().st_size
+                self.disk_entries[path.stem] = size
+                self.disk_size += size
+            remove_files(self.pop_disk_overflow()) # 前回より予算を小さくしたとき
+
+    # 環境変数 FLAIR_CACHE_BYTES / FLAIR_CACHE_DIR / FLAIR_CACHE_DISK_BYTES から作ります。
+    @classmethod
+    def from_environ(cls):
+        kwargs = {"disk_dir": os.environ.get("FLAIR_CACHE_DIR") or None}
+        if os.environ.get("FLAIR_CACHE_BYTES"):
+            kwargs["max_bytes"] = int(os.environ["FLAIR_CACHE_BYTES"])
+        if os.environ.get("FLAIR_CACHE_DISK_BYTES"):
+            kwargs["max_disk_bytes"] = int(os.environ["FLAIR_CACHE_DISK_BYTES"])
+        return cls(**kwargs)
+
+    # メモリにあれば返します。ディスクにだけあるものは load で読みます。
+    def get(self, key):
+        response = self.entries.get(key)
+        if response is not None:
+            self.entries.move_to_end(key)
+        return response
+
+    # ディスクから読み、メモリに置けるものは置きます。なければ None。
+    async def load(self, key):
+        if key not in self.disk_entries:
+            return None
+        try:
+            data = await asyncio.to_thread(self.entry_path(key).read_bytes)
+        except OSError:
+            self.forget_disk(key)
+            return None
+        response = CachedResponse.from_bytes(data)
+        self.disk_entries.move_to_end(key)
+        self.store_memory(key, response)
+        return response
+
+    async def put(self, key, response):
+        self.metrics["stored"] += 1
+        self.store_memory(key, response)
+        if self.disk_dir is not None and key not in self.disk_entries:
+            await self.store_disk(key, response.to_bytes())
+
+    def store_memory(self, key, response):
+        size = response.size()
+        if size > self.max_entry_bytes:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous.size()
+        self.entries[key] = response
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size()
+            self.metrics["evictions"] += 1
+
+    def entry_path(self, key):
+        return self.disk_dir / f"{key}.entry"
+
+    # ファイルの読み書きはスレッドで行い、表 (disk_entries) はイベントループでだけ触ります。
+    # 予算を超えたら古いファイルから消します。
+    async def store_disk(self, key, data):
+        if len(data) > self.max_disk_bytes:
+            return
+        await asyncio.to_thread(write_file, self.entry_path(key), data)
+        self.disk_entries[key] = len(data)
+        self.disk_size += len(data)
+        evicted = self.pop_disk_overflow()
+        if evicted:
+            await asyncio.to_thread(remove_files, evicted)
+
+    # 予算を超えた分を古いものから表から外し、消すファイルの並びを返します。
+    def pop_disk_overflow(self):
+        evicted = []
+        while self.disk_size > self.max_disk_bytes:
+            old_key = next(iter(self.disk_entries))
+            self.disk_size -= self.disk_entries.pop(old_key)
+            evicted.append(self.entry_path(old_key))
+            self.metrics["disk_evictions"] += 1
+        return evicted
+
+    def forget_disk(self, key):
+        self.disk_size -= self.disk_entries.pop(key, 0)
+        remove_files([self.entry_path(key)])
+
+    def snapshot(self):
+        return {
+            **self.metrics,
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "inflight": len(self.inflight),
+            "disk_entries": len(self.disk_entries),
+            "disk_bytes": self.disk_size,
+            "max_disk_bytes": self.max_disk_bytes if self.disk_dir is not None else 0,
+        }
+
+
+# 一時ファイルに書いてから置き換えるので、読む側が書きかけのファイルを見ることはありません。
+def write_file(path, data):
+    temp_path = path.with_suffix(".tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+# キャッシュのキー (ETag にもする) を返します。
+def request_key(method, path, query_string, body):
+    digest = hashlib.blake2b(digest_size=20)
+    query = sorted(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True))
+    for part in (method, path, json.dumps(query)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    if path.startswith(CANONICAL_PREFIXES) and len(body) <= CANONICAL_JSON_LIMIT:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        except ValueError:
+            pass # JSONでなければバイト列のまま (アプリが 422 を返す)
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def header_value(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+# If-None-Match (カンマ区切り、弱い ETag、* を含む) が etag と一致するか。
+def etag_matches(if_none_match, etag):
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+class ResponseCacheMiddleware:
+    """CACHED_PREFIXES のパスへの POST のレスポンスを ResponseCache に保存して返します。"""
+
+    def __init__(self, app, cache, max_body_bytes):
+        self.app = app
+        self.cache = cache
+        self.max_body_bytes = max_body_bytes # これより大きい本文はキャッシュせずにそのままアプリに渡す
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(CACHED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        # 本文を読みながら上限を確かめる。読んだ分はアプリにそのまま渡し直す
+        chunks = []
+        size = 0
+        complete = False
+        while size <= self.max_body_bytes:
+            message = await receive()
+            chunks.append(message)
+            if message["type"] != "http.request":
+                break # 切断
+            size += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                complete = size <= self.max_body_bytes
+                break
+        replay = replaying_receive(chunks, receive)
+        if not complete:
+            self.cache.metrics["uncacheable"] += 1
+            await self.app(scope, replay, send)
+            return
+
+        body = b"".join(message.get("body", b"") for message in chunks)
+        key = request_key(scope["method"], scope["path"], scope["query_string"], body)
+        etag = f'"{key}"'
+        no_cache = "no-cache" in (header_value(scope, b"cache-control") or "")
+
+        if not no_cache:
+            response = self.cache.get(key)
+            if response is not None:
+                self.cache.metrics["hits"] += 1
+            elif key in self.cache.disk_entries:
+                response = await self.cache.load(key)
+                if response is not None:
+                    self.cache.metrics["disk_hits"] += 1
+            elif key in self.cache.inflight:
+                response = await asyncio.shield(self.cache.inflight[key])
+                if response is not None:
+                    self.cache.metrics["coalesced"] += 1
+            if response is not None:
+                await self.send_cached(scope, send, response, etag)
+                return
+
+        self.cache.metrics["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        leader = key not in self.cache.inflight
+        if leader:
+            self.cache.inflight[key] = future
+        response = None
+        try:
+            response = await self.run_app(scope, replay, send, etag)
+            if response is not None:
+                await self.cache.put(key, response)
+        finally:
+            if leader:
+                del self.cache.inflight[key]
+                future.set_result(response) # 失敗したときは None (待っていたものはそれぞれ計算する)
+
+    # アプリを実行し、送ったレスポンスに ETag を付けながら写しを取ります。200 でなければ None。
+    async def run_app(self, scope, receive, send, etag):
+        status = None
+        headers = []
+        body = []
+        cacheable = True
+
+        async def capture(message):
+            nonlocal status, headers, cacheable
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [(name, value) for name, value in message.get("headers", []) if name.lower() not in SKIPPED_HEADERS]
+                cacheable = status == 200
+                if cacheable:
+                    message = dict(message, headers=list(message.get("headers", [])) + [(b"etag", etag.encode()), (b"x-cache", b"miss")])
+            elif message["type"] == "http.response.body" and cacheable:
+                body.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, capture)
+        if not cacheable or status is None:
+            self.cache.metrics["uncacheable"] += 1
+            return None
+        return CachedResponse(status, headers, b"".join(body))
+
+    async def send_cached(self, scope, send, response, etag):
+        headers = [(b"etag", etag.encode()), (b"x-cache", b"hit")]
+        if etag_matches(header_value(scope, b"if-none-match"), etag):
+            self.cache.metrics["not_modified"] += 1
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        body = response.body
+        if scope["path"].startswith(RUN_ID_PREFIXES):
+            body = renew_run_ids(body)
+        headers = response.headers + headers + [(b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": response.status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+# キャッシュから返す langserve の応答の run_id を新しいものにします。
+# 保存した応答の run_id をそのまま返すと、別々の呼び出しが同じ run_id になり、実行やフィードバックを区別できない。
+# フィードバックのトークンは元の実行のものなので外します。JSONでなければそのまま返します。
+def renew_run_ids(body):
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    metadata = data.get("metadata") if isinstance(data, dict) else None
+    if not isinstance(metadata, dict):
+        return body
+    responses = metadata.get("responses") or [] # batch の応答は、入力ごとの metadata の並び
+    for item in [metadata, *responses]:
+        if isinstance(item, dict) and "run_id" in item:
+            item["run_id"] = str(uuid.uuid4())
+            item["feedback_tokens"] = []
+    if "run_ids" in metadata:
+        metadata["run_ids"] = [item.get("run_id") for item in responses]
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+# 先に読んだメッセージを返してから、元の receive に戻ります。
+def replaying_receive(messages, receive):
+    messages = list(messages)
+
+    async def replay():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    return replay
@@ -0,0 +1,92 @@
+"""Flair のドキュメントを扱う処理 (プロセスプールで実行する側)。
+
+どの関数もリクエストの本文のバイト列をそのまま受け取り、JSONの解析から行うので、
+解析も含めてCPUを使う処理はすべてイベントループの外 (ワーカープロセス) で動きます。
+Flair の maincode を import するので、環境変数 FLAIR_MAINCODE (既定はこのリポジトリの maincode) を
+sys.path に加えます。ワーカープロセスでもこのモジュールを import したときに同じように加わります。
+"""
+import json
+import os
+import sys
+from pathlib import Path
+
+MAINCODE_DIR = Path(os.environ.get("FLAIR_MAINCODE", Path(__file__).resolve().parents[2] / "maincode"))
+if str(MAINCODE_DIR) not in sys.path:
+    sys.path.insert(0, str(MAINCODE_DIR))
+
+import doctools  # noqa: E402
+from codegen import CodeGenerator  # noqa: E402
+from doctools import DocumentError  # noqa: E402
+
+
+# 問題の並びをレスポンス用の辞書の並びにします。
+def problem_list(problems):
+    return [
+        {"frame": frame, "block": block, "message": message}
+        for frame, block, message in problems
+    ]
+
+
+def validate(raw):
+    try:
+        document = doctools.load_text(raw)
+    except DocumentError as e:
+        return {"valid": False, "problems": problem_list(e.problems)}
+    return {"valid": True, "problems": [], "frames": len(document), "blocks": document.block_count()}
+
+
+# save_file と同じ形 (indent=2) のJSONのバイト列を返します。
+def normalize(raw):
+    return doctools.load_text(raw).dumps().encode("utf-8")
+
+
+def stats(raw):
+    return doctools.document_stats(doctools.load_text(raw))
+
+
+def compile_code(raw):
+    return code_result(doctools.load_text(raw))
+
+
+# ドキュメントから生成したコードと、関数の名前・文法の誤りを辞書で返します。
+def code_result(document):
+    module = CodeGenerator().generate(document)
+    return {
+        "functions": [code.name for code in module.frames],
+        "source": module.source,
+        "errors": problem_list(module.errors()),
+    }
+
+
+# アシスタントのプロンプトに入れる、生成したコードと文法の誤りの一覧を返します。data は保存形式のデータ (リスト)。
+def assistant_context(data):
+    module = CodeGenerator().generate(doctools.from_data(data))
+    errors = "\n".join(doctools.format_problem(*error) for error in module.errors()) or "なし"
+    return {"code": module.source, "errors": errors}
+
+
+# 生成したコードだけをバイト列で返します (ストリームで返す用)。
+def compile_source(raw):
+    return CodeGenerator().generate(doctools.load_text(raw)).source.encode("utf-8")
+
+
+OPERATIONS = {"validate": validate, "normalize": normalize, "stats": stats, "compile": compile_code}
+
+
+# バッチ: 複数のドキュメントに同じ処理をし、ドキュメントごとの結果をJSONの行のバイト列で返します。
+# 行は {"index": 番号, "result": 結果} か {"index": 番号, "error": 問題の並び} で、番号は first から数えます。
+# JSONへの変換もワーカーで行うので、サーバーのイベントループは受け取ったバイト列を返すだけです。
+def run_chunk(operation, first, raws):
+    function = OPERATIONS[operation]
+    lines = []
+    for index, raw in enumerate(raws, first):
+        try:
+            result = function(raw)
+        except DocumentError as e:
+            line = {"index": index, "error": problem_list(e.problems)}
+        else:
+            if isinstance(result, bytes):
+                result = result.decode("utf-8")
+            line = {"index": index, "result": result}
+        lines.append(json.dumps(line, ensure_ascii=False))
+    return ("\n".join(lines) + "\n").encode("utf-8")
@@ -1,8 +1,61 @@
-from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+"""Flair のドキュメントサービス。
+
+ドキュメントは save_file が書くのと同じ形のJSONを、リクエストの本文としてそのまま受け取ります。
+    POST /documents/validate   形式の検査。問題があれば位置 (フレーム・ブロック) と一緒に返す
+    POST /documents/normalize  save_file と同じ形 (indent=2) に整えたJSON (ストリームで返す)
+    POST /documents/stats      フレーム・ブロック・種類ごとの数など
+    POST /documents/compile    生成したコードと文法の誤り (?format=python ならコードだけをストリームで返す)
+    POST /batch/{操作}          1行に1つのドキュメント (JSON Lines) を受け取り、終わったものから1行ずつ返す
+    /assistant                 ドキュメントについて質問に答えるチェーン (langserve)
+    GET /cache/metrics         レスポンスのキャッシュのヒット・ミス・追い出しの数
+
+POST のレスポンスは中身のハッシュをキーにしてキャッシュし、ETag / If-None-Match に対応します (cache.py)。
+
+JSONの解析も含めてCPUを使う処理はプロセスプールで行い、イベントループでは本文の読み書きだけをします。
+本文は少しずつ読み、MAX_DOCUMENT_BYTES を超えたら 413 を返します。
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import RedirectResponse, StreamingResponse
 from langserve import add_routes
 
-app = FastAPI()
+from app import documents
+from app.assistant import create_chain
+from app.cache import ResponseCache, ResponseCacheMiddleware
+
+MAX_DOCUMENT_BYTES = int(os.environ.get("FLAIR_MAX_DOCUMENT_BYTES", 256 * 1024 * 1024))
+WORKERS = int(os.environ.get("FLAIR_SERVICE_WORKERS", 0)) or None # 既定は CPU の数
+STREAM_CHUNK_BYTES = 64 * 1024 # ストリームで返すときの1回の大きさ
+BATCH_CHUNK_BYTES = 256 * 1024 # バッチで1回にワーカーに渡すドキュメントの合計の大きさの目安
+BATCH_CHUNK_DOCUMENTS = 64 # バッチで1回にワーカーに渡すドキュメントの数の上限
+
+pool_lock = threading.Lock() # app.state.pool の入れ替えを守る
+
+
+def create_pool():
+    # fork だとサーバーのスレッドの状態まで複製されるので、spawn で起動する
+    return ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.pool = create_pool()
+    try:
+        yield
+    finally:
+        app.state.pool.shutdown(cancel_futures=True)
+
+
+app = FastAPI(title="Flair document service", lifespan=lifespan)
+response_cache = ResponseCache.from_environ()
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache, max_body_bytes=MAX_DOCUMENT_BYTES)
 
 
 @app.get("/")
@@ -10,8 +63,115 @@ async def redirect_root_to_docs() -> RedirectResponse:
     return RedirectResponse("/docs")
 
 
-# Edit this to add the chain you want to add
-add_routes(app, NotImplemented)
+@app.get("/cache/metrics")
+async def cache_metrics():
+    return response_cache.snapshot()
+
+
+# リクエストの本文を少しずつ読みます。大きすぎれば 413。
+async def read_body(request):
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > MAX_DOCUMENT_BYTES:
+        raise HTTPException(status_code=413, detail=f"本文が {MAX_DOCUMENT_BYTES} バイトを超えています")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_DOCUMENT_BYTES:
+            raise HTTPException(status_code=413, detail=f"本文が {MAX_DOCUMENT_BYTES} バイトを超えています")
+    return body
+
+
+# プロセスプールで実行します。ドキュメントの問題は 422 にします。
+async def run_in_pool(function, *args):
+    loop = asyncio.get_running_loop()
+    pool = app.state.pool
+    try:
+        return await loop.run_in_executor(pool, function, *args)
+    except documents.DocumentError as e:
+        raise HTTPException(status_code=422, detail=documents.problem_list(e.problems))
+    except BrokenProcessPool:
+        replace_pool(pool)
+        raise HTTPException(status_code=503, detail="ワーカープロセスが終了しました。もう一度送ってください")
+
+
+# ワーカーが落ちるとプール全体が使えなくなるので作り直します。
+# 同じプールで失敗したリクエストが他にもあれば、最初の1つだけが作り直します。
+def replace_pool(broken):
+    with pool_lock:
+        if app.state.pool is not broken:
+            return
+        app.state.pool = create_pool()
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def iter_chunks(data):
+    for start in range(0, len(data), STREAM_CHUNK_BYTES):
+        yield data[start:start + STREAM_CHUNK_BYTES]
+
+
+@app.post("/documents/validate")
+async def validate_document(request: Request):
+    return await run_in_pool(documents.validate, await read_body(request))
+
+
+@app.post("/documents/normalize")
+async def normalize_document(request: Request):
+    data = await run_in_pool(documents.normalize, await read_body(request))
+    return StreamingResponse(iter_chunks(data), media_type="application/json")
+
+
+@app.post("/documents/stats")
+async def document_stats(request: Request):
+    return await run_in_pool(documents.stats, await read_body(request))
+
+
+@app.post("/documents/compile")
+async def compile_document(request: Request, format: str = "json"):
+    if format == "python":
+        source = await run_in_pool(documents.compile_source, await read_body(request))
+        return StreamingResponse(iter_chunks(source), media_type="text/x-python; charset=utf-8")
+    if format != "json":
+        raise HTTPException(status_code=400, detail=f"format は json か python です: {format}")
+    return await run_in_pool(documents.compile_code, await read_body(request))
+
+
+# JSON Lines の本文を、ワーカーに1回で渡す (最初の番号, ドキュメントの並び) に分けます。空の行は数えません。
+def split_batch(body):
+    first = index = size = 0
+    raws = []
+    for line in body.split(b"\n"):
+        if not line.strip():
+            continue
+        raws.append(line)
+        size += len(line)
+        index += 1
+        if size >= BATCH_CHUNK_BYTES or len(raws) >= BATCH_CHUNK_DOCUMENTS:
+            yield first, raws
+            first, size, raws = index, 0, []
+    if raws:
+        yield first, raws
+
+
+# 各行は {"index": 番号, "result": 結果} か {"index": 番号, "error": 問題の並び}。終わった順に返すので、番号の順とは限りません。
+@app.post("/batch/{operation}")
+async def run_batch(operation: str, request: Request):
+    if operation not in documents.OPERATIONS:
+        raise HTTPException(status_code=404, detail=f"知らない操作です: {operation}")
+    chunks = list(split_batch(await read_body(request)))
+
+    async def results():
+        tasks = [asyncio.ensure_future(run_in_pool(documents.run_chunk, operation, first, raws)) for first, raws in chunks]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel() # クライアントが切断したときは残りを取り消す
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+add_routes(app, create_chain(run_in_pool), path="/assistant")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,99 @@
+"""ブロックのウィジェットの計測: 1つあたりの作る時間とメモリ。
+
+legacy は以前の QtBlock と同じく、ブロックごとに QVBoxLayout と QTextEdit を持ちます。
+current は今の QtBlock (テキストを QStaticText で描き、編集は共有のエディターで行う) です。
+どちらも同じテキストを入れて表示し、1回描いてから測ります。メモリは別のプロセスで測った RSS の増加分です。
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_blocks.py --blocks 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "maincode"))
+
+VARIANTS = ("legacy", "current")
+
+
+def rss_kb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+# 子プロセス: variant のブロックを blocks 個作って表示し、時間と RSS の増加を返します。
+def run_variant(variant, blocks):
+    from PySide6.QtWidgets import QApplication, QFrame, QScrollArea, QTextEdit, QVBoxLayout, QWidget
+
+    import theme
+    from Flair import QtBlock
+
+    class LegacyBlock(QFrame):
+        """以前の QtBlock と同じく、ブロックごとにQTextEditを持つブロック。"""
+        def __init__(self, width, height, parent=None):
+            super().__init__(parent)
+            self.setFixedHeight(height)
+            layout = QVBoxLayout(self)
+            self.text_edit = QTextEdit()
+            self.text_edit.setUndoRedoEnabled(False)
+            layout.addWidget(self.text_edit)
+
+        def set_text(self, text):
+            self.text_edit.setPlainText(text)
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    theme.apply(app)
+    # メインバーと同じ構造 (role="mainbar" のスクロールエリア) の中に作る
+    scroll_area = QScrollArea()
+    scroll_area.setProperty("role", "mainbar")
+    scroll_area.setWidgetResizable(True)
+    content = QWidget()
+    content.setMinimumSize(300, blocks * 90)
+    scroll_area.setWidget(content)
+    scroll_area.resize(400, 800)
+    scroll_area.show()
+    app.processEvents()
+
+    block_class = LegacyBlock if variant == "legacy" else QtBlock
+    before = rss_kb()
+    start = time.perf_counter()
+    widgets = []
+    for i in range(blocks):
+        block = block_class(280, 80, content)
+        block.setGeometry(10, i * 90, 280, 80)
+        block.set_text(f"frame 0 block {i}\nx = {i}")
+        block.show()
+        widgets.append(block)
+    app.processEvents()
+    created = time.perf_counter()
+    content.grab() # 全部のブロックを1回描く
+    painted = time.perf_counter()
+    return {
+        "create_per_block_us": (created - start) / blocks * 1e6,
+        "paint_per_block_us": (painted - created) / blocks * 1e6,
+        "rss_per_block_kb": (rss_kb() - before) / blocks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=2000)
+    parser.add_argument("--child", choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_variant(args.child, args.blocks)))
+        return
+
+    result = {"blocks": args.blocks}
+    for variant in VARIANTS:
+        output = subprocess.run([sys.executable, __file__, "--child", variant, "--blocks", str(args.blocks)], check=True, capture_output=True, text=True).stdout
+        result[variant] = json.loads(output)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""画像の書き出しの計測: 形式ごとの時間と最大RSS。
+
+合成ドキュメント (suite.py と同じ形) を形式ごとに別のプロセスで書き出し、時間とそのプロセスの最大RSSを測ります。
+キャンバス全体を1枚の画像 (ARGB32) にしたときに必要なメモリも並べて出します。
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_export.py --blocks 10000 100000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "maincode"))
+
+from suite import write_document
+
+FORMATS = ("png", "pdf", "svg")
+
+
+# 子プロセス: path を fmt で書き出し、時間・最大RSS・ファイルの大きさを返します。
+def run_format(path, fmt, output_dir):
+    import export
+
+    start = time.perf_counter()
+    if export.main([path, "--format", fmt, "--output-dir", output_dir]) != 0:
+        raise SystemExit(1)
+    output = Path(output_dir) / (Path(path).stem + "." + fmt)
+    return {
+        "seconds": time.perf_counter() - start,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "file_kb": output.stat().st_size // 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, nargs="+", default=[10000])
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS) # 形式, ドキュメント, 出力先
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_format(args.child[1], args.child[0], args.child[2])))
+        return
+
+    from PySide6.QtGui import QGuiApplication
+
+    from document import Document
+    from export import CanvasRenderer
+
+    _ = QGuiApplication.instance() or QGuiApplication(sys.argv) # 文字の大きさを測るのに要る。終わるまで残しておく
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for blocks in args.blocks:
+            path = os.path.join(tmp, f"bench{blocks}.json")
+            write_document(path, blocks)
+            size = CanvasRenderer(Document.load(path).frames).size
+            result = {
+                "canvas": [size.width(), size.height()],
+                "full_image_mb": size.width() * size.height() * 4 / (1 << 20), # 1枚の画像に描いた場合
+            }
+            for fmt in args.formats:
+                output = subprocess.run([sys.executable, __file__, "--child", fmt, path, tmp], check=True, capture_output=True, text=True).stdout
+                result[fmt] = json.loads(output)
+            results[blocks] = result
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
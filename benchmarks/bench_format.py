@@ -0,0 +1,104 @@
+"""保存形式の計測: JSON と flairb で、ファイルを開く時間とメモリ使用量 (RSS) を比べます。
+
+開く処理はそれぞれ別のプロセスで実行し、開く前後のRSSの差を測ります。
+flairb はフレーム表だけを読むので、最初のフレームの中身を読む時間も別に測ります。
+    python benchmarks/bench_format.py --blocks 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "maincode"))
+
+from document import Document
+
+BLOCKS_PER_FRAME = 100
+
+
+# 現在のRSS (KB) を返します。測れない環境では None を返します。
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+# save_file と同じ内容のドキュメントを作ります。種類のあるブロックも混ぜておきます。
+def make_document(blocks):
+    document = Document()
+    kinds = (None, None, None, "if", "true", None, "while", None, "return")
+    frame = None
+    for index in range(blocks):
+        if index % BLOCKS_PER_FRAME == 0:
+            frame = document.add_frame()
+        frame.append_block(f"block {index} テキスト", kinds[index % len(kinds)])
+    return document
+
+
+# 子プロセス: ファイルを開き、かかった時間とRSSの増分を出力します。
+def child(path):
+    before = rss_kb()
+    start = time.perf_counter()
+    document = Document.load(path)
+    opened = time.perf_counter()
+    document.frames[0].blocks # 最初のフレームを表示するのに必要な分だけ読む
+    first_frame = time.perf_counter()
+    after = rss_kb()
+    print(json.dumps({
+        "open_ms": (opened - start) * 1000,
+        "first_frame_ms": (first_frame - start) * 1000,
+        "rss_kb": after - before if before is not None and after is not None else None,
+    }))
+
+
+def measure(path):
+    output = subprocess.run([sys.executable, __file__, "--child", path], check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for blocks in args.blocks:
+            document = make_document(blocks)
+            json_path = os.path.join(tmp, f"bench_{blocks}.json")
+            binary_path = os.path.join(tmp, f"bench_{blocks}.flairb")
+            document.save(json_path)
+            document.save(binary_path)
+
+            # 変換で内容が変わらないことを確かめる (JSON -> flairb -> JSON)
+            if Document.load(binary_path).dumps() != Path(json_path).read_text(encoding="utf-8"):
+                raise SystemExit(f"{blocks} ブロック: flairb から戻したJSONが一致しません")
+
+            results.append({
+                "blocks": blocks,
+                "json": dict(measure(json_path), size_kb=os.path.getsize(json_path) // 1024),
+                "flairb": dict(measure(binary_path), size_kb=os.path.getsize(binary_path) // 1024),
+            })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
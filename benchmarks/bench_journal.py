@@ -0,0 +1,77 @@
+"""ジャーナルの計測: 自動保存を有効にしたときと無効のときの、1文字入力あたりの時間。
+
+compact_ops を小さくして、入力中にスナップショットの書き出しが何度も起きるようにしています。
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_journal.py --blocks 20000 --keys 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "maincode"))
+
+from PySide6.QtWidgets import QApplication
+
+from Flair import FlairApp
+
+
+# blocks 個のブロックがあるフレームで keys 文字入力し、1文字ごとの時間を返します。
+def type_keys(app, recovery_dir, blocks, keys, compact_ops):
+    window = FlairApp(recovery_dir=recovery_dir)
+    if window.journal:
+        window.journal.flush_interval = 0.05
+        window.journal.compact_ops = compact_ops
+    window.resize(1200, 800)
+    window.show()
+    window.add_frame()
+    frame = window.selected_frame
+    for _ in range(blocks):
+        frame.add_block(window.block_width, window.block_height)
+        if window.journal:
+            window.journal.add_block(0)
+    app.processEvents()
+    window.update_virtualization()
+    app.processEvents()
+
+    window.focus_block(frame, 0)
+    text_edit = window.block_editor
+    samples = []
+    for key in range(keys):
+        start = time.perf_counter()
+        text_edit.insertPlainText("a")
+        app.processEvents()
+        samples.append(time.perf_counter() - start)
+        if key % 50 == 0:
+            time.sleep(0.01) # 書き込みスレッドに書く機会を与える
+    window.modified = False
+    window.close()
+    samples.sort()
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p99_ms": samples[int(len(samples) * 0.99) - 1] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--compact-ops", type=int, default=200)
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    result = {"blocks": args.blocks, "keys": args.keys}
+    result["without_journal"] = type_keys(app, None, args.blocks, args.keys, args.compact_ops)
+    with tempfile.TemporaryDirectory() as tmp:
+        result["with_journal"] = type_keys(app, tmp, args.blocks, args.keys, args.compact_ops)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
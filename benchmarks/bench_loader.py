@@ -0,0 +1,87 @@
+"""ローダーの計測: 最初のフレームが表示されるまでの時間と読み込みのスループット。
+
+ヘッドレスで実行できます:
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_loader.py --blocks 100000 --frames 20
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "maincode"))
+
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QApplication
+
+from Flair import FlairApp
+
+
+# save_file と同じ形式のテストデータを書き出します。
+def write_document(path, frames, blocks):
+    per_frame = max(1, blocks // frames)
+    data = [[[f"frame {f} block {b}"] for b in range(per_frame)] for f in range(frames)]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    return per_frame * frames
+
+
+def run(frames, blocks):
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = FlairApp()
+    window.resize(1200, 800)
+    window.show()
+    app.processEvents()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.json")
+        total_blocks = write_document(path, frames, blocks)
+
+        # イベントループが止まっていた最長の時間を測るための心拍
+        stalls = []
+        last_beat = [time.perf_counter()]
+
+        def beat():
+            now = time.perf_counter()
+            stalls.append(now - last_beat[0])
+            last_beat[0] = now
+
+        heartbeat = QTimer()
+        heartbeat.timeout.connect(beat)
+        heartbeat.start(1)
+
+        first_frame = []
+        start = time.perf_counter()
+        last_beat[0] = start
+        window.load_file(path)
+        window.loader.frame_loaded.connect(lambda _: first_frame or first_frame.append(time.perf_counter()))
+        while window.loader.is_running():
+            app.processEvents()
+        end = time.perf_counter()
+        heartbeat.stop()
+
+    result = {
+        "frames": frames,
+        "blocks": total_blocks,
+        "time_to_first_frame_ms": (first_frame[0] - start) * 1000 if first_frame else None,
+        "total_ms": (end - start) * 1000,
+        "blocks_per_second": total_blocks / (end - start),
+        "max_event_loop_stall_ms": max(stalls) * 1000 if stalls else 0.0,
+    }
+    window.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--blocks", type=int, default=10000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.frames, args.blocks), indent=2))
+
+
+if __name__ == "__main__":
+    main()
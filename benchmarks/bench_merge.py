@@ -0,0 +1,140 @@
+"""構造のマージの計測: ドキュメントの大きさごとの、読み込み・マージ・保存の時間。
+
+共通の祖先から、ours と theirs がそれぞれ別のブロックを --edits 個ずつ変えた (テキストの変更・追加・削除) ドキュメントを作り、
+flair merge と同じ処理 (flair_cli.run_merge) の時間を測ります。比べるために git merge-file (行ごとのマージ) の時間と衝突の数も出します。
+ドキュメントの形は2つです。
+    wide : 1フレーム100ブロック (bench_format.py と同じ)
+    tall : 10フレームにブロックを均等に分ける (suite.py と同じ。1フレームが大きい)
+    python benchmarks/bench_merge.py --blocks 10000 100000
+計測の前に、CASES のマージの結果と衝突の数が期待どおりかを確かめます (違えば終了コード 1)。
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "maincode"))
+
+import flair_cli
+from bench_format import make_document
+from document import Document
+from suite import write_document
+
+SHAPES = ("wide", "tall")
+
+# (base, ours, theirs, 期待するマージの結果, 衝突の数)
+CASES = [
+    # 片方がブロックを変え、もう片方が同じブロックの別の行を変えて後ろに追加した
+    ([[["a"], ["l1\nl2\nl3"]]], [[["a"], ["L1\nl2\nl3"]]], [[["a"], ["l1\nl2\nL3"], ["c"]]],
+     [[["a"], ["L1\nl2\nL3"], ["c"]]], 0),
+    # 片方がフレームのブロックを変え、もう片方が同じフレームに追加してフレームも追加した
+    ([[["a"], ["b"]]], [[["a"], ["B"]]], [[["a"], ["b"], ["x"]], [["new"]]],
+     [[["a"], ["B"], ["x"]], [["new"]]], 0),
+    # 片方が削除したブロックを、もう片方が変えた
+    ([[["a"], ["b"]], [["c"]]], [[["a"]], [["c"]]], [[["a"], ["B"]], [["c2"]]],
+     [[["a"], ["<<<<<<< ours"], ["======="], ["B"], [">>>>>>> theirs"]], [["c2"]]], 1),
+    # 片方が削除したフレームを、もう片方が変えた (削除した側も印で示す)
+    ([[["a"]], [["f1"], ["f2"]]], [[["a"]]], [[["a"]], [["f1"], ["F2"]]],
+     [[["a"]], [["<<<<<<< ours"], ["======="], ["f1"], ["F2"], [">>>>>>> theirs"]]], 1),
+    # 種類とテキストを別々に変えた
+    ([[["if x", "if"]]], [[["if x > 0", "if"]]], [[["if x", "while"]]],
+     [[["if x > 0", "while"]]], 0),
+]
+
+
+# CASES を確かめ、期待と違うものの番号の並びを返します。
+def check_cases():
+    failed = []
+    for number, (base, ours, theirs, expected, conflicts) in enumerate(CASES):
+        merger = flair_cli.Merger()
+        merged = merger.merge(*(Document.from_data(data) for data in (base, ours, theirs)))
+        if merged.to_data() != expected or len(merger.conflicts) != conflicts:
+            failed.append(number)
+    return failed
+
+
+# 保存形式のデータの、positions ((フレーム, ブロック) の並び) のブロックに変更を入れます。
+def apply_edits(data, positions, tag):
+    # 後ろから変えるので、追加や削除で前の位置はずれない
+    for number, (frame_index, index) in enumerate(sorted(positions, reverse=True)):
+        blocks = data[frame_index]
+        operation = number % 3
+        if operation == 0:
+            blocks[index][0] += f" # {tag}"
+        elif operation == 1:
+            blocks.insert(index, [f"{tag} {number}"])
+        else:
+            del blocks[index]
+
+
+def write_revisions(directory, shape, blocks, edits):
+    base_path = os.path.join(directory, "base.json")
+    if shape == "wide":
+        make_document(blocks).save(base_path)
+    else:
+        write_document(base_path, blocks)
+    base = Document.load(base_path)
+    positions = [(frame_index, index) for frame_index, frame in enumerate(base.frames) for index in range(len(frame))]
+    chosen = random.Random(blocks).sample(positions, edits * 2)
+    for name, part in (("ours", chosen[:edits]), ("theirs", chosen[edits:])):
+        data = base.to_data()
+        apply_edits(data, part, name)
+        Document.from_data(data).save(os.path.join(directory, name + ".json"))
+    return [os.path.join(directory, name + ".json") for name in ("base", "ours", "theirs")]
+
+
+def measure(shape, blocks, edits):
+    with tempfile.TemporaryDirectory() as tmp:
+        base, ours, theirs = write_revisions(tmp, shape, blocks, edits)
+        output = os.path.join(tmp, "merged.json")
+        shutil.copy(ours, output)
+        start = time.perf_counter()
+        revisions = flair_cli.load_revisions([base, ours, theirs])
+        loaded = time.perf_counter()
+        merger = flair_cli.Merger()
+        document = merger.merge(*(document for document, _ in revisions))
+        merged = time.perf_counter()
+        document.save(output)
+        saved = time.perf_counter()
+        result = {
+            "load_ms": (loaded - start) * 1000,
+            "merge_ms": (merged - loaded) * 1000,
+            "save_ms": (saved - merged) * 1000,
+            "conflicts": len(merger.conflicts),
+        }
+        if shutil.which("git"):
+            line_output = os.path.join(tmp, "line.json")
+            shutil.copy(ours, line_output)
+            start = time.perf_counter()
+            process = subprocess.run(["git", "merge-file", line_output, base, theirs], capture_output=True)
+            result["git_merge_file_ms"] = (time.perf_counter() - start) * 1000
+            result["git_conflicts"] = max(process.returncode, 0) # 終了コードが衝突の数
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--edits", type=int, default=100, help="ours と theirs がそれぞれ変えるブロックの数")
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    args = parser.parse_args()
+
+    failed = check_cases()
+    if failed:
+        print(f"マージの結果が期待と違います: CASES {failed}", file=sys.stderr)
+        sys.exit(1)
+    results = {}
+    for shape in args.shapes:
+        for blocks in args.blocks:
+            results[f"{shape} {blocks}"] = measure(shape, blocks, args.edits)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
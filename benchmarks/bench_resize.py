@@ -0,0 +1,101 @@
+"""フレームのリサイズの計測: 2k ブロックのフレームの幅を変え続けたときの1回あたりの時間。
+
+legacy は以前の QtFrame.resizeEvent と同じく、全ブロックに setFixedWidth します。
+current は FlairApp のフレーム (見えているブロックだけがウィジェットで、幅はレイアウトが合わせる) です。
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_resize.py --blocks 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "maincode"))
+
+from PySide6.QtWidgets import QApplication, QFrame, QVBoxLayout
+
+from Flair import FlairApp, QtBlock
+from frame_clock import shared_clock
+
+
+class LegacyFrame(QFrame):
+    """以前の QtFrame と同じく、全ブロックをレイアウトに入れて幅を個別に設定するフレーム。"""
+    def __init__(self, count):
+        super().__init__()
+        self.main_layout = QVBoxLayout(self)
+        self.blocks = []
+        for _ in range(count):
+            block = QtBlock(280, 80)
+            block.setMinimumWidth(1000)
+            self.main_layout.addWidget(block)
+            self.blocks.append(block)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        margins = self.main_layout.contentsMargins()
+        block_width = max(0, self.contentsRect().width() - margins.left() - margins.right())
+        for block in self.blocks:
+            block.setFixedWidth(block_width)
+
+
+# 幅を steps 回変えて、1回ごとにイベントを処理し終えるまでの時間を測ります。
+def drag(app, frame, steps):
+    samples = []
+    base = frame.width()
+    for step in range(steps):
+        start = time.perf_counter()
+        frame.setFixedWidth(base + (step % 40) * 5)
+        app.processEvents()
+        samples.append(time.perf_counter() - start)
+    # 最後にまとめられた並べ直しを実行し、その時間も含める
+    start = time.perf_counter()
+    shared_clock().flush()
+    app.processEvents()
+    samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p99_ms": samples[int(len(samples) * 0.99) - 1] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=2000)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    result = {"blocks": args.blocks}
+
+    window = FlairApp()
+    window.resize(1200, 800)
+    window.show()
+    window.add_frame()
+    frame = window.selected_frame
+    for _ in range(args.blocks):
+        frame.add_block(window.block_width, window.block_height)
+    window.update_virtualization()
+    app.processEvents()
+    result["current"] = drag(app, frame, args.steps)
+    result["current"]["live_blocks"] = len(frame.live_blocks)
+    window.close()
+
+    if not args.skip_legacy:
+        legacy = LegacyFrame(args.blocks)
+        legacy.resize(400, 800)
+        legacy.show()
+        app.processEvents()
+        result["legacy"] = drag(app, legacy, args.steps)
+        legacy.close()
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""CodeSmith のドキュメントサービスの負荷試験: エンドポイントごとのスループットと p99 レイテンシ。
+
+ローカルで uvicorn を起動し (--url を指定したときはそのサーバーを使う)、合成ドキュメントを
+--concurrency 個のクライアントから --duration 秒ずつ送り続けます。
+同じリクエストを繰り返すので、既定では Cache-Control: no-cache を付けてキャッシュを通さずに計算させます。
+--cached を付けるとキャッシュから返すときの速さを測ります。
+    python benchmarks/bench_service.py --blocks 1000 --concurrency 32 --duration 10
+    python benchmarks/bench_service.py --url http://127.0.0.1:8000 --endpoints validate batch --output result.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent / "CodeSmith_ai_agent"
+KINDS = (None, None, None, "if", "true", None, "false", None, "while", None, "return")
+FRAMES = 10
+BATCH_DOCUMENTS = 50 # batch で1回に送るドキュメントの数
+STARTUP_TIMEOUT = 60.0
+
+
+# save_file と同じ形式の合成ドキュメントを作ります。
+def make_document(blocks):
+    frames = max(1, min(FRAMES, blocks))
+    data = []
+    for f in range(frames):
+        frame = []
+        for b in range(blocks // frames):
+            kind = KINDS[b % len(KINDS)]
+            text = f"x{b} = {f} + {b}" if kind is None else f"x{b} > {f}"
+            frame.append([text] if kind is None else [text, kind])
+        data.append(frame)
+    return data
+
+
+# エンドポイントごとの (パス, 本文, ヘッダー)。
+def make_requests(blocks, cached):
+    data = make_document(blocks)
+    body = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    small = json.dumps(make_document(max(1, blocks // BATCH_DOCUMENTS)), ensure_ascii=False)
+    cache_header = {} if cached else {"cache-control": "no-cache"}
+    json_header = {"content-type": "application/json", **cache_header}
+    return {
+        "validate": ("/documents/validate", body, json_header),
+        "normalize": ("/documents/normalize", body, json_header),
+        "stats": ("/documents/stats", body, json_header),
+        "compile": ("/documents/compile", body, json_header),
+        "batch": ("/batch/validate", ("\n".join([small] * BATCH_DOCUMENTS) + "\n").encode("utf-8"),
+                  {"content-type": "application/x-ndjson", **cache_header}),
+        "assistant": ("/assistant/invoke", json.dumps({"input": {"document": data, "question": "何をする関数ですか"}}).encode("utf-8"),
+                      json_header),
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# uvicorn を起動して、応答するようになるまで待ちます。
+def start_server(port, workers):
+    env = dict(os.environ, FLAIR_ASSISTANT_LLM="fake")
+    if workers:
+        env["FLAIR_SERVICE_WORKERS"] = str(workers)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn が終了しました (終了コード {process.returncode})")
+        try:
+            httpx.get(url + "/docs", timeout=1.0)
+            return process, url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("uvicorn が起動しません")
+
+
+# 1つのエンドポイントに concurrency 個のクライアントから duration 秒送り続けます。
+async def load(url, request, concurrency, duration):
+    path, body, headers = request
+    samples = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0) as client:
+        await client.post(path, content=body, headers=headers) # ワーカープロセスの起動を計測に入れない
+        deadline = time.perf_counter() + duration
+
+        async def client_loop():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, content=body, headers=headers)
+                    await response.aread()
+                    ok = response.is_success
+                except httpx.HTTPError:
+                    ok = False
+                samples.append(time.perf_counter() - start)
+                errors += not ok
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    samples.sort()
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": len(samples) / elapsed,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p99_ms": samples[max(0, int(len(samples) * 0.99) - 1)] * 1000,
+        "request_bytes": len(body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="計測するサーバー (省略するとローカルで uvicorn を起動する)")
+    parser.add_argument("--blocks", type=int, default=1000, help="1つのドキュメントのブロック数")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0, help="エンドポイントごとの秒数")
+    parser.add_argument("--workers", type=int, default=0, help="サーバーのプロセスプールの大きさ (0 なら CPU の数)")
+    parser.add_argument("--endpoints", nargs="+", default=["validate", "normalize", "stats", "compile", "batch", "assistant"])
+    parser.add_argument("--cached", action="store_true", help="キャッシュを通す (既定では no-cache を付けて毎回計算させる)")
+    parser.add_argument("--output", help="結果をJSONで書き出すファイル")
+    args = parser.parse_args()
+
+    requests = make_requests(args.blocks, args.cached)
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(free_port(), args.workers)
+    try:
+        result = {"blocks": args.blocks, "concurrency": args.concurrency, "duration": args.duration, "cached": args.cached, "endpoints": {}}
+        for name in args.endpoints:
+            stats = asyncio.run(load(url, requests[name], args.concurrency, args.duration))
+            result["endpoints"][name] = stats
+            print(f"{name:10} {stats['throughput_rps']:9.1f} req/s  p50 {stats['p50_ms']:8.1f} ms  "
+                  f"p99 {stats['p99_ms']:8.1f} ms  errors {stats['errors']}", flush=True)
+        result["cache"] = httpx.get(url + "/cache/metrics").json()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
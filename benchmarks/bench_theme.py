@@ -0,0 +1,95 @@
+"""スタイルの計測: ウィジェットごとのスタイルシートとアプリ全体のテーマの比較。
+
+legacy は以前のコードと同じく、ブロックごとに setStyleSheet を呼びます。
+theme はアプリ全体のスタイルシートと selected プロパティを使います。
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_theme.py --blocks 10000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "maincode"))
+
+from PySide6.QtWidgets import QApplication, QScrollArea, QWidget
+
+import theme
+from Flair import QtBlock
+
+LEGACY_BLOCK_STYLE = "background-color: #333333; border: 1px solid #4A4A4A; border-radius: 4px;"
+LEGACY_SELECTED_STYLE = "background-color: #333333; border: 2px solid #4A90E2; border-radius: 4px;"
+
+
+# 以前のコードと同じように、ブロックごとにスタイルシートを設定します。
+def create_legacy(parent, count):
+    blocks = []
+    for _ in range(count):
+        block = QtBlock(280, 80, parent)
+        block.setStyleSheet(LEGACY_BLOCK_STYLE)
+        blocks.append(block)
+    return blocks
+
+
+def select_legacy(block, selected):
+    block.setStyleSheet(LEGACY_SELECTED_STYLE if selected else LEGACY_BLOCK_STYLE)
+
+
+def create_theme(parent, count):
+    return [QtBlock(280, 80, parent) for _ in range(count)]
+
+
+def select_theme(block, selected):
+    theme.set_state(block, "selected", selected)
+
+
+def measure(app, create, select, count, toggles):
+    # メインバーと同じ構造 (role="mainbar" のスクロールエリア) の中に作る
+    scroll_area = QScrollArea()
+    scroll_area.setProperty("role", "mainbar")
+    content = QWidget()
+    scroll_area.setWidget(content)
+    scroll_area.show()
+    app.processEvents()
+
+    start = time.perf_counter()
+    blocks = create(content, count)
+    for block in blocks:
+        block.ensurePolished()
+    created = time.perf_counter()
+
+    for i in range(toggles):
+        block = blocks[i % len(blocks)]
+        select(block, True)
+        select(block, False)
+    toggled = time.perf_counter()
+
+    scroll_area.deleteLater()
+    app.processEvents()
+    return {
+        "create_ms": (created - start) * 1000,
+        "create_per_block_us": (created - start) / count * 1e6,
+        "toggle_per_change_us": (toggled - created) / (toggles * 2) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=10000)
+    parser.add_argument("--toggles", type=int, default=1000)
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    result = {"blocks": args.blocks}
+    # 以前のコードにはアプリ全体のスタイルシートがなかった
+    app.setStyleSheet("")
+    result["legacy"] = measure(app, create_legacy, select_legacy, args.blocks, args.toggles)
+    theme.apply(app)
+    result["theme"] = measure(app, create_theme, select_theme, args.blocks, args.toggles)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""Flair のGUIの主な処理をまとめて計測するベンチマーク。
+
+100〜100k ブロックの合成ドキュメント (save_file と同じJSONの形) で、次の処理の時間と最大RSSを測ります。
+    open_file / save_file (ダイアログは使わずにファイル名を返す)、開いたときのコードの色付け、タブの切り替え、add_block、select_block、
+    フレームとブロックの移動、QtFrame.resizeEvent、paintEvent、メインバーの eventFilter
+アプリを起動したときと同じく、自動保存 (ジャーナル) を有効にして測ります。
+大きさごとに別のプロセスで実行するので、最大RSSはその大きさの分だけになります。
+基準との比較では、時間は --tolerance の割合と NOISE_FLOOR の差の両方を超えたときだけ、
+メモリは MEMORY_TOLERANCE と MEMORY_FLOOR_KB を超えたときだけ劣化とし、数 (highlighted_blocks など) は比べません。
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/suite.py --output result.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json    # 基準より遅くなった項目があれば終了コード 1
+    python benchmarks/suite.py --save-baseline benchmarks/baseline.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "maincode"))
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+FRAMES = 10 # 合成ドキュメントのフレーム数 (ブロックはフレームに均等に分ける)
+REPEAT = 50 # 1回が短い処理を繰り返す回数
+FILE_REPEAT = 5 # ファイルを開く回数 (1回目は色付けの計測にも使う)
+SAVE_REPEAT = 15 # ファイルに保存する回数
+DEFAULT_TOLERANCE = 0.25 # 基準よりこの割合を超えて遅い項目を劣化とみなす
+NOISE_FLOOR = {"_ms": 0.5, "_us": 0.5} # 単位ごとの、これより小さい差は揺らぎとして無視する
+MEMORY_TOLERANCE = 0.10 # 最大RSSは、基準よりこの割合を超えて大きければ劣化
+MEMORY_FLOOR_KB = 8192 # 最大RSSの、これより小さい差は無視する
+KINDS = (None, None, None, "if", "true", None, "false", None, "while", None, "return")
+
+
+# save_file と同じ形式の合成ドキュメントを書き出します。
+def write_document(path, blocks):
+    frames = min(FRAMES, blocks)
+    per_frame = blocks // frames
+    data = []
+    for f in range(frames):
+        frame = []
+        for b in range(per_frame):
+            kind = KINDS[b % len(KINDS)]
+            text = f"frame {f} block {b}\nx = {b}"
+            frame.append([text] if kind is None else [text, kind])
+        data.append(frame)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+# ファイルダイアログを開かずに、指定したファイル名を返すようにします。
+@contextlib.contextmanager
+def bypass_dialogs(path):
+    from PySide6.QtWidgets import QFileDialog
+    original = QFileDialog.getOpenFileName, QFileDialog.getSaveFileName
+    QFileDialog.getOpenFileName = staticmethod(lambda *args, **kwargs: (path, ""))
+    QFileDialog.getSaveFileName = staticmethod(lambda *args, **kwargs: (path, ""))
+    try:
+        yield
+    finally:
+        QFileDialog.getOpenFileName, QFileDialog.getSaveFileName = original
+
+
+# fn を repeat 回呼び、1回あたりの時間 (ms) の中央値を返します。
+def time_calls(fn, repeat=REPEAT):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def peak_rss_kb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+# 子プロセス: blocks ブロックのドキュメントで全項目を計測し、JSONで出力します。
+def run_size(blocks):
+    from PySide6.QtCore import QEvent, QPointF, Qt
+    from PySide6.QtGui import QKeyEvent, QMouseEvent
+    from PySide6.QtWidgets import QApplication
+
+    from Flair import FlairApp
+    from frame_clock import shared_clock
+    from highlighter import shared_highlights
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    recovery_dir = tempfile.mkdtemp()
+    window = FlairApp(recovery_dir=recovery_dir)
+    window.resize(1200, 800)
+    window.show()
+    app.processEvents()
+
+    def settle():
+        shared_clock().flush()
+        app.processEvents()
+
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.json")
+        write_document(path, blocks)
+
+        # --- open_file: 読み込みが終わって、見えているブロックができるまで ---
+        highlights = shared_highlights()
+        tokenized = highlights.cache.tokenized
+        with bypass_dialogs(path):
+            start = time.perf_counter()
+            window.open_file()
+            while window.loader.is_running():
+                app.processEvents()
+            settle()
+            open_samples = [time.perf_counter() - start]
+
+            # --- highlight: 開いてから、見えているコードのブロックに色が付くまで (残りのブロックは解析しない) ---
+            highlights.cache.wait_idle()
+            settle()
+            result["highlight_ms"] = (time.perf_counter() - start - open_samples[0]) * 1000
+            result["highlighted_blocks"] = highlights.cache.tokenized - tokenized
+
+            # 1回だけでは揺らぎが大きいので、同じタブに開き直して中央値を取る
+            for _ in range(FILE_REPEAT - 1):
+                start = time.perf_counter()
+                window.load_file(path)
+                while window.loader.is_running():
+                    app.processEvents()
+                settle()
+                open_samples.append(time.perf_counter() - start)
+                highlights.cache.wait_idle()
+            result["open_file_ms"] = statistics.median(open_samples) * 1000
+
+            # --- switch_tab: 同じ大きさの2つ目のタブとの切り替え (見えているブロックができるまで) ---
+            window.open_file() # 今のタブにはドキュメントがあるので、新しいタブに開かれる
+            while window.loader.is_running():
+                app.processEvents()
+            settle()
+
+        def switch(i):
+            window.switch_tab(i % 2)
+            settle()
+        result["switch_tab_ms"] = time_calls(switch, REPEAT // 5)
+
+        frame = window.frames[0]
+        window.select_frame(frame)
+        settle()
+
+        # --- select_block / ブロックとフレームの移動 ---
+        visible = sorted(frame.live_blocks)
+        result["select_block_ms"] = time_calls(lambda i: window.select_block(frame, visible[i % len(visible)]))
+        window.select_block(frame, 0)
+        result["block_navigation_ms"] = time_calls(lambda i: window.selected_block_down() if i % 2 == 0 else window.selected_block_up())
+        result["frame_navigation_ms"] = time_calls(lambda i: window.select_frame_right() if i % 2 == 0 else window.select_frame_left())
+        window.select_frame(frame)
+
+        # --- QtFrame.resizeEvent: 幅を変えて、並べ直しまで終わるまで ---
+        base_width = frame.width()
+
+        def resize(i):
+            frame.setFixedWidth(base_width + (i % 10 + 1) * 10)
+            settle()
+        result["resize_ms"] = time_calls(resize, REPEAT // 2)
+
+        # --- paintEvent: フレームの再描画 (接続線と見えているブロック) ---
+        result["paint_ms"] = time_calls(lambda i: frame.repaint(), REPEAT // 2)
+
+        # --- eventFilter: メインバーのフィルターを1回通る時間 (µs) ---
+        window.focus_block(frame, visible[0]) # クリックやキーはブロックに重ねた共有のエディターが受け取る
+        target = window.block_editor.viewport()
+        events = [
+            QMouseEvent(QEvent.Type.MouseMove, QPointF(5, 5), QPointF(5, 5), Qt.MouseButton.NoButton, Qt.MouseButton.NoButton, Qt.KeyboardModifier.NoModifier),
+            QKeyEvent(QEvent.Type.KeyPress, Qt.Key.Key_A, Qt.KeyboardModifier.NoModifier, "a"),
+            QKeyEvent(QEvent.Type.KeyRelease, Qt.Key.Key_A, Qt.KeyboardModifier.NoModifier, "a"),
+        ]
+        result["event_filter_us"] = time_calls(lambda i: window.eventFilter(target, events[i % len(events)]), REPEAT * 20) * 1000
+
+        # --- add_block: 選択中のフレームの末尾に追加 ---
+        result["add_block_ms"] = time_calls(lambda i: window.add_block_to_selected_frame())
+        settle()
+
+        # --- save_file ---
+        save_path = os.path.join(tmp, "saved.json")
+        with bypass_dialogs(save_path):
+            result["save_file_ms"] = time_calls(lambda i: window.save_file(), SAVE_REPEAT)
+
+    result["peak_rss_kb"] = peak_rss_kb()
+    window.close()
+    shutil.rmtree(recovery_dir, ignore_errors=True)
+    return result
+
+
+def run_child(blocks):
+    output = subprocess.run([sys.executable, __file__, "--child", str(blocks)], check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+# 項目の (割合の許容, 差の許容) を返します。比べない項目 (数) は None。
+def metric_tolerance(name, tolerance):
+    if name.endswith("_kb"):
+        return MEMORY_TOLERANCE, MEMORY_FLOOR_KB
+    for suffix, floor in NOISE_FLOOR.items():
+        if name.endswith(suffix):
+            return tolerance, floor
+    return None
+
+
+# 基準と比べて、割合と差の両方の許容を超えて大きくなった項目を (大きさ, 項目, 基準, 今回) の並びで返します。
+def find_regressions(result, baseline, tolerance):
+    regressions = []
+    for size, metrics in result["sizes"].items():
+        base_metrics = baseline.get("sizes", {}).get(size, {})
+        for name, value in metrics.items():
+            base = base_metrics.get(name)
+            limits = metric_tolerance(name, tolerance)
+            if base is None or limits is None:
+                continue
+            ratio, floor = limits
+            if value > base * (1 + ratio) and value - base > floor:
+                regressions.append((size, name, base, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--output", help="結果のJSONを書き出すファイル (省略すると標準出力)")
+    parser.add_argument("--baseline", help="比べる基準の結果 (JSON)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="時間の項目を劣化とみなす、基準からの割合")
+    parser.add_argument("--save-baseline", help="今回の結果を基準として書き出すファイル")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_size(args.child)))
+        return
+
+    result = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": {str(blocks): run_child(blocks) for blocks in args.sizes},
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(text + "\n", encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = find_regressions(result, baseline, args.tolerance)
+        for size, name, base, value in regressions:
+            print(f"劣化: {size} ブロック {name}: {base:.3f} -> {value:.3f}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"基準 ({args.baseline}) からの劣化はありません", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
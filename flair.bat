@@ -0,0 +1,2 @@
+@echo off
+"%~dp0\.venv\Scripts\python.exe" "%~dp0\maincode\flair_cli.py" %*
@@ -1,38 +1,207 @@
 import sys
-import json
-import os
 from pathlib import Path
-from PySide6.QtCore import Qt, QSize, Signal, QRect, QTimer, QEvent, QObject
+from PySide6.QtCore import Qt, QSize, Signal, QPoint, QRect, QTimer, QEvent
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QHBoxLayout, QVBoxLayout, QFrame, 
-    QLabel, QSplitter, QScrollArea, QPushButton, QToolButton, QTextEdit, QFileDialog,
-    QScrollBar, QSizePolicy
+    QLabel, QSplitter, QScrollArea, QPushButton, QToolButton, QFileDialog,
+    QProgressDialog, QMessageBox, QLayout, QWidgetItem, QTabBar
 )
-from PySide6.QtGui import QPalette, QColor, QIcon, QPainter, QPen
+from PySide6.QtGui import QKeySequence, QShortcut, QTextCursor, QPalette, QIcon, QPainter, QStaticText
+
+from document import Document
+from loader import DocumentLoader
+from selection import SelectionModel
+import theme
+from connectors import ConnectorCache
+from flow import BLOCK_KINDS
+from frame_clock import shared_clock
+from resize_engine import FrameResizeEngine
+from journal import Journal, default_recovery_dir, discard_recovery, frame_snapshot, new_journal_dir, read_recovery, recovery_dirs
+from history import History, AddBlock, AddFrame, EditGroup, EditText, LoadDocument, ResizeFrames
+from hit_test import HitTestIndex
+from search import SearchIndex
+from search_panel import SearchPanel
+from codegen import CodeGenerator
+from export import ExportJob
+from code_panel import CodePanel
+from run_panel import RunPanel
+from block_editor import BlockEditor
+from highlighter import rich_text, shared_highlights
+from merge import has_conflict
+from syntax import CODE_KINDS
+from tabs import DocumentTab
+from widget_pool import WidgetPool
+import profiler
 
 # --- カスタムウィジェット ---
+QWIDGETSIZE_MAX = (1 << 24) - 1 # ウィジェットの最大サイズの既定値 (幅の固定を解除するときに使う)
+RUN_NOTE_LENGTH = 500 # ブロックのツールチップに残す実行時の出力の文字数
+HEAT_LEVELS = (("3", 0.5), ("2", 0.15), ("1", 0.02)) # ホットスポットの段階と、最も長いブロックに対する時間の割合の下限
+EDITOR_MARGIN = 9 # ブロックの枠からエディターまでの余白 (以前のブロックの中の QVBoxLayout の余白と同じ)
+TEXT_MARGIN = 4 # エディターの枠からテキストまでの余白 (QTextDocument の既定の余白と同じ)
+LINE_SEPARATOR = "\u2028" # QStaticText は "\n" では改行しないので、行の区切りに置き換える
+
 class QtBlock(QFrame):
+    """ブロック1つの表示。
+
+    ブロックごとにQTextEditを持たず、テキストはキャッシュした QStaticText で折り返して描きます。
+    コードを持つ種類のブロックは、highlighter で解析したトークンに色を付けて描きます。
+    編集するときは共有のエディター (block_editor.BlockEditor) がこのブロックの上に重なります。
+    マージで解決されていない衝突の印 (merge.py) のあるブロックは、枠と背景の色を変えて強調します。
+    """
     # QtBlockウィジェットを初期化します。
     def __init__(self, width, height, parent=None):
         super().__init__(parent)
-        self.setStyleSheet("background-color: #333333; border: 1px solid #4A4A4A; border-radius: 4px;")
-        self.setMinimumWidth(1000)
         # self.setFixedSize(width, height) # ブロックのサイズを固定 (コメントアウト)
         self.setFixedHeight(height) # ブロックの高さを固定し、幅はレイアウトに任せる
-        
-        layout = QVBoxLayout(self)
-        self.text_edit = QTextEdit()
-        self.text_edit.setStyleSheet("border: none;")
-        layout.addWidget(self.text_edit)
+        self.text = ""
+        self.kind = None
+        self.preview = None # 描くテキストのキャッシュ (QStaticText)。テキストか幅が変わったら作り直す
+        self.editor = None # 重なっている共有のエディター (編集していないときは None)
+
+        # 仮想化のためウィジェットは使い回されるので、今どのブロックを表示しているかを保持する
+        self.frame = None
+        self.index = -1
+
+    # 表示するテキストを設定します。マージの衝突の印があれば強調します。
+    def set_text(self, text):
+        if text == self.text:
+            return
+        self.text = text
+        self.preview = None
+        theme.set_state(self, "conflict", "true" if has_conflict(text) else "")
+        self.update()
+
+    # ブロックの種類を設定します (色付けするかどうかが変わる)。
+    def set_kind(self, kind):
+        if kind == self.kind:
+            return
+        self.kind = kind
+        self.preview = None
+        self.update()
+
+    # テキストの色付けが終わったときに、描くテキストを作り直します。
+    def refresh_preview(self):
+        self.preview = None
+        self.update()
+
+    # エディターを重ねる位置 (ブロックの座標) を返します。
+    def editor_rect(self):
+        return self.contentsRect().adjusted(EDITOR_MARGIN, EDITOR_MARGIN, -EDITOR_MARGIN, -EDITOR_MARGIN)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.editor is not None:
+            self.editor.follow_block()
+
+    def moveEvent(self, event):
+        super().moveEvent(event)
+        if self.editor is not None:
+            self.editor.follow_block()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.editor is not None or not self.text:
+            return # 編集中はエディターがテキストを描く
+        rect = self.editor_rect().adjusted(TEXT_MARGIN, TEXT_MARGIN, -TEXT_MARGIN, -TEXT_MARGIN)
+        if self.preview is None or self.preview.textWidth() != rect.width():
+            self.preview = self.create_preview()
+            self.preview.setTextWidth(rect.width())
+        painter = QPainter(self)
+        if self.preview.size().height() > rect.height():
+            painter.setClipRect(rect) # 入りきらない行は、編集するときにエディターで見る (切り取りは遅いので、はみ出すときだけ)
+        painter.setPen(self.palette().color(QPalette.ColorRole.Text))
+        painter.drawStaticText(rect.topLeft(), self.preview)
+
+    # 描くテキストを作ります。色付けがまだ終わっていなければ、色なしで描いて終わったら作り直す
+    def create_preview(self):
+        lines = shared_highlights().tokens(self) if self.kind in CODE_KINDS else None
+        if lines is None or not any(lines):
+            preview = QStaticText(self.text.replace("\n", LINE_SEPARATOR))
+            preview.setTextFormat(Qt.TextFormat.PlainText)
+        else:
+            preview = QStaticText(rich_text(self.text, lines))
+            preview.setTextFormat(Qt.TextFormat.RichText)
+        return preview
+
+class BlockColumnLayout(QLayout):
+    """ブロックを番号から計算した位置に縦に並べるレイアウト。
+
+    見えているブロックのウィジェットだけを持ち、幅はブロック領域の幅に合わせます。
+    領域のサイズが変わったときの並べ直しは、表示フレームごとに1回にまとめます。
+    """
+    def __init__(self, frame, parent=None):
+        super().__init__(parent)
+        self.frame = frame
+        self.items = [] # (ブロック番号, QWidgetItem)
+
+    # ブロックのウィジェットを番号の位置に追加します。
+    def add_block(self, index, block):
+        # 使い回すウィジェットは最初から領域の子なので、addChildWidget (古い親のレイアウトを探して外す) は初回だけにする
+        if not block.testAttribute(Qt.WidgetAttribute.WA_LaidOut):
+            self.addChildWidget(block)
+        item = QWidgetItem(block)
+        self.items.append((index, item))
+        self.place(index, item, self.parentWidget().rect())
+
+    # ブロックのウィジェットをレイアウトから外します。
+    def remove_block(self, block):
+        for position, (index, item) in enumerate(self.items):
+            if item.widget() is block:
+                del self.items[position]
+                return
+
+    def addItem(self, item):
+        self.items.append((len(self.items), item))
+
+    def count(self):
+        return len(self.items)
+
+    def itemAt(self, position):
+        if 0 <= position < len(self.items):
+            return self.items[position][1]
+        return None
+
+    def takeAt(self, position):
+        if 0 <= position < len(self.items):
+            return self.items.pop(position)[1]
+        return None
+
+    # ブロック領域の大きさはフレームが決めるので、レイアウトからは要求しない
+    def sizeHint(self):
+        return QSize(0, 0)
+
+    def minimumSize(self):
+        return QSize(0, 0)
+
+    def setGeometry(self, rect):
+        super().setGeometry(rect)
+        shared_clock().request(self, self.apply_geometry)
+
+    # 持っているブロックを現在の幅に合わせて並べ直します。
+    def apply_geometry(self):
+        rect = self.parentWidget().rect()
+        for index, item in self.items:
+            self.place(index, item, rect)
+
+    def place(self, index, item, rect):
+        item.setGeometry(QRect(rect.x(), rect.y() + index * self.frame.block_pitch(), rect.width(), self.frame.block_height))
 
 class QtFrame(QFrame):
+    geometry_changed = Signal() # 移動やサイズ変更で、見えるブロックが変わるかもしれないとき
+    block_text_edited = Signal(int, str, str) # ブロック番号, 前のテキスト, 新しいテキスト
     # QtFrameウィジェットを初期化します。
-    def __init__(self, number, scroll_area, parent=None):
+    def __init__(self, number, scroll_area, model, resize_engine=None, parent=None):
         super().__init__(parent)
         self.scroll_area = scroll_area
         self.number = number
-        self.blocks = []
-        self.setStyleSheet("background-color: #2C2C2C; border: 1px solid #4A4A4A; border-radius: 5px;")
+        self.model = model # このフレームのデータ (document.Frame)。ウィジェットの有無に関係なく全ブロックを持つ
+        self.live_blocks = {} # ブロック番号 -> QtBlock (ビューポート付近のブロックだけ)
+        self.spare_blocks = [] # 画面外に出て再利用を待っているQtBlock
+        self.block_height = 80
+        self.selected_indexes = set() # 選択されているブロック番号 (SelectionModelから更新される)
+        self.block_heat = {} # ブロック番号 -> 実行したときのホットスポットの段階 ("1"〜"3")
+        self.block_notes = {} # ブロック番号 -> 実行したときの回数・時間・出力 (ツールチップ)
         self.setMinimumWidth(300) # 最低のフレームの横幅を決める
 
         self.main_layout = QVBoxLayout(self)
@@ -40,159 +209,283 @@ class QtFrame(QFrame):
         self.main_layout.setSpacing(10) # フレームの要素と要素の間の空白を決める
         self.main_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
 
-        title_label = QLabel(f"Frame {self.number}")
-        title_label.setStyleSheet("color: #AAAAAA; padding: 5px;")
-        title_label.setMinimumHeight(30) # 最低のラベルの横幅を決める
+        self.title_label = QLabel(f"Frame {self.number}")
+        self.title_label.setMinimumHeight(30) # 最低のラベルの横幅を決める
 
         title_layout = QHBoxLayout()
         title_layout.setContentsMargins(0, 0, 0, 0)
-        title_layout.addWidget(title_label)
+        title_layout.addWidget(self.title_label)
         title_layout.addStretch()
 
         self.main_layout.addLayout(title_layout)
+
         self.main_layout.addStretch(1) # 余白を吸収するストレッチを追加
+        self.connectors = ConnectorCache()
+
+        # ブロックはレイアウトに入れず、この領域の中に番号から計算した位置で配置する
+        # (レイアウトが扱える高さには上限があり、数万ブロックの縦幅を収められないため)
+        self.block_area = QWidget(self)
+        self.block_area.setProperty("role", "block-area") # 背景を描かず、後ろの接続線を見せる
+        self.block_layout = BlockColumnLayout(self, self.block_area) # ブロックの幅はこのレイアウトが領域の幅に合わせる
 
-        self.is_resizing = False
-        self.resizing_edge = None
+        self.resize_engine = resize_engine # ドラッグによるリサイズと自動スクロール (FrameResizeEngine)
         self.resize_edge_width = 5
-        self.prev_sibling_widget = None # 前のフレームを格納するため
         self.setMouseTracking(True)
-
-        self.resize_timer = QTimer(self)
-        self.resize_timer.timeout.connect(self.auto_resize_step)
-        self.auto_resize_direction = None
+        if self.model.width is not None:
+            self.apply_model_width()
 
     # フレームに新しいブロックを追加します。
-    def add_block(self, width, height):
-        block = QtBlock(width, height)
-        # ストレッチ(常に最後の要素)の前にブロックを挿入する
-        insert_index = self.main_layout.count() - 1
-        self.main_layout.insertWidget(insert_index, block, 0, Qt.AlignmentFlag.AlignTop)
-        self.blocks.append(block) # リストの末尾に追加
-        
-        # 追加したブロックの幅も即座に更新する
-        margins = self.main_layout.contentsMargins()
-        block_width = self.contentsRect().width() - margins.left() - margins.right()
-        if block_width < 0:
-            block_width = 0
-        block.setFixedWidth(block_width)
-        
+    def add_block(self, width, height, text="", kind=None):
+        self.block_height = height
+        index = self.model.append_block(text, kind) # リストの末尾に追加
+        self.connectors.invalidate_edges()
+        self.update_block_area_height()
         self.update() # フレームを再描画して線を追加
+        return index
+
+    # モデルのブロック数に合わせて表示を作り直します。ウィジェットは表示範囲の分だけ後で作られます。
+    # 高さが変わらなければ、今あるウィジェットはそのままモデルのテキストを入れ直す (隠して出し直すより速い)
+    def reload_blocks(self, height):
+        for index, block in list(self.live_blocks.items()):
+            if height == self.block_height and index < len(self.model):
+                self.bind_block(block, index)
+            else:
+                self.release_block(index)
+        self.block_height = height
+        self.connectors.invalidate_edges()
+        self.update_block_area_height()
+        self.update()
+
+    # ブロックの間隔を含めた1行分の高さを返します。
+    def block_pitch(self):
+        return self.block_height + self.main_layout.spacing()
+
+    # タイトルの下、ブロック領域が始まる位置を返します。
+    def block_area_top(self):
+        title_height = max(self.title_label.minimumHeight(), self.title_label.sizeHint().height())
+        return self.main_layout.contentsMargins().top() + title_height + self.main_layout.spacing()
+
+    # ブロック領域の高さをブロック数に合わせ、フレームの高さもそれに合わせます。
+    def update_block_area_height(self):
+        area_height = 0
+        if len(self.model):
+            area_height = len(self.model) * self.block_pitch() - self.main_layout.spacing()
+        self.setMinimumHeight(self.block_area_top() + area_height + self.main_layout.contentsMargins().bottom())
+        self.place_block_area(area_height)
+
+    # ブロック領域をタイトルの下に配置します。
+    def place_block_area(self, area_height=None):
+        if area_height is None:
+            area_height = self.block_area.height()
+        margins = self.main_layout.contentsMargins()
+        area_width = max(0, self.contentsRect().width() - margins.left() - margins.right())
+        self.block_area.setGeometry(margins.left(), self.block_area_top(), area_width, area_height)
+
+    # ブロック領域内でのブロックの位置を返します。
+    def block_rect(self, index):
+        return QRect(0, index * self.block_pitch(), self.block_area.width(), self.block_height)
+
+    # フレームの座標の点にあるブロックの番号を返します。ブロックの外やブロックの間の余白なら None。
+    def block_at(self, pos):
+        area = self.block_area.geometry()
+        if not area.contains(pos):
+            return None
+        y = pos.y() - area.top()
+        pitch = self.block_pitch()
+        index = y // pitch
+        if index >= len(self.model) or y - index * pitch >= self.block_height:
+            return None
+        return index
+
+    # ブロック領域の座標で、指定した縦の範囲に入るブロック番号の範囲を返します。
+    def block_range(self, top, bottom):
+        if not len(self.model) or bottom < 0:
+            return range(0)
+        pitch = self.block_pitch()
+        first = max(0, top // pitch)
+        last = min(len(self.model) - 1, bottom // pitch)
+        return range(first, last + 1)
+
+    # 見えている範囲 (ブロック領域の座標) のブロックだけをウィジェットにします。
+    def update_visible_blocks(self, visible_rect):
+        if visible_rect is None or not visible_rect.intersects(self.block_area.rect()):
+            wanted = range(0)
+        else:
+            wanted = self.block_range(visible_rect.top(), visible_rect.bottom())
+
+        for index, block in list(self.live_blocks.items()):
+            # 編集中のブロックは画面外でも残す (隠すとフォーカスが移ってスクロールが戻されるため)
+            if index not in wanted and block.editor is None:
+                self.release_block(index)
+        for index in wanted:
+            if index not in self.live_blocks:
+                self.materialize_block(index)
+
+    # 指定した番号のブロックのウィジェットを用意して返します。
+    def materialize_block(self, index):
+        block = self.live_blocks.get(index)
+        if block is not None:
+            return block
+
+        if self.spare_blocks:
+            block = self.spare_blocks.pop()
+        else:
+            block = QtBlock(self.block_area.width(), self.block_height, self.block_area)
+            block.frame = self
 
+        self.block_layout.add_block(index, block)
+        self.bind_block(block, index)
+        block.show()
+        self.live_blocks[index] = block
         return block
 
-    def paintEvent(self, event):
-        super().paintEvent(event)
-        if len(self.blocks) < 2:
+    # ブロックのウィジェットに、その番号のモデルのテキストと状態を入れます。
+    def bind_block(self, block, index):
+        if block.editor is not None:
+            block.editor.detach() # 別のブロックになるので、編集は終える
+        block.set_text(self.model.text(index))
+        block.set_kind(self.model.blocks[index].kind)
+        block.index = index
+        theme.set_state(block, "selected", index in self.selected_indexes)
+        theme.set_state(block, "kind", self.model.blocks[index].kind or "")
+        theme.set_state(block, "heat", self.block_heat.get(index, ""))
+        block.setToolTip(self.block_notes.get(index, ""))
+
+    # 実行の結果 (ホットスポットの段階とツールチップ) をブロックに設定します。None なら消します。
+    def set_block_run_info(self, index, heat, note):
+        for values, value in ((self.block_heat, heat), (self.block_notes, note)):
+            if value:
+                values[index] = value
+            else:
+                values.pop(index, None)
+        block = self.live_blocks.get(index)
+        if block is not None:
+            theme.set_state(block, "heat", heat or "")
+            block.setToolTip(note or "")
+
+    def clear_run_info(self):
+        for index in set(self.block_heat) | set(self.block_notes):
+            self.set_block_run_info(index, None, None)
+
+    # ブロックのウィジェットを外して再利用に回します。テキストはモデルに残ります。
+    def release_block(self, index):
+        block = self.live_blocks.pop(index)
+        if block.editor is not None:
+            block.editor.detach()
+        self.block_layout.remove_block(block)
+        block.hide()
+        block.index = -1
+        self.spare_blocks.append(block)
+
+    # 共有のエディターで編集されたテキストをモデルに書き戻します。
+    def on_block_text_changed(self, block, text):
+        if block.index < 0:
             return
+        block.set_text(text)
+        old_text = self.model.text(block.index)
+        if text == old_text:
+            return # 書式だけの変更など
+        self.model.set_text(block.index, text)
+        self.block_text_edited.emit(block.index, old_text, text)
+
+    # モデルで変わったブロックのテキストを表示に反映します。cursor を指定するとカーソルをそこへ移します。
+    def refresh_block_text(self, index, cursor=None):
+        block = self.live_blocks.get(index)
+        if block is None:
+            return # 表示されるときにモデルから読まれる
+        block.set_text(self.model.text(index))
+        if block.editor is not None:
+            block.editor.load_text(block.text, cursor) # 表示を合わせるだけなので、変更として書き戻さない
+
+    # 末尾のブロックを取り除き、そのデータ (document.Block) を返します。
+    def remove_last_block(self):
+        index = len(self.model) - 1
+        if index in self.live_blocks:
+            self.release_block(index)
+        block = self.model.pop_block()
+        self.connectors.invalidate_edges()
+        self.update_block_area_height()
+        self.update()
+        return block
 
-        painter = QPainter(self)
-        pen = QPen(QColor("#555555"))
-        pen.setWidth(2)
-        painter.setPen(pen)
-
-        for i in range(len(self.blocks) - 1):
-            start_block = self.blocks[i]
-            end_block = self.blocks[i+1]
-
-            # 開始点: start_blockの下部中央
-            start_pos = start_block.geometry().bottomLeft()
-            start_pos.setX(start_pos.x() + start_block.width() / 2)
-
-            # 終了点: end_blockの上部中央
-            end_pos = end_block.geometry().topLeft()
-            end_pos.setX(end_pos.x() + end_block.width() / 2)
+    # 取り除いたブロックを末尾に戻し、その番号を返します。
+    def restore_block(self, block):
+        index = self.model.push_block(block)
+        self.connectors.invalidate_edges()
+        self.update_block_area_height()
+        self.update()
+        return index
+
+    # モデルの幅をフレームに反映します。幅がなければ既定の幅 (レイアウトに任せる) に戻します。
+    def apply_model_width(self):
+        if self.model.width is None:
+            self.setMinimumWidth(300)
+            self.setMaximumWidth(QWIDGETSIZE_MAX)
+        else:
+            self.setFixedWidth(self.model.width)
+
+    # 別のフレームのデータに結び付け直します (widget_pool から使い回すとき)。ブロックは reload_blocks で入れ直します。
+    def rebind(self, number, model):
+        if number != self.number:
+            self.number = number
+            self.title_label.setText(f"Frame {self.number}") # タイトルの大きさを測り直すことになるので、同じ番号なら変えない
+        self.model = model
+        self.apply_model_width()
+        self.connectors.invalidate_edges()
+
+    # データとの結び付きを外します (widget_pool に返すとき)。
+    # 見えていたブロックのウィジェットはフレームごと隠れるので、そのまま残して次のデータで使う
+    def unbind(self):
+        for block in self.live_blocks.values():
+            if block.editor is not None:
+                block.editor.detach() # エディターはブロック領域の子なので、フレームと一緒に消されないように外す
+        self.selected_indexes.clear()
+        self.block_heat.clear()
+        self.block_notes.clear()
+        self.model = None # 隠れている間は描かれないので、前のドキュメントを持ち続けないようにする
+
+    # 再利用を待っているブロックのウィジェットを limit 個まで減らし、消した数を返します。
+    def trim_spare_blocks(self, limit):
+        excess = self.spare_blocks[limit:]
+        del self.spare_blocks[limit:]
+        for block in excess:
+            block.deleteLater()
+        return len(excess)
 
-            painter.drawLine(start_pos, end_pos)
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        # 接続線はモデルから求めてキャッシュしてあり、再描画が必要な範囲の分だけ描く
+        painter = QPainter(self)
+        self.connectors.paint(painter, self, event.rect())
 
     def resizeEvent(self, event):
         """フレームのリサイズ時に呼び出されるイベントハンドラ"""
         super().resizeEvent(event)
-        # フレームの左右のマージン (10px * 2) を考慮
-        margins = self.main_layout.contentsMargins()
-        block_width = self.contentsRect().width() - margins.left() - margins.right()
-        
-        if block_width < 0:
-            block_width = 0
-
-        for block in self.blocks:
-            block.setFixedWidth(block_width)
-
-    def auto_resize_step(self):
-        if not self.is_resizing or self.auto_resize_direction is None:
-            return
-
-        scroll_step = 10
-        current_width = self.width()
-        
-        if self.auto_resize_direction == 'right':
-            self.setFixedWidth(current_width + scroll_step)
-            current_scroll_value = self.scroll_area.horizontalScrollBar().value()
-            self.scroll_area.horizontalScrollBar().setValue(current_scroll_value + scroll_step)
-        
-        elif self.auto_resize_direction == 'left':
-            if self.prev_sibling_widget:
-                prev_width = self.prev_sibling_widget.width()
-                if prev_width > scroll_step and current_width > -scroll_step:
-                    self.prev_sibling_widget.setFixedWidth(prev_width - scroll_step)
-                    self.setFixedWidth(current_width + scroll_step)
-                    current_scroll_value = self.scroll_area.horizontalScrollBar().value()
-                    self.scroll_area.horizontalScrollBar().setValue(current_scroll_value - scroll_step)
+        self.place_block_area()
+        # ブロックの幅はブロック領域のレイアウトが合わせるので、ここでは個別に設定しない
+        self.geometry_changed.emit()
 
+    def moveEvent(self, event):
+        super().moveEvent(event)
+        self.geometry_changed.emit()
 
     def mousePressEvent(self, event):
         edge = self.get_resize_edge(event.position().toPoint())
-        if event.button() == Qt.LeftButton and edge:
-            self.is_resizing = True
-            self.resizing_edge = edge
-            self.resize_start_pos = event.globalPosition().toPoint()
-            self.original_width = self.width() # 自身の元の幅を格納
-
-            if self.resizing_edge == 'left':
+        if event.button() == Qt.LeftButton and edge and self.resize_engine:
+            prev_sibling_widget = None
+            if edge == 'left':
                 # レイアウト内の前のウィジェットを見つける
                 parent_layout = self.parentWidget().layout()
                 my_index = parent_layout.indexOf(self)
                 if my_index > 0:
-                    self.prev_sibling_widget = parent_layout.itemAt(my_index - 1).widget()
-                    self.original_prev_sibling_width = self.prev_sibling_widget.width()
-                else:
-                    self.prev_sibling_widget = None
+                    prev_sibling_widget = parent_layout.itemAt(my_index - 1).widget()
+            self.resize_engine.begin(self, edge, event.globalPosition().toPoint().x(), prev_sibling_widget)
         super().mousePressEvent(event)
     
     def mouseMoveEvent(self, event):
-        if self.is_resizing:
-            viewport = self.scroll_area.viewport()
-            viewport_rect = QRect(viewport.mapToGlobal(viewport.rect().topLeft()), viewport.mapToGlobal(viewport.rect().bottomRight()))
-            cursor_pos_x = event.globalPosition().x()
-
-            edge_zone_width = 40 # 自動リサイズ用の境界領域を定義する
-
-            if cursor_pos_x > viewport_rect.right() - edge_zone_width:
-                self.auto_resize_direction = 'right'
-                if not self.resize_timer.isActive():
-                    self.resize_timer.start(50)
-            elif cursor_pos_x < viewport_rect.left() + edge_zone_width:
-                self.auto_resize_direction = 'left'
-                if not self.resize_timer.isActive():
-                    self.resize_timer.start(50)
-            else:
-                if self.resize_timer.isActive():
-                    self.resize_timer.stop()
-                self.auto_resize_direction = None
-
-                # Manual resize logic
-                delta = event.globalPosition().toPoint() - self.resize_start_pos
-                if self.resizing_edge == 'right':
-                    new_width = self.original_width + delta.x()
-                    if new_width > 0:
-                        self.setFixedWidth(new_width)
-                elif self.resizing_edge == 'left' and self.prev_sibling_widget:
-                    new_prev_width = self.original_prev_sibling_width + delta.x()
-                    new_self_width = self.original_width - delta.x()
-                    if new_prev_width > 0 and new_self_width > 0:
-                        self.prev_sibling_widget.setFixedWidth(new_prev_width)
-                        self.setFixedWidth(new_self_width)
-
+        if self.resize_engine and self.resize_engine.frame is self:
+            # 幅とスクロールの反映はエンジンが表示フレームごとにまとめて行う
+            self.resize_engine.move(event.globalPosition().toPoint().x())
         elif self.get_resize_edge(event.position().toPoint()):
             self.setCursor(Qt.SizeHorCursor)
         else:
@@ -201,13 +494,8 @@ class QtFrame(QFrame):
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
-        if event.button() == Qt.LeftButton and self.is_resizing:
-            self.is_resizing = False
-            self.resizing_edge = None
-            self.prev_sibling_widget = None
-            if self.resize_timer.isActive():
-                self.resize_timer.stop()
-            self.auto_resize_direction = None
+        if event.button() == Qt.LeftButton and self.resize_engine and self.resize_engine.frame is self:
+            self.resize_engine.end()
         super().mouseReleaseEvent(event)
 
     def get_resize_edge(self, pos):
@@ -224,30 +512,103 @@ class QtFrame(QFrame):
 
 class FlairApp(QMainWindow):
     # メインアプリケーションウィンドウを初期化します。
-    def __init__(self):
+    # recovery_dir を指定すると、編集をそこへジャーナルとして自動保存し、異常終了した後に復元します。
+    def __init__(self, recovery_dir=None):
         super().__init__()
         self.setWindowTitle("FlairApp (Qt)")
         self.setGeometry(100, 100, 800, 600)
 
+        self.document = Document() # 保存や読み込みはウィジェットではなくこのモデルに対して行う
+        self.loader = None # 読み込み中のDocumentLoader
+        self.load_progress = None
+        self.export_job = None # 画像の書き出し (export.ExportJob)
+        self.export_progress = None
+        self.recovery_dir = None # ジャーナルの保存先 (recovery_dir を指定したときだけ)
+        self.journal = None # 表示しているタブの編集操作を自動保存するJournal (recovery_dir を指定したときだけ)
+        self.modified = False # 最後に開いた・保存した後に編集したか
+        self.history = History() # 元に戻す・やり直しの履歴 (変更の差分だけを持つ)
+        # 全ブロックのテキストの検索用の索引 (別スレッドで作り、編集のたびに差分だけ更新する)。タブごとに持つ
+        self.search_index = self.create_search_index()
+        self.search_panel = None
+        self.code_generator = CodeGenerator() # フレームごとに生成したコードを中身のハッシュでキャッシュする
+        self.code_panel = None
+        self.run_panel = None
+        self.run_outputs = {} # (フレームの位置, ブロックの番号) -> 最後の実行でそのブロックが出力したテキスト
+        self.run_stats = {} # (フレームの位置, ブロックの番号) -> (実行回数, 時間 (秒))
         self.frames = []
-        self.selected_frame = None
-        self.selected_block = None
+        self.frame_positions = {} # QtFrame -> self.frames内の位置 (list.indexを使わずに移動するため)
+        self.hit_index = HitTestIndex(self.frames) # クリックされた位置からフレームとブロックを引く
+        # 選択が変わったときは、状態が変わったフレームとブロックだけを描き直す
+        self.selection = SelectionModel(self.on_frame_selection_changed, self.on_block_selection_changed)
+        # フレームのウィジェットは作り直さず、ファイルを開くときやタブを切り替えるときに使い回す
+        self.widget_pool = WidgetPool(self.create_frame_widget)
+
+        # --- タブ ---
+        # 表示しているタブのドキュメント・履歴・保存したかは self.document などに持ち、切り替えるときにタブへ書き戻す
+        self.tabs = [DocumentTab(self.document, search_index=self.search_index)]
+        self.current_tab = 0
+
+        # --- 仮想化 ---
+        self.virtual_margin = 400 # ビューポートの外側にも先に用意しておく幅 (px)
+        self.virtualize_pending = False
 
         # --- ブロックのデフォルトサイズ ---
         self.block_width = 280
         self.block_height = 80
 
-        # --- スタイル変数 ---
-        self.sidebar_button_color = "#65F4D4"
-
         self.script_dir = Path(__file__).parent.parent
-        
-        self.pressed_keys = set() # 押されているキーを追跡するためのセット
 
         self.init_ui()
+        if recovery_dir is not None:
+            self.start_journal(recovery_dir)
+
+    def create_search_index(self):
+        search_index = SearchIndex(on_change=self.on_document_changed)
+        search_index.start()
+        return search_index
+
+    # ジャーナルを開始します。前回保存されずに残った編集内容があれば、復元するかを尋ねます。
+    # ジャーナルはタブごとにあるので、復元するときは残っていたものをそれぞれのタブに開きます。
+    def start_journal(self, directory):
+        self.recovery_dir = Path(directory)
+        recovered = []
+        for path in recovery_dirs(directory):
+            document, _ = read_recovery(path)
+            if len(document):
+                recovered.append((path, document))
+            else:
+                discard_recovery(path)
+        if recovered:
+            answer = QMessageBox.question(self, "Recovery", "保存されていない編集内容が残っています。復元しますか?")
+            if answer != QMessageBox.StandardButton.Yes:
+                for path, _ in recovered:
+                    discard_recovery(path)
+                recovered = []
+        if not recovered:
+            self.journal = self.tabs[0].journal = self.create_journal()
+            return
+        for number, (path, document) in enumerate(recovered):
+            if number:
+                self.new_tab(path)
+            else:
+                self.journal = self.tabs[0].journal = self.create_journal(path)
+            self.show_document(document)
+            self.modified = True
+
+    # タブのジャーナルを開始します。directory を省略すると、保存先の中の使われていないディレクトリに書きます。
+    def create_journal(self, directory=None):
+        if self.recovery_dir is None:
+            return None
+        # 書き込みは別スレッドで行うので、入力の応答には影響しない
+        journal = Journal(directory or new_journal_dir(self.recovery_dir))
+        journal.start()
+        return journal
 
     # ユーザーインターフェースを初期化します。
     def init_ui(self):
+        # スタイルはアプリ全体で1つのスタイルシートにまとめ、状態はプロパティで切り替える
+        theme.apply()
+
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
         main_layout = QHBoxLayout(central_widget)
@@ -257,7 +618,7 @@ class FlairApp(QMainWindow):
         # --- メニューバー ---
         self.menubar = QFrame()
         self.menubar.setFixedWidth(60)
-        self.menubar.setStyleSheet("background-color: #1C1C1C;")
+        self.menubar.setProperty("role", "menubar")
         menubar_layout = QVBoxLayout(self.menubar)
         menubar_layout.setContentsMargins(5, 5, 5, 5)
         menubar_layout.setSpacing(5)
@@ -265,8 +626,14 @@ class FlairApp(QMainWindow):
 
         file_button = self.add_tool_button(menubar_layout, "file_icon.png", "File Operations")
         block_button = self.add_tool_button(menubar_layout, "block_icon.png", "Block Operations")
+        search_button = self.add_tool_button(menubar_layout, "search_icon.png", "Search")
+        code_button = self.add_tool_button(menubar_layout, "code_icon.png", "Generated Code")
+        run_button = self.add_tool_button(menubar_layout, "run_icon.png", "Run")
         file_button.clicked.connect(self.setup_file_sidebar)
         block_button.clicked.connect(self.setup_block_sidebar)
+        search_button.clicked.connect(self.setup_search_sidebar)
+        code_button.clicked.connect(self.setup_code_sidebar)
+        run_button.clicked.connect(self.setup_run_sidebar)
 
         # --- スプリッター ---
         splitter = QSplitter(Qt.Orientation.Horizontal)
@@ -275,35 +642,108 @@ class FlairApp(QMainWindow):
         self.sidebar = QScrollArea()
         self.sidebar.setWidgetResizable(True)
         self.sidebar.setMinimumWidth(150)
-        self.sidebar.setStyleSheet("background-color: #1F1F1F; border: none;")
+        self.sidebar.setProperty("role", "sidebar")
         
         self.sidebar_content = QWidget()
         self.sidebar.setWidget(self.sidebar_content)
         self.sidebar_layout = QVBoxLayout(self.sidebar_content)
         self.sidebar_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
+
+        # 検索パネルは入力した内容を残すため、サイドバーを切り替えても作り直さない
+        self.search_panel = SearchPanel(self.search_index)
+        self.search_panel.match_activated.connect(self.show_match)
+        self.search_panel.texts_replaced.connect(self.replace_block_texts)
+        self.code_panel = CodePanel()
+        self.code_panel.block_activated.connect(self.show_block)
+        self.run_panel = RunPanel(lambda: self.code_generator.generate(self.document))
+        self.run_panel.run_started.connect(self.clear_run_info)
+        self.run_panel.block_output.connect(self.on_block_output)
+        self.run_panel.hot_spots.connect(self.show_hot_spots)
+        self.run_panel.error_block.connect(self.show_block)
         
         self.setup_file_sidebar() # 初期表示
 
         # --- メインバー ---
         self.mainbar_scroll_area = QScrollArea()
         self.mainbar_scroll_area.setWidgetResizable(True)
-        self.mainbar_scroll_area.setStyleSheet("background-color: #222222; border: none;")
+        self.mainbar_scroll_area.setProperty("role", "mainbar")
+        # フレームのリサイズと端での自動スクロールを、表示フレームごとに1回のレイアウトでまとめて反映する
+        self.resize_engine = FrameResizeEngine(self.mainbar_scroll_area, self)
+        self.resize_engine.frames_resized.connect(self.on_frames_resized)
         
+        # 開いているドキュメントのタブ (メインバーの上)
+        self.tab_bar = QTabBar()
+        self.tab_bar.setProperty("role", "tabs")
+        self.tab_bar.setTabsClosable(True)
+        self.tab_bar.setExpanding(False)
+        self.tab_bar.setDocumentMode(True)
+        self.tab_bar.addTab(self.tabs[0].title())
+        self.tab_bar.currentChanged.connect(self.switch_tab)
+        self.tab_bar.tabCloseRequested.connect(self.close_tab)
+        editor_area = QWidget()
+        editor_layout = QVBoxLayout(editor_area)
+        editor_layout.setContentsMargins(0, 0, 0, 0)
+        editor_layout.setSpacing(0)
+        editor_layout.addWidget(self.tab_bar)
+        editor_layout.addWidget(self.mainbar_scroll_area)
+
         mainbar_content = QWidget()
         self.mainbar_scroll_area.setWidget(mainbar_content)
+        # ブロックの編集は、編集するブロックの上に重ねる1つのエディターで行う
+        self.block_editor = BlockEditor(mainbar_content)
         self.mainbar_layout = QHBoxLayout(mainbar_content)
-        self.mainbar_layout.setAlignment(Qt.AlignmentFlag.AlignLeft)
+        # 上寄せにしておかないと、レイアウトの高さの上限を超えたときにフレームが縦にずれる
+        self.mainbar_layout.setAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop)
         self.mainbar_layout.addStretch(1)
 
+        # スクロールやサイズ変更のたびに、見えているブロックだけをウィジェットにする
+        for scroll_bar in (self.mainbar_scroll_area.horizontalScrollBar(), self.mainbar_scroll_area.verticalScrollBar()):
+            scroll_bar.valueChanged.connect(self.schedule_virtualization)
+            scroll_bar.rangeChanged.connect(self.schedule_virtualization)
+
         # --- レイアウトへの追加 ---
         splitter.addWidget(self.sidebar)
-        splitter.addWidget(self.mainbar_scroll_area)
+        splitter.addWidget(editor_area)
         splitter.setSizes([150, 650])
 
         main_layout.addWidget(self.menubar)
         main_layout.addWidget(splitter)
 
-        QApplication.instance().installEventFilter(self)
+        # クリックの処理はメインバーの中だけで行う (エディターのQTextEditはクリックを受け取って
+        # 親に渡さないので、そのビューポートにもフィルターを入れる)
+        self.mainbar_scroll_area.viewport().installEventFilter(self)
+        self.watch_editor(self.block_editor)
+        self.setup_shortcuts()
+
+    # キーボードのショートカットを登録します。
+    def setup_shortcuts(self):
+        bindings = (
+            (QKeySequence.StandardKey.Undo, self.undo),
+            (QKeySequence.StandardKey.Redo, self.redo),
+            ("Ctrl+Alt+Up", self.selected_block_up),
+            ("Ctrl+Alt+Down", self.selected_block_down),
+            ("Ctrl+Alt+Left", self.select_frame_left),
+            ("Ctrl+Alt+Right", self.select_frame_right),
+            ("Ctrl+B", self.add_block_to_selected_frame),
+            ("Ctrl+F", self.add_frame),
+            ("Ctrl+Shift+F", self.setup_search_sidebar),
+            ("F3", self.search_panel.find_next),
+            ("Shift+F3", self.search_panel.find_previous),
+            ("F5", self.run_selected_frame),
+            ("Ctrl+T", self.new_tab),
+            ("Ctrl+W", self.close_tab),
+            ("Ctrl+PgDown", self.next_tab),
+            ("Ctrl+PgUp", self.previous_tab),
+            ("Ctrl+E", self.export_image),
+        )
+        for sequence, slot in bindings:
+            shortcut = QShortcut(QKeySequence(sequence), self)
+            shortcut.activated.connect(slot)
+
+    # 共有のエディターのクリックと、元に戻すキーを受け取れるようにします。
+    def watch_editor(self, editor):
+        editor.installEventFilter(self)
+        editor.viewport().installEventFilter(self)
 
     # メニューバーにツールボタンを追加します。
     def add_tool_button(self, layout, icon_name, tooltip):
@@ -326,14 +766,20 @@ class FlairApp(QMainWindow):
     # ファイル操作サイドバーをセットアップします。
     def setup_file_sidebar(self):
         self.clear_sidebar()
-        file_ops = ["Open File", "Save File"]
+        file_ops = ["New Tab", "Open File", "Save File", "Export", "Close Tab"]
         for op in file_ops:
             button = QPushButton(op)
+            if op == "New Tab":
+                button.clicked.connect(self.new_tab)
+            if op == "Close Tab":
+                button.clicked.connect(lambda: self.close_tab())
             if op == "Open File":
                 button.clicked.connect(self.open_file)
             if op == "Save File":
                 button.clicked.connect(self.save_file)
-            button.setStyleSheet(f"background-color: {self.sidebar_button_color}; color: #000000; border: 1px solid #555555; border-radius: 4px; padding: 5px;")
+            if op == "Export":
+                button.clicked.connect(self.export_image)
+            button.setProperty("role", "sidebar-button")
             self.sidebar_layout.addWidget(button)
 
     # ブロック操作サイドバーをセットアップします。
@@ -345,103 +791,609 @@ class FlairApp(QMainWindow):
             if block_type == "frame":
                 button.clicked.connect(self.add_frame)
             if block_type == "block":
-                button.clicked.connect(self.add_block_to_selected_frame)
-            button.setStyleSheet(f"background-color: {self.sidebar_button_color}; color: #000000; border: 1px solid #555555; border-radius: 4px; padding: 5px;")
+                button.clicked.connect(lambda: self.add_block_to_selected_frame())
+            if block_type in BLOCK_KINDS:
+                button.clicked.connect(lambda checked=False, kind=block_type: self.add_block_to_selected_frame(kind))
+            button.setProperty("role", "sidebar-button")
             self.sidebar_layout.addWidget(button)
 
+    # 検索サイドバーをセットアップします。
+    def setup_search_sidebar(self):
+        if self.search_panel.parentWidget() is not self.sidebar_content:
+            self.clear_sidebar()
+            self.sidebar_layout.addWidget(self.search_panel)
+        self.search_panel.show()
+        self.search_panel.focus_find()
+
+    # 生成コードのサイドバーをセットアップします。
+    def setup_code_sidebar(self):
+        if self.code_panel.parentWidget() is not self.sidebar_content:
+            self.clear_sidebar()
+            self.sidebar_layout.addWidget(self.code_panel)
+        self.code_panel.show()
+        self.update_generated_code()
+
+    # 実行のサイドバーをセットアップします。
+    def setup_run_sidebar(self):
+        if self.run_panel.parentWidget() is not self.sidebar_content:
+            self.clear_sidebar()
+            self.sidebar_layout.addWidget(self.run_panel)
+        self.run_panel.show()
+
+    # 選択中のフレームの関数を実行します (F5)。
+    def run_selected_frame(self):
+        self.setup_run_sidebar()
+        if self.selected_frame is not None:
+            self.run_panel.refresh_entries()
+            self.run_panel.select_entry(self.frame_positions[self.selected_frame])
+        self.run_panel.run()
+
     # メインバーに新しいフレームを追加します。
     def add_frame(self):
+        frame_model = self.document.add_frame()
+        self.add_frame_widget(frame_model)
+        if self.journal:
+            self.journal.add_frame()
+        self.history.push(AddFrame(frame_model))
+        self.modified = True
+
+    # 新しいQtFrameを作ります (プールに使い回せるフレームがないとき)。シグナルはここで1回だけ接続します。
+    def create_frame_widget(self, frame_number, frame_model):
+        new_frame = QtFrame(frame_number, self.mainbar_scroll_area, frame_model, self.resize_engine)
+        new_frame.geometry_changed.connect(self.schedule_virtualization)
+        new_frame.geometry_changed.connect(self.hit_index.invalidate)
+        new_frame.block_text_edited.connect(lambda index, old_text, text, frame=new_frame: self.on_block_text_edited(frame, index, old_text, text))
+        return new_frame
+
+    # モデルのフレームに対応するQtFrameをメインバーの末尾に追加します。
+    # index が False なら検索の索引には入れません (タブを切り替えるときは、タブの索引がそのまま使える)。
+    def add_frame_widget(self, frame_model, select=True, index=True):
         frame_number = len(self.frames) + 1
-        new_frame = QtFrame(frame_number, self.mainbar_scroll_area)
+        new_frame = self.widget_pool.acquire(frame_number, frame_model)
         # ストレッチ以外のウィジェットの数を挿入インデックスとする
         insert_index = self.mainbar_layout.count() - 1
         self.mainbar_layout.insertWidget(insert_index, new_frame)
+        new_frame.show() # プールから戻したフレームは隠してある
+        self.frame_positions[new_frame] = len(self.frames)
         self.frames.append(new_frame)
-        self.select_frame(new_frame)
+        self.hit_index.invalidate()
+        if index:
+            self.search_index.add_frame(len(self.frames) - 1, frame_model)
+        new_frame.reload_blocks(self.block_height)
+        if select:
+            self.select_frame(new_frame)
+        self.schedule_virtualization()
 
     # 現在選択されているフレームにブロックを追加します。
-    def add_block_to_selected_frame(self):
+    def add_block_to_selected_frame(self, kind=None):
         if self.selected_frame:
-            self.selected_frame.add_block(self.block_width, self.block_height)
+            self.selected_frame.add_block(self.block_width, self.block_height, kind=kind)
+            frame_index = self.frame_positions[self.selected_frame]
+            self.search_index.set_text(frame_index, len(self.selected_frame.model) - 1, "")
+            if self.journal:
+                self.journal.add_block(frame_index, kind=kind)
+            self.history.push(AddBlock(frame_index))
+            self.modified = True
+            self.schedule_virtualization()
+
+    # --- ジャーナルと履歴への記録 (ジャーナルはキューに入れるだけで、書き込みは別スレッド) ---
+
+    def on_block_text_edited(self, frame, index, old_text, text):
+        frame_index = self.frame_positions[frame]
+        if self.journal:
+            self.journal.set_text(frame_index, index, text)
+        self.search_index.set_text(frame_index, index, text)
+        self.history.push(EditText(frame_index, index, old_text, text)) # 続けての入力は1つにまとめられる
+        self.modified = True
+
+    def on_frames_resized(self, changes):
+        resized = []
+        for frame, old_width in changes:
+            if frame not in self.frame_positions:
+                continue
+            frame_index = self.frame_positions[frame]
+            if self.journal:
+                self.journal.resize(frame_index, frame.model.width)
+            resized.append((frame_index, old_width, frame.model.width))
+        if resized:
+            self.history.push(ResizeFrames(resized))
+
+    # --- 元に戻す・やり直し ---
+
+    def undo(self):
+        if self.history.undo(self):
+            self.modified = True
+
+    def redo(self):
+        if self.history.redo(self):
+            self.modified = True
+
+    # 以下は履歴のコマンドから呼ばれる操作。モデル・ウィジェット・ジャーナルをまとめて更新する
+
+    def append_frame(self, frame_model):
+        self.document.frames.append(frame_model)
+        self.add_frame_widget(frame_model)
+        if self.journal:
+            self.journal.add_frame()
+
+    def remove_last_frame(self):
+        frame = self.frames.pop()
+        del self.frame_positions[frame]
+        self.hit_index.invalidate()
+        self.selection.forget_frame(frame)
+        self.release_frame_widget(frame)
+        self.document.frames.pop()
+        if self.journal:
+            self.journal.truncate(len(self.frames))
+        self.search_index.truncate(len(self.frames))
+        if self.frames and self.selected_frame is None:
+            self.select_frame(self.frames[-1])
+        self.schedule_virtualization()
+
+    def append_block(self, frame_index, block):
+        frame = self.frames[frame_index]
+        index = frame.restore_block(block)
+        if self.journal:
+            self.journal.add_block(frame_index, block.text, block.kind)
+        self.search_index.set_text(frame_index, index, block.text)
+        self.select_block(frame, index)
+        self.schedule_virtualization()
+
+    def remove_last_block(self, frame_index):
+        frame = self.frames[frame_index]
+        self.selection.forget_block(frame, len(frame.model) - 1)
+        block = frame.remove_last_block()
+        if self.journal:
+            self.journal.pop_block(frame_index)
+        self.search_index.pop_block(frame_index)
+        self.schedule_virtualization()
+        return block
+
+    def block_text(self, frame_index, index):
+        return self.document.frames[frame_index].text(index)
+
+    def set_block_text(self, frame_index, index, text, cursor=None):
+        frame = self.frames[frame_index]
+        frame.model.set_text(index, text)
+        if self.journal:
+            self.journal.set_text(frame_index, index, text)
+        self.search_index.set_text(frame_index, index, text)
+        self.reveal_block(frame, index)
+        frame.refresh_block_text(index, cursor)
+
+    # --- 検索 ---
+
+    # ドキュメントが変わったとき (検索の索引に変更を入れるたびに呼ばれる):
+    # 検索の結果と生成コードを次の表示フレームで更新します。
+    def on_document_changed(self):
+        if self.search_panel is not None:
+            self.search_panel.schedule_search()
+        if self.code_panel is not None and self.code_panel.isVisible():
+            shared_clock().request("codegen", self.update_generated_code)
+
+    # 生成コードの表示を更新します。変わったフレームの関数だけを作り直します。
+    def update_generated_code(self):
+        if self.code_panel.isVisible():
+            self.code_panel.show_module(self.code_generator.generate(self.document))
+
+    # --- 実行の結果の表示 ---
+
+    # 前の実行の出力とホットスポットを消します。
+    def clear_run_info(self):
+        self.run_outputs.clear()
+        self.run_stats.clear()
+        for frame in self.frames:
+            frame.clear_run_info()
+
+    # 実行中のブロックの出力を、そのブロックのツールチップに加えます。
+    def on_block_output(self, frame_index, index, text):
+        key = (frame_index, index)
+        self.run_outputs[key] = (self.run_outputs.get(key, "") + text)[-RUN_NOTE_LENGTH:]
+        self.update_run_info(key)
+
+    # 実行が終わったとき: ブロックごとの時間の割合でホットスポットの段階を決めます。
+    def show_hot_spots(self, counts, timings):
+        longest = max(timings.values(), default=0)
+        for key in set(counts) | set(timings):
+            self.run_stats[key] = (counts.get(key, 0), timings.get(key, 0.0))
+            self.update_run_info(key, longest)
+
+    def update_run_info(self, key, longest=None):
+        frame_index, index = key
+        if frame_index >= len(self.frames) or index >= len(self.frames[frame_index].model):
+            return # 実行の後にブロックが消された
+        heat = None
+        lines = []
+        if key in self.run_stats:
+            count, seconds = self.run_stats[key]
+            lines.append(f"実行 {count} 回 / {seconds * 1000:.2f} ms")
+            if longest:
+                ratio = seconds / longest
+                heat = next((level for level, threshold in HEAT_LEVELS if ratio >= threshold), None)
+        if key in self.run_outputs:
+            lines.append(self.run_outputs[key].rstrip("\n"))
+        if heat is None:
+            heat = self.frames[frame_index].block_heat.get(index)
+        self.frames[frame_index].set_block_run_info(index, heat, "\n".join(lines))
+
+    # フレームの位置とブロックの番号で指定したブロックを選択します。
+    def show_block(self, frame_index, index):
+        if frame_index < len(self.frames) and index < len(self.frames[frame_index].model):
+            frame = self.frames[frame_index]
+            self.select_frame(frame)
+            self.select_block(frame, index)
+
+    # 検索の一致を表示し、そのブロックを選択して一致した範囲を選びます。
+    def show_match(self, frame_index, index, start, end):
+        if frame_index >= len(self.frames):
+            return
+        frame = self.frames[frame_index]
+        self.selection.select_block(frame, index)
+        block = self.reveal_block(frame, index)
+        self.block_editor.attach(block, focus=False) # 検索の入力欄からフォーカスを移さない
+        cursor = self.block_editor.textCursor()
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        self.block_editor.setTextCursor(cursor)
+
+    # 検索パネルでの置き換えを反映します。複数のブロックの置き換えは、1回の操作として元に戻せます。
+    def replace_block_texts(self, changes):
+        commands = []
+        for frame_index, index, old_text, text in changes:
+            frame = self.frames[frame_index]
+            frame.model.set_text(index, text)
+            if self.journal:
+                self.journal.set_text(frame_index, index, text)
+            self.search_index.set_text(frame_index, index, text)
+            frame.refresh_block_text(index)
+            commands.append(EditText(frame_index, index, old_text, text))
+        if not commands:
+            return
+        self.history.push(commands[0] if len(commands) == 1 else EditGroup(commands))
+        self.modified = True
+
+    def set_frame_width(self, frame_index, width):
+        frame = self.frames[frame_index]
+        frame.model.width = width
+        frame.apply_model_width()
+        if self.journal:
+            self.journal.resize(frame_index, width)
+
+    # 表示しているドキュメントを入れ替えます (ファイルを開く操作の取り消しとやり直し)。
+    def replace_document(self, document):
+        if self.loader is not None and self.loader.is_running():
+            self.loader.cancel()
+            self.load_progress.reset()
+        self.clear_frames()
+        if self.journal:
+            # エンコードは書き込みスレッドで行う (読んでいないフレームはバイト列のまま渡す)
+            self.journal.reset(frames=[frame_snapshot(frame) for frame in document.frames])
+        self.show_document(document)
+
+    # 次のイベントループで表示範囲を更新します。連続した呼び出しは1回にまとめます。
+    def schedule_virtualization(self, *args):
+        if self.virtualize_pending:
+            return
+        self.virtualize_pending = True
+        QTimer.singleShot(0, self.update_virtualization)
+
+    # ビューポート付近のブロックだけがウィジェットを持つようにします。
+    def update_virtualization(self):
+        self.virtualize_pending = False
+        viewport = self.mainbar_scroll_area.viewport()
+        margin = self.virtual_margin
+        visible = viewport.rect().adjusted(-margin, -margin, margin, margin)
+        for frame in self.frames:
+            # レイアウトで配置される前のフレームは位置が確定していないので、配置されてから判定する
+            if not frame.isVisible():
+                frame.update_visible_blocks(None)
+                continue
+            # ビューポートの矩形をフレームのブロック領域の座標に変換する
+            offset = frame.block_area.mapFrom(viewport, QPoint(0, 0))
+            frame.update_visible_blocks(visible.translated(offset))
+
+    # 選択中のフレーム
+    @property
+    def selected_frame(self):
+        return self.selection.current_frame
+
+    # 選択中のフレーム内で、操作の対象になっているブロックの番号
+    @property
+    def selected_block(self):
+        return self.selection.current_block
 
     # 選択されたフレームをハイライトします。
     def select_frame(self, frame_to_select):
-        self.selected_frame = frame_to_select
-        for frame in self.frames:
-            if frame == frame_to_select:
-                frame.setStyleSheet("background-color: #2C2C2C; border: 2px solid #4A90E2; border-radius: 5px;")
-            else:
-                frame.setStyleSheet("background-color: #2C2C2C; border: 1px solid #4A4A4A; border-radius: 5px;")
+        self.selection.select_frame(frame_to_select)
 
     # すべてのフレームの選択を解除します。
     def deselect_all_frames(self):
         self.select_frame(None)
 
     # 選択されたブロックをハイライトします。
-    def select_block(self, block_to_select):
-        self.selected_block = block_to_select
-        # すべてのフレームのすべてのブロックをチェック
-        for frame in self.frames:
-            for block in frame.blocks:
-                if block == block_to_select:
-                    # 選択時のスタイル
-                    block.setStyleSheet("background-color: #333333; border: 2px solid #4A90E2; border-radius: 4px;")
-                    # 対応するテキストボックスにフォーカスを当てる
-                    block.text_edit.setFocus()
-                else:
-                    # 非選択時のスタイル
-                    block.setStyleSheet("background-color: #333333; border: 1px solid #4A4A4A; border-radius: 4px;")
+    def select_block(self, frame, index):
+        if frame is None or index is None:
+            self.selection.clear_blocks()
+            return
+        self.selection.select_block(frame, index)
+        self.focus_block(frame, index)
+
+    # Ctrl+クリック: ブロックを選択に加えたり外したりします。
+    def toggle_block(self, frame, index):
+        self.selection.toggle_block(frame, index)
+        if self.selection.is_block_selected(frame, index):
+            self.focus_block(frame, index)
+
+    # Shift+クリック: 前に選択したブロックからここまでを選択します。
+    def select_block_range(self, frame, index):
+        self.selection.select_range(frame, index)
+        self.focus_block(frame, index)
+
+    # ブロックを表示して、共有のエディターをそのブロックに重ねてフォーカスを当てます。
+    def focus_block(self, frame, index):
+        block = self.reveal_block(frame, index)
+        self.block_editor.attach(block)
+
+    # SelectionModelからの通知: フレームの選択状態が変わったときに呼ばれます。
+    def on_frame_selection_changed(self, frame, selected):
+        if theme.set_state(frame, "selected", selected):
+            theme.repolish(frame.title_label) # タイトルの枠線も選択状態に合わせる
+
+    # SelectionModelからの通知: ブロックの選択状態が変わったときに呼ばれます。
+    def on_block_selection_changed(self, frame, index, selected):
+        if selected:
+            frame.selected_indexes.add(index)
+        else:
+            frame.selected_indexes.discard(index)
+        # ウィジェットがあるのは見えているブロックだけなので、それ以外は表示されるときに反映される
+        block = frame.live_blocks.get(index)
+        if block is None:
+            return
+        theme.set_state(block, "selected", selected)
+
+    # ブロックが見えるようにスクロールし、そのウィジェットを返します。
+    def reveal_block(self, frame, index):
+        rect = frame.block_rect(index)
+        center = frame.block_area.mapTo(self.mainbar_scroll_area.widget(), rect.center())
+        self.mainbar_scroll_area.ensureVisible(center.x(), center.y(), rect.width() // 2, rect.height() // 2)
+        self.update_virtualization()
+        return frame.materialize_block(index)
 
     # すべてのブロックの選択を解除します。
     def deselect_all_blocks(self):
-        self.select_block(None)
+        self.select_block(None, None)
 
     # JSONファイルを開き、データを読み込みます。
     def open_file(self):
-        filepath, _ = QFileDialog.getOpenFileName(self, "Open File", "", "JSON Files (*.json);;All Files (*)")
+        filepath, _ = QFileDialog.getOpenFileName(self, "Open File", "", "Flair Files (*.json *.flairb);;JSON Files (*.json);;Flair Binary Files (*.flairb);;All Files (*)")
         if not filepath:
             return
 
-        with open(filepath, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        # 今のタブに何か入っていれば、新しいタブに開く
+        if not self.tabs[self.current_tab].is_blank() or self.frames:
+            self.new_tab()
+        self.load_file(filepath)
+
+    # ファイルを読み込みます。解析は別スレッドで行い、フレームは読めたものから順に表示します。
+    def load_file(self, filepath):
+        if self.loader is not None:
+            self.loader.cancel()
+
+        previous_document = self.document
+        self.clear_frames()
+        self.document = Document()
+        # 前のドキュメントは履歴にそのまま残し、元に戻すときは参照を付け替えるだけにする
+        self.history.push(LoadDocument(previous_document, self.document))
+        if self.journal:
+            # ジャーナルは書き込みスレッドが同じファイルを読んだ内容から始め直す
+            self.journal.reset(filepath)
+        self.modified = False
+        self.set_tab_path(self.current_tab, filepath)
+
+        self.loader = DocumentLoader(filepath, parent=self)
+        self.loader.frame_loaded.connect(self.on_frame_loaded)
+        self.loader.finished.connect(self.on_load_finished)
+        self.loader.failed.connect(self.on_load_failed)
+
+        self.load_progress = QProgressDialog(f"Loading {Path(filepath).name}...", "Cancel", 0, 100, self)
+        self.load_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.load_progress.setMinimumDuration(500) # すぐ終わる読み込みではダイアログを出さない
+        self.load_progress.canceled.connect(self.cancel_load)
+        self.loader.progress.connect(self.load_progress.setValue)
+
+        self.loader.start()
+
+    # 読み込まれたフレームをドキュメントとメインバーに追加します。
+    def on_frame_loaded(self, frame_model):
+        self.document.frames.append(frame_model)
+        # ブロックのウィジェットはここでは作らず、表示範囲に入ったときに作る
+        self.add_frame_widget(frame_model, select=False)
+
+    def on_load_finished(self):
+        self.load_progress.reset()
+        if self.frames:
+            self.select_frame(self.frames[-1])
 
-        for frame in self.frames:
-            frame.setParent(None)
+    def on_load_failed(self, message):
+        self.load_progress.reset()
+        self.truncate_journal()
+        QMessageBox.warning(self, "Open File", f"ファイルを読み込めませんでした。\n{message}")
+
+    # 読み込みを中止します。ここまでに読み込まれたフレームは残ります。
+    def cancel_load(self):
+        if self.loader is not None:
+            self.loader.cancel()
+            self.truncate_journal()
+
+    # メインバーのフレームをすべて取り除きます。モデルのドキュメントはそのまま残ります。
+    def clear_frames(self, index=True):
+        self.deselect_all_blocks()
+        self.deselect_all_frames()
+        # プールは後に返したものから使うので、後ろから返して次も同じ番号のフレームが使われるようにする
+        for frame in reversed(self.frames):
+            self.selection.forget_frame(frame)
+            self.release_frame_widget(frame)
         self.frames.clear()
+        self.frame_positions.clear()
+        self.hit_index.invalidate()
+        if index:
+            self.search_index.truncate(0)
+
+    # フレームのウィジェットをメインバーから外し、使い回せるようにプールへ返します。
+    def release_frame_widget(self, frame):
+        self.mainbar_layout.removeWidget(frame)
+        frame.hide()
+        self.widget_pool.release(frame)
+
+    # 読み込みが途中で終わったとき、ジャーナルのフレームを表示されている分にそろえます。
+    def truncate_journal(self):
+        if self.journal:
+            self.journal.truncate(len(self.document.frames))
+
+    # モデルのドキュメントを、ローダーを通さずにそのまま表示します。
+    def show_document(self, document, index=True):
+        self.document = document
+        for frame_model in document.frames:
+            self.add_frame_widget(frame_model, select=False, index=index)
+        if self.frames:
+            self.select_frame(self.frames[-1])
 
-        for i, frame_data in enumerate(data):
-            self.add_frame()
-            new_frame = self.frames[-1] # Get the newly added frame
-            for block_texts in frame_data:
-                new_block = new_frame.add_block(self.block_width, self.block_height)
-                if block_texts:
-                    new_block.text_edit.setText(block_texts[0])
-
-    # 現在のデータをJSONファイルに保存します。
+    # 現在のデータをファイルに保存します。拡張子が .flairb ならバイナリ形式で保存します。
     def save_file(self):
-        filepath, _ = QFileDialog.getSaveFileName(self, "Save File", "", "JSON Files (*.json);;All Files (*)")
+        filepath, _ = QFileDialog.getSaveFileName(self, "Save File", "", "JSON Files (*.json);;Flair Binary Files (*.flairb);;All Files (*)")
         if not filepath:
             return
 
-        data = []
-        for frame in self.frames:
-            frame_data = []
-            for block in frame.blocks:
-                block_data = [block.text_edit.toPlainText()]
-                frame_data.append(block_data)
-            data.append(frame_data)
-
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-
-    # クリックされたウィジェットまたはその親をたどって、指定された型のウィジェットを見つけます。
-    def get_ancestor_widget(self, event, widget_type):
-        widget = QApplication.widgetAt(event.globalPosition().toPoint())
-        while widget is not None:
-            if isinstance(widget, widget_type):
-                return widget
-            widget = widget.parent()
-        return None
+        # ブロックの編集はその都度モデルに反映されているので、ウィジェットをたどる必要はない
+        self.document.save(filepath)
+        self.modified = False
+        self.set_tab_path(self.current_tab, filepath)
+
+    # フローチャート全体を画像 (PNG / SVG / PDF) に書き出します。描くのは別スレッドで、ドキュメントの写しから行います。
+    def export_image(self):
+        if self.export_job is not None:
+            return # 書き出し中
+        filepath, selected = QFileDialog.getSaveFileName(self, "Export", "", "PNG Images (*.png);;SVG Files (*.svg);;PDF Files (*.pdf)")
+        if not filepath:
+            return
+        if not Path(filepath).suffix:
+            filepath += "." + selected.split("*.")[1].rstrip(")") # 拡張子がなければ選んだ形式のものを付ける
+
+        self.export_job = ExportJob(self.document, filepath, parent=self)
+        self.export_job.finished.connect(self.on_export_finished)
+        self.export_job.failed.connect(self.on_export_failed)
+        self.export_progress = QProgressDialog(f"Exporting {Path(filepath).name}...", "Cancel", 0, 100, self)
+        self.export_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.export_progress.setMinimumDuration(500) # すぐ終わる書き出しではダイアログを出さない
+        self.export_progress.canceled.connect(self.cancel_export)
+        self.export_job.progress.connect(self.export_progress.setValue)
+        self.export_job.start()
+
+    def on_export_finished(self, filepath):
+        self.export_progress.reset()
+        self.export_job = None
+
+    def on_export_failed(self, message):
+        self.export_progress.reset()
+        self.export_job = None
+        QMessageBox.warning(self, "Export", f"書き出せませんでした。\n{message}")
+
+    # 書き出しを中止します。書きかけのファイルはスレッドが消します。
+    def cancel_export(self):
+        if self.export_job is not None:
+            self.export_job.cancel()
+            self.export_job = None
+
+    # --- タブ ---
+    # ジャーナルもタブごとにあり、切り替えるときは付け替えるだけなので、切り替えの間も他のタブの編集が残る
+
+    # 空のドキュメントの新しいタブを開いて、そこへ切り替えます。journal_dir は復元したタブのジャーナルのディレクトリです。
+    def new_tab(self, journal_dir=None):
+        self.tabs.append(DocumentTab(search_index=self.create_search_index(), journal=self.create_journal(journal_dir)))
+        self.tab_bar.addTab(self.tabs[-1].title())
+        self.switch_tab(len(self.tabs) - 1)
+
+    # タブを切り替えます。フレームのウィジェットはプールに返し、切り替え先のドキュメントに結び付け直します。
+    # 検索の索引はタブごとにあるので、作り直さずに入れ替えるだけです。
+    def switch_tab(self, index):
+        if index == self.current_tab or not 0 <= index < len(self.tabs):
+            return
+        if self.loader is not None and self.loader.is_running():
+            self.cancel_load()
+            self.load_progress.reset()
+        self.store_tab()
+        self.clear_run_info() # 実行の結果は前のドキュメントのブロックの位置で持っている
+        self.clear_frames(index=False)
+        self.current_tab = index
+        tab = self.tabs[index]
+        self.history = tab.history
+        self.modified = tab.modified
+        self.search_index = tab.search_index
+        self.search_panel.index = tab.search_index
+        self.journal = tab.journal
+        self.show_document(tab.document, index=False)
+        self.restore_tab(tab)
+        self.on_document_changed() # 検索の結果と生成コードを切り替え先のドキュメントで出し直す
+        self.tab_bar.setCurrentIndex(index) # タブバーから切り替えたときは何もしない
+
+    # 表示しているタブの状態をタブに書き戻します。
+    def store_tab(self):
+        tab = self.tabs[self.current_tab]
+        tab.document = self.document
+        tab.history = self.history
+        tab.modified = self.modified
+        tab.scroll = (self.mainbar_scroll_area.horizontalScrollBar().value(), self.mainbar_scroll_area.verticalScrollBar().value())
+        tab.selection = (self.frame_positions.get(self.selected_frame), self.selected_block)
+
+    # タブに書き戻しておいた選択とスクロール位置を戻します。
+    def restore_tab(self, tab):
+        frame_index, index = tab.selection
+        if frame_index is not None and frame_index < len(self.frames):
+            frame = self.frames[frame_index]
+            self.select_frame(frame)
+            if index is not None and index < len(frame.model):
+                self.selection.select_block(frame, index) # スクロールは下で戻すので、reveal_block はしない
+        # スクロールバーの範囲はレイアウトが済むまで決まらないので、先にレイアウトしてから戻す
+        self.mainbar_layout.activate()
+        self.mainbar_scroll_area.widget().adjustSize()
+        self.mainbar_scroll_area.horizontalScrollBar().setValue(tab.scroll[0])
+        self.mainbar_scroll_area.verticalScrollBar().setValue(tab.scroll[1])
+        self.schedule_virtualization()
+
+    # タブを閉じます。省略すると表示しているタブ。保存していない編集があれば確かめます。
+    def close_tab(self, index=None):
+        if index is None:
+            index = self.current_tab
+        tab = self.tabs[index]
+        modified = self.modified if index == self.current_tab else tab.modified
+        if modified:
+            answer = QMessageBox.question(self, "Close Tab", f"{tab.title()} には保存されていない編集があります。閉じますか?")
+            if answer != QMessageBox.StandardButton.Yes:
+                return
+        if len(self.tabs) == 1:
+            self.new_tab() # 最後のタブを閉じるときは空のタブを残す
+        if index == self.current_tab:
+            self.switch_tab(index + 1 if index + 1 < len(self.tabs) else index - 1)
+        del self.tabs[index]
+        tab.search_index.close()
+        if tab.journal:
+            tab.journal.close(discard=True) # 閉じると決めたタブの編集は、次の起動で復元しない
+        if index < self.current_tab:
+            self.current_tab -= 1
+        self.tab_bar.removeTab(index)
+
+    def next_tab(self):
+        self.switch_tab((self.current_tab + 1) % len(self.tabs))
+
+    def previous_tab(self):
+        self.switch_tab((self.current_tab - 1) % len(self.tabs))
+
+    # タブのファイル名を設定し、タブの見出しに反映します。
+    def set_tab_path(self, index, filepath):
+        tab = self.tabs[index]
+        tab.path = filepath
+        self.tab_bar.setTabText(index, tab.title())
+        self.tab_bar.setTabToolTip(index, str(filepath))
 
     def select_frame_left(self):
         """選択されているフレームの選択を一つ左に移します。"""
@@ -452,9 +1404,8 @@ class FlairApp(QMainWindow):
             self.select_frame(self.frames[-1])
             return
 
-        try:
-            current_index = self.frames.index(self.selected_frame)
-        except ValueError:
+        current_index = self.frame_positions.get(self.selected_frame)
+        if current_index is None:
             return
 
         if current_index > 0:
@@ -468,10 +1419,9 @@ class FlairApp(QMainWindow):
         if not self.selected_frame:
             self.select_frame(self.frames[0])
             return
-            
-        try:
-            current_index = self.frames.index(self.selected_frame)
-        except ValueError:
+
+        current_index = self.frame_positions.get(self.selected_frame)
+        if current_index is None:
             return
 
         if current_index < len(self.frames) - 1:
@@ -479,134 +1429,134 @@ class FlairApp(QMainWindow):
 
     def selected_block_up(self):
         """選択されているブロックの選択を一つ上に移します。"""
-        if not self.selected_frame or not self.selected_frame.blocks:
+        if not self.selected_frame or not len(self.selected_frame.model):
             return
 
         # ブロックが選択されていない場合、最後のブロックを選択する
-        if not self.selected_block:
-            self.select_block(self.selected_frame.blocks[-1])
-            return
-
-        try:
-            current_index = self.selected_frame.blocks.index(self.selected_block)
-        except ValueError:
+        if self.selected_block is None:
+            self.select_block(self.selected_frame, len(self.selected_frame.model) - 1)
             return
 
         # 一番上でなければ、一つ上のブロックを選択する
-        if current_index > 0:
-            self.select_block(self.selected_frame.blocks[current_index - 1])
+        if self.selected_block > 0:
+            self.select_block(self.selected_frame, self.selected_block - 1)
 
     def selected_block_down(self):
         """選択されているブロックの選択を一つ下に移します。"""
-        if not self.selected_frame or not self.selected_frame.blocks:
+        if not self.selected_frame or not len(self.selected_frame.model):
             return
 
         # ブロックが選択されていない場合、最初のブロックを選択する
-        if not self.selected_block:
-            self.select_block(self.selected_frame.blocks[0])
-            return
-            
-        try:
-            current_index = self.selected_frame.blocks.index(self.selected_block)
-        except ValueError:
+        if self.selected_block is None:
+            self.select_block(self.selected_frame, 0)
             return
 
         # 一番下でなければ、一つ下のブロックを選択する
-        if current_index < len(self.selected_frame.blocks) - 1:
-            self.select_block(self.selected_frame.blocks[current_index + 1])
+        if self.selected_block < len(self.selected_frame.model) - 1:
+            self.select_block(self.selected_frame, self.selected_block + 1)
 
     def eventFilter(self, watched, event):
-        # --- キーイベントの処理 ---
-        if event.type() == QEvent.Type.KeyPress:
-            self.pressed_keys.add(event.key())
-
-            # ブロック選択移動 (Ctrl + Alt + ↑/↓)
-            required_keys_block = {Qt.Key.Key_Control, Qt.Key.Key_Alt}
-            if required_keys_block.issubset(self.pressed_keys):
-                if event.key() == Qt.Key.Key_Up:
-                    self.selected_block_up()
-                    return True # イベントを消費
-                if event.key() == Qt.Key.Key_Down:
-                    self.selected_block_down()
-                    return True # イベントを消費
-
-            # フレーム選択移動 (Ctrl + Tab + ←/→)
-            required_keys_frame = {Qt.Key.Key_Control, Qt.Key.Key_Tab}
-            if required_keys_frame.issubset(self.pressed_keys):
-                if event.key() == Qt.Key.Key_Left:
-                    self.select_frame_left()
-                    return True
-                if event.key() == Qt.Key.Key_Right:
-                    self.select_frame_right()
-                    return True
-
-        if event.type() == QEvent.Type.KeyRelease:
-            self.pressed_keys.discard(event.key())
-        
-        # --- マウスプレスイベントの処理 ---
-        if event.type() == QEvent.Type.MouseButtonPress:
-            if event.button() == Qt.LeftButton:
-                clicked_widget = QApplication.widgetAt(event.globalPosition().toPoint())
-                
-                # ウィンドウ外のクリック
-                if not clicked_widget:
-                    self.deselect_all_frames()
-                    self.deselect_all_blocks()
-                    return False
-
-                ancestor = clicked_widget
-                clicked_frame = None
-                clicked_block = None
-                is_on_interactive_widget = False
-
-                # クリックされたウィジェットの祖先をたどり、ブロックとフレームを特定
-                while ancestor is not None:
-                    if clicked_block is None and isinstance(ancestor, QtBlock):
-                        clicked_block = ancestor
-                    
-                    if isinstance(ancestor, QtFrame):
-                        clicked_frame = ancestor
-                        break # フレームまで到達したら終了
-                    
-                    if isinstance(ancestor, (QPushButton, QToolButton, QScrollBar)):
-                        is_on_interactive_widget = True
-                        break
-                    ancestor = ancestor.parent()
-
-                # フレームがクリックされた場合の処理
-                if clicked_frame:
-                    self.select_frame(clicked_frame)
-                    # ブロックもクリックされていれば選択
-                    if clicked_block:
-                        self.select_block(clicked_block)
-                    # フレームのみクリックされた場合はブロックの選択を解除
-                    else:
-                        self.deselect_all_blocks()
-                # インタラクティブなウィジェット以外で、フレームの外側がクリックされた場合
-                elif not is_on_interactive_widget:
-                    self.deselect_all_frames()
-                    self.deselect_all_blocks()
+        event_type = event.type()
+        if event_type == QEvent.Type.MouseButtonPress:
+            if event.button() == Qt.MouseButton.LeftButton:
+                self.on_canvas_clicked(event)
+            return False
 
+        # --- ビューポートのサイズ変更で表示範囲を更新 ---
+        if event_type == QEvent.Type.Resize and watched is self.mainbar_scroll_area.viewport():
+            self.schedule_virtualization()
             return False
-        
-        # このフィルターで処理しない他のすべてのイベント
+
+        # 元に戻す・やり直しはQTextEditに処理させず、ショートカットからアプリの履歴を使う
+        if event_type == QEvent.Type.ShortcutOverride:
+            if event.matches(QKeySequence.StandardKey.Undo) or event.matches(QKeySequence.StandardKey.Redo):
+                event.ignore()
+                return True
         return False
 
-    def keyPressEvent(self, event):
-        # Ctrlキーが押された場合 (シンプルなショートカットはこちらで処理)
-        if event.modifiers() == Qt.KeyboardModifier.ControlModifier:
-            if event.key() == Qt.Key.Key_B:
-                self.add_block_to_selected_frame()
-            if event.key() == Qt.Key.Key_F:
-                self.add_frame()
-        super().keyPressEvent(event)
+    # メインバーの中の左クリックで、フレームとブロックを選択します。
+    def on_canvas_clicked(self, event):
+        canvas = self.mainbar_scroll_area.widget()
+        clicked_frame, index = self.hit_index.hit(canvas.mapFromGlobal(event.globalPosition().toPoint()))
+
+        # フレームの外側がクリックされた場合
+        if clicked_frame is None:
+            self.deselect_all_frames()
+            self.deselect_all_blocks()
+            return
 
+        self.select_frame(clicked_frame)
+        # ブロックもクリックされていれば選択 (Ctrlで追加/解除、Shiftで範囲選択)
+        if index is not None:
+            modifiers = event.modifiers()
+            if modifiers & Qt.KeyboardModifier.ShiftModifier:
+                self.select_block_range(clicked_frame, index)
+            elif modifiers & Qt.KeyboardModifier.ControlModifier:
+                self.toggle_block(clicked_frame, index)
+            else:
+                self.select_block(clicked_frame, index)
+                # エディターを重ねたばかりのブロックでも、クリックした位置から入力できるようにする
+                self.block_editor.place_cursor(event.globalPosition().toPoint())
+        # フレームのみクリックされた場合はブロックの選択を解除
+        else:
+            self.deselect_all_blocks()
+
+    def closeEvent(self, event):
+        self.store_tab()
+        modified = [tab.title() for tab in self.tabs if tab.modified]
+        if modified:
+            answer = QMessageBox.question(self, "Quit", f"{', '.join(modified)} には保存されていない編集があります。終了しますか?")
+            if answer != QMessageBox.StandardButton.Yes:
+                event.ignore()
+                return
+        for tab in self.tabs:
+            tab.search_index.close()
+        self.run_panel.close_pool()
+        # 保存していない編集があるタブは、次の起動で復元できるようにジャーナルを残す
+        for tab in self.tabs:
+            if tab.journal:
+                tab.journal.close(discard=not tab.modified)
+                tab.journal = None
+        self.journal = None
+        super().closeEvent(event)
+
+
+
+# --- 計測 (FLAIR_PROFILE か --profile を指定したときだけ) ---
+
+# 主なハンドラを時間を測るラッパーに置き換えます。ウィジェットを作る前に呼びます。
+def enable_profiling(trace_path):
+    profiler.enable(trace_path)
+    profiler.instrument(FlairApp, ("eventFilter", "open_file", "load_file", "save_file", "select_frame", "select_block", "toggle_block", "select_block_range", "on_canvas_clicked", "show_match", "replace_block_texts", "update_generated_code", "update_virtualization", "on_frame_loaded", "undo", "redo", "switch_tab"), "app")
+    profiler.instrument(QtFrame, ("paintEvent", "resizeEvent", "update_visible_blocks", "materialize_block"), "frame")
+    profiler.instrument(WidgetPool, ("acquire", "release"), "pool")
+    profiler.instrument(BlockColumnLayout, ("apply_geometry",), "layout")
+    profiler.instrument(QtBlock, ("create_preview",), "highlight")
+    profiler.instrument(DocumentLoader, ("parse", "drain"), "io")
+    profiler.instrument(Document, ("save",), "io")
+    profiler.instrument(SearchPanel, ("run_search",), "search")
+    profiler.instrument(theme, ("apply", "repolish"), "style")
+    profiler.count_calls(QtBlock, "__init__", "widgets.QtBlock")
+    profiler.count_calls(QtFrame, "__init__", "widgets.QtFrame")
+    profiler.count_calls(theme, "apply", "stylesheet.apply")
+    profiler.count_calls(theme, "repolish", "stylesheet.repolish")
+
+
+# 計測の結果 (トレースと集計) を書き出します。
+def report_profile():
+    path = profiler.get().export()
+    print(profiler.get().summary(), file=sys.stderr)
+    print(f"トレースを {path} に書き出しました", file=sys.stderr)
 
 
 if __name__ == "__main__":
     # Set QT_IM_MODULE for Japanese input support
     # os.environ['QT_IM_MODULE'] = 'fcitx' 
 
+    trace_path = profiler.requested_trace_path(sys.argv)
+    if trace_path:
+        enable_profiling(trace_path)
+
     app = QApplication(sys.argv)
 
     # # Read and log the QT_IM_MODULE value for debugging
@@ -628,6 +1578,10 @@ if __name__ == "__main__":
     # dark_palette.setColor(QPalette.ColorRole.Button, QColor(53, 53, 53))
     # dark_palette.setColor(QPalette.ColorRole.ButtonText, QColor("white"))
 
-    window = FlairApp()
+    window = FlairApp(recovery_dir=default_recovery_dir())
     window.show()
+    if trace_path:
+        # Ctrl+Alt+P でいつでも、終了時には自動で書き出す
+        QShortcut(QKeySequence("Ctrl+Alt+P"), window).activated.connect(report_profile)
+        app.aboutToQuit.connect(report_profile)
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""ブロックのテキストを編集する共有のエディター。
+
+ブロック (QtBlock) はテキストを描くだけの軽いウィジェットで、編集しているブロックの上にだけ
+この QTextEdit を重ねます。エディターはアプリに1つだけで、選択されたブロックやクリックされたブロックへ移ります。
+エディターの親はブロックではなくフレームのブロック領域にし、同じフレームの中で移るときは親を付け替えません
+(付け替えるとスタイルの計算がやり直しになって遅いため)。位置はブロックが動くたびに合わせます。
+入力はその都度ブロックのフレームからモデルに書き戻し、フォーカスが外れたらブロックから離れて、
+ブロックは書き戻されたテキストを描き直します。
+コードを持つ種類のブロックを編集している間は、highlighter.CodeHighlighter で色を付けます。
+"""
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QTextEdit
+
+from highlighter import CodeHighlighter
+
+# フォーカスが外れてもブロックから離れない理由 (ウィンドウの切り替えや、メニュー・ダイアログを開いたとき)
+KEEP_REASONS = (Qt.FocusReason.ActiveWindowFocusReason, Qt.FocusReason.PopupFocusReason)
+
+
+class BlockEditor(QTextEdit):
+    # home はブロックから離れている間の親です (フレームのウィジェットが消されても、エディターは残るように)。
+    def __init__(self, home):
+        super().__init__(home)
+        self.home = home
+        self.setProperty("role", "block-editor")
+        self.block = None # 重なっているQtBlock
+        self.loading = False # テキストを入れている間は、変更として書き戻さない
+        # 元に戻す操作はQTextEditではなくアプリの履歴で行う
+        self.setUndoRedoEnabled(False)
+        self.highlighter = CodeHighlighter(self)
+        self.textChanged.connect(self.on_text_changed)
+        self.hide()
+
+    # ブロックの上に重ねます。focus が False ならフォーカスは移しません (検索の一致を表示するときなど)。
+    def attach(self, block, focus=True):
+        if block is not self.block:
+            self.leave_block()
+            if self.parentWidget() is not block.parentWidget():
+                self.setParent(block.parentWidget()) # 隠れてフォーカスが外れるので、ブロックを結び付ける前に行う
+            # 色付けを切り替えると書式を消すので textChanged が来る。ブロックを結び付ける前に行う
+            self.highlighter.set_kind(block.kind, self.document())
+            self.block = block
+            block.editor = self
+            self.follow_block()
+            self.load_text(block.text)
+            self.show()
+            self.raise_()
+        if focus:
+            self.setFocus()
+
+    # ブロックから離れて隠れます。ブロックはテキストを描き直します。
+    def detach(self):
+        if self.block is None:
+            return
+        self.leave_block()
+        self.hide()
+        self.setParent(self.home)
+
+    def leave_block(self):
+        block = self.block
+        if block is None:
+            return
+        self.block = None
+        block.editor = None
+        block.update()
+
+    # 重なっているブロックの位置に合わせます (ブロックが動いたり大きさが変わったりしたとき)。
+    def follow_block(self):
+        self.setGeometry(self.block.editor_rect().translated(self.block.pos()))
+
+    # テキストを入れ替えます。cursor を指定するとカーソルをそこへ移します。
+    def load_text(self, text, cursor=None):
+        self.loading = True
+        try:
+            self.setPlainText(text)
+        finally:
+            self.loading = False
+        if cursor is not None:
+            text_cursor = self.textCursor()
+            text_cursor.setPosition(min(cursor, len(text)))
+            self.setTextCursor(text_cursor)
+
+    # 画面上の点 (グローバル座標) の位置にカーソルを移します。
+    def place_cursor(self, global_pos):
+        self.setTextCursor(self.cursorForPosition(self.viewport().mapFromGlobal(global_pos)))
+
+    def on_text_changed(self):
+        block = self.block
+        if self.loading or block is None or block.index < 0:
+            return
+        block.frame.on_block_text_changed(block, self.toPlainText())
+
+    def focusOutEvent(self, event):
+        super().focusOutEvent(event)
+        if event.reason() not in KEEP_REASONS:
+            self.detach()
@@ -0,0 +1,78 @@
+"""サイドバーの生成コードの表示。
+
+codegen.ModuleCode を受け取って表示します。フレームの数が変わらなければ、
+前回から変わったフレームの関数の行だけを置き換えるので、1つのブロックの編集では
+ドキュメント全体のテキストを入れ直しません。文法の誤りは一覧にし、選ぶとそのブロックを知らせます。
+"""
+from PySide6.QtCore import Signal
+from PySide6.QtGui import QFontDatabase, QTextCursor
+from PySide6.QtWidgets import QLabel, QListWidget, QPlainTextEdit, QVBoxLayout, QWidget
+
+MAX_LISTED_ERRORS = 100
+
+
+class CodePanel(QWidget):
+    block_activated = Signal(int, int) # フレームの位置, ブロックの番号
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.module = None # 表示している codegen.ModuleCode
+        self.error_blocks = [] # 誤りの一覧の行ごとの (フレームの位置, ブロックの番号)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.status_label = QLabel()
+        self.status_label.setWordWrap(True)
+        self.errors = QListWidget()
+        self.errors.setMaximumHeight(120)
+        self.errors.hide()
+        self.editor = QPlainTextEdit()
+        self.editor.setReadOnly(True)
+        self.editor.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.editor.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.editor.setMinimumHeight(400)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.errors)
+        layout.addWidget(self.editor)
+
+        self.errors.currentRowChanged.connect(self.on_error_row_changed)
+
+    # 生成したコードを表示します。
+    def show_module(self, module):
+        previous = self.module
+        self.module = module
+        if previous is None or len(previous.frames) != len(module.frames):
+            self.editor.setPlainText(module.source)
+        else:
+            document = self.editor.document()
+            # 後ろの関数から置き換えるので、前にある関数の行の位置は変わらない
+            for position in reversed(range(len(module.frames))):
+                old_code = previous.frames[position]
+                new_code = module.frames[position]
+                if old_code is new_code:
+                    continue
+                first = previous.offsets[position]
+                last = document.findBlockByNumber(first + len(old_code.line_blocks) - 1)
+                cursor = QTextCursor(document.findBlockByNumber(first))
+                cursor.setPosition(last.position() + last.length() - 1, QTextCursor.MoveMode.KeepAnchor)
+                cursor.insertText(new_code.source)
+        self.show_errors(module.errors())
+
+    def show_errors(self, errors):
+        self.errors.blockSignals(True)
+        self.errors.clear()
+        self.error_blocks = []
+        for position, block, message in errors[:MAX_LISTED_ERRORS]:
+            where = f"Frame {position + 1}" + (f", block {block + 1}" if block is not None else "")
+            self.errors.addItem(f"{where}: {message}")
+            self.error_blocks.append((position, block))
+        self.errors.blockSignals(False)
+        self.errors.setVisible(bool(errors))
+        functions = len(self.module.frames)
+        self.status_label.setText(f"{functions} 個の関数、文法の誤り {len(errors)} 件" if errors else f"{functions} 個の関数")
+
+    def on_error_row_changed(self, row):
+        if 0 <= row < len(self.error_blocks):
+            position, block = self.error_blocks[row]
+            if block is not None:
+                self.block_activated.emit(position, block)
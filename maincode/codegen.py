@@ -0,0 +1,300 @@
+"""フローチャートからPythonのコードを作ります (PySide6には依存しません)。
+
+1つのフレームを1つの関数にします。ブロックの種類ごとの扱いは flow.py の構造のとおりです。
+    種類なし         : テキストをそのまま文として書く (複数行可)。空なら pass
+    if / while / for : テキストを条件にした if 文・while 文・for 文。直後の構造が本体
+    true / false     : if の本体と else の目印 (コードにはならない)
+    return           : return テキスト
+    function         : フレームの先頭にあれば関数の宣言 (テキストが名前と引数)。それ以外の位置では何もしない
+先頭に function ブロックのないフレームは、frame_<番号>() という引数のない関数になります。
+
+生成したコードはフレームの中身のハッシュをキーにしてキャッシュするので、
+1つのブロックを編集したときは、そのフレームの関数だけを作り直します。
+生成したコードは ast.parse で確かめ、文法の誤りはブロックの番号と一緒に返します。
+
+保存したドキュメントをコマンドラインからまとめて変換できます。
+    python maincode/codegen.py doc1.json doc2.flairb --output-dir build/
+    python maincode/codegen.py docs/*.json --check --jobs 4    # 文法の誤りがあれば終了コード 1
+"""
+import argparse
+import ast
+import hashlib
+import re
+import sys
+import textwrap
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import flairb
+import flow
+from document import Document
+
+INDENT = "    "
+HEADER = "# Flair で生成したコード"
+SEPARATOR_LINES = 2 # 関数の間の空行の数
+MAX_CACHED = 4096 # キャッシュしておくフレームの数
+
+
+class FrameCode:
+    """1つのフレームから作った関数のコード。"""
+    __slots__ = ("name", "source", "line_blocks", "error")
+
+    def __init__(self, name, source, line_blocks, error):
+        self.name = name # 関数の名前
+        self.source = source
+        self.line_blocks = line_blocks # 行ごとの、その行を作ったブロックの番号 (関数の宣言の行などは None)
+        self.error = error # 文法の誤り (ブロックの番号, メッセージ)。なければ None
+
+
+class ModuleCode:
+    """ドキュメント全体のコード。フレームの関数を順に並べたものです。"""
+
+    def __init__(self, frames):
+        self.frames = frames # FrameCode の並び
+        self.offsets = [] # 各フレームの関数が始まる行 (0 から数える)
+        parts = [HEADER]
+        line = 1
+        for code in frames:
+            parts.append("\n" * (SEPARATOR_LINES - 1))
+            line += SEPARATOR_LINES
+            self.offsets.append(line)
+            parts.append(code.source)
+            line += len(code.line_blocks)
+        self.source = "\n".join(parts) + "\n"
+
+    # 文法の誤りを (フレームの位置, ブロックの番号, メッセージ) の並びで返します。
+    def errors(self):
+        return [(position, *code.error) for position, code in enumerate(self.frames) if code.error is not None]
+
+    # 行ごとの、その行を作ったブロック (フレームの位置, ブロックの番号) の並びを返します (実行時の出力と計測用)。
+    def line_map(self):
+        lines = [None] * self.source.count("\n")
+        for position, (offset, code) in enumerate(zip(self.offsets, self.frames)):
+            for line, block in enumerate(code.line_blocks):
+                if block is not None:
+                    lines[offset + line] = (position, block)
+        return lines
+
+    # 行番号 (1 から数える) を作ったブロックを (フレームの位置, ブロックの番号) で返します。分からなければ None。
+    def locate(self, lineno):
+        position = bisect_right(self.offsets, lineno - 1) - 1
+        if position < 0:
+            return None
+        line = lineno - 1 - self.offsets[position]
+        line_blocks = self.frames[position].line_blocks
+        if line >= len(line_blocks) or line_blocks[line] is None:
+            return None
+        return position, line_blocks[line]
+
+
+# フレームの中身を (テキスト, 種類) の並びで返します。まだ読んでいない flairb のフレームはモデルに読み込まずにデコードします。
+def frame_blocks(frame):
+    unread = frame.unread_source()
+    if unread is not None:
+        return flairb.decode_blocks(*unread)
+    return [(block.text, block.kind) for block in frame.blocks]
+
+
+# キャッシュのキー: フレームの番号 (関数の名前になる) と中身の flairb 形式のバイト列のハッシュ。
+def frame_key(number, frame):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(number.to_bytes(4, "little"))
+    digest.update(frame.to_binary())
+    return digest.digest()
+
+
+# function ブロックのテキストから、関数の宣言 (名前と引数) を返します。
+def function_signature(text, default):
+    text = " ".join(text.split())
+    if text.startswith("def "):
+        text = text[4:]
+    text = text.rstrip(":").strip()
+    if not text:
+        return default
+    if "(" not in text:
+        text += "()"
+    return text
+
+
+# ブロックのテキストが種類と同じキーワードで始まっていれば (「return x」の return ブロックなど)、それを取り除きます。
+# 制御のブロックでは、条件の後ろの「:」も取り除きます。
+def strip_keyword(text, kind):
+    text = re.sub(rf"^\s*{kind}\b[ \t]*", "", text, count=1)
+    if kind in flow.CONTROL_KINDS:
+        text = text.rstrip().removesuffix(":")
+    return text
+
+
+# 1つのフレーム (number は 1 から数える) から関数のコードを作ります。
+def generate_frame(number, blocks):
+    kinds = [kind for _, kind in blocks]
+    count = len(blocks)
+    ends = flow.construct_ends(kinds)
+    lines = [] # (ブロックの番号, 行)
+
+    def statement(index, depth, prefix=""):
+        pad = INDENT * depth
+        text = blocks[index][0]
+        if prefix:
+            text = strip_keyword(text, prefix.strip())
+        if "\n" not in text:
+            text = text.strip() # ほとんどのブロックは1行なので、dedent を通さない
+            text_lines = [text] if text else []
+        else:
+            text_lines = [line.rstrip() for line in textwrap.dedent(text).splitlines()]
+            text_lines = [line for line in text_lines if line.strip()]
+        if not text_lines:
+            lines.append((index, pad + (prefix.strip() or "pass")))
+            return
+        lines.append((index, pad + prefix + text_lines[0]))
+        for line in text_lines[1:]:
+            lines.append((index, pad + line))
+
+    def body(start, stop, depth):
+        # start から始まる1つの構造を本体にする。本体がなければ pass
+        if start is None or start > stop:
+            lines.append((None, INDENT * depth + "pass"))
+            return
+        construct(start, depth)
+
+    def construct(index, depth):
+        text, kind = blocks[index]
+        pad = INDENT * depth
+        if kind in flow.CONTROL_KINDS:
+            condition = " ".join(strip_keyword(text, kind).split())
+            lines.append((index, f"{pad}{kind} {condition}:"))
+            if index + 1 >= count:
+                body(None, index, depth + 1)
+            elif kind == "if":
+                then_start = flow.then_body_start(kinds, index)
+                then_end = ends[then_start]
+                body(then_start, ends[index], depth + 1)
+                else_start = flow.else_body_start(kinds, then_end)
+                if else_start is not None:
+                    lines.append((then_end + 1, pad + "else:"))
+                    body(else_start, ends[index], depth + 1)
+            else:
+                body(index + 1, ends[index], depth + 1)
+        elif kind == "return":
+            statement(index, depth, "return ")
+        elif kind in ("true", "false", "function"):
+            lines.append((index, pad + "pass"))
+        else:
+            statement(index, depth)
+
+    name = f"frame_{number}"
+    signature = f"{name}()"
+    first = 0
+    header_block = None
+    if count and kinds[0] == "function":
+        signature = function_signature(blocks[0][0], signature)
+        name = signature.split("(", 1)[0].strip()
+        header_block = 0
+        first = 1
+    lines.append((header_block, f"def {signature}:"))
+    index = first
+    while index < count:
+        construct(index, 1)
+        index = ends[index] + 1
+    if len(lines) == 1:
+        lines.append((None, INDENT + "pass"))
+
+    source = "\n".join(line for _, line in lines)
+    line_blocks = [index for index, _ in lines]
+    error = None
+    try:
+        ast.parse(source)
+    except SyntaxError as e:
+        lineno = min(max(e.lineno or 1, 1), len(line_blocks))
+        block = line_blocks[lineno - 1]
+        error = (block if block is not None else header_block, e.msg)
+    return FrameCode(name, source, line_blocks, error)
+
+
+class CodeGenerator:
+    def __init__(self, max_cached=MAX_CACHED):
+        self.max_cached = max_cached
+        self.cache = OrderedDict() # ハッシュ -> FrameCode (最近使ったものが後ろ)
+        self.seen = [] # フレームの位置 -> (Frame, revision, ハッシュ)。変わっていないフレームはハッシュも計算しない
+        self.generated = 0 # キャッシュになかったので作ったフレームの数
+
+    # 位置 position (0 から数える) にあるフレームのコードを返します。
+    def frame_code(self, position, frame):
+        number = position + 1
+        seen = self.seen[position] if position < len(self.seen) else None
+        if seen is not None and seen[0] is frame and seen[1] == frame.revision:
+            key = seen[2]
+        else:
+            key = frame_key(number, frame)
+            entry = (frame, frame.revision, key)
+            if position < len(self.seen):
+                self.seen[position] = entry
+            else:
+                self.seen.append(entry)
+
+        code = self.cache.get(key)
+        if code is not None:
+            self.cache.move_to_end(key)
+            return code
+        code = generate_frame(number, frame_blocks(frame))
+        self.generated += 1
+        self.cache[key] = code
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+        return code
+
+    # ドキュメント全体のコードを返します。
+    def generate(self, document):
+        frames = [self.frame_code(position, frame) for position, frame in enumerate(document.frames)]
+        del self.seen[len(frames):]
+        return ModuleCode(frames)
+
+
+# --- コマンドライン ---
+
+# 1つのドキュメントを変換し、(入力のパス, 誤りの並び) を返します。output が None なら書き出しません。
+def convert(path, output):
+    module = CodeGenerator().generate(Document.load(path))
+    if output is not None:
+        Path(output).write_text(module.source, encoding="utf-8")
+    return path, module.errors()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="変換するドキュメント (.json / .flairb)")
+    parser.add_argument("--output-dir", help="生成したコードを書き出すディレクトリ (省略すると入力と同じ場所に .py で書き出す)")
+    parser.add_argument("--check", action="store_true", help="書き出さずに文法の誤りだけを確かめる")
+    parser.add_argument("--jobs", type=int, default=1, help="並列に変換するプロセスの数")
+    args = parser.parse_args(argv)
+
+    outputs = []
+    for path in args.paths:
+        if args.check:
+            outputs.append(None)
+        elif args.output_dir:
+            outputs.append(str(Path(args.output_dir) / (Path(path).stem + ".py")))
+        else:
+            outputs.append(str(Path(path).with_suffix(".py")))
+    if args.output_dir and not args.check:
+        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+
+    if args.jobs > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            results = list(executor.map(convert, args.paths, outputs))
+    else:
+        results = [convert(path, output) for path, output in zip(args.paths, outputs)]
+
+    failed = False
+    for path, errors in results:
+        for position, block, message in errors:
+            failed = True
+            where = f"Frame {position + 1}" + (f", block {block + 1}" if block is not None else "")
+            print(f"{path}: {where}: {message}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""フレーム内のブロックをつなぐ接続線の描画。
+
+接続線 (flow.build_edges) はブロックが増減したときだけ計算し直します。
+描画用のパスはブロック CHUNK_SIZE 個ごとの区間に分けてキャッシュし、
+paintEvent では再描画が必要な範囲 (event.rect()) にかかる区間だけを描きます。
+パスは左端・中央・右端からの相対位置で持つので、フレームの幅が変わっても作り直しません。
+ブロック領域の上端・ブロックの間隔・高さはパスに入っているので、描くときに前と違えば作り直します。
+ウィジェットのないフレーム (画像の書き出しなど) は paint_column にモデルとブロック領域の位置を渡して描きます。
+"""
+from PySide6.QtCore import QRect
+from PySide6.QtGui import QColor, QPainterPath, QPen
+
+import flow
+
+CHUNK_SIZE = 256
+CONNECTOR_COLOR = "#555555"
+GUTTER = 5 # ブロックの左右の余白のうち、分岐やループの線を通す位置 (ブロックの端からの距離)
+
+
+class ConnectorCache:
+    def __init__(self):
+        self.buckets = None # 区間番号 -> その区間にかかる接続線のリスト
+        self.paths = {} # 区間番号 -> (左端, 中央, 右端) を基準にしたQPainterPath
+        self.geometry = None # paths を作ったときの (ブロック領域の上端, 間隔, 高さ)
+        self.pen = QPen(QColor(CONNECTOR_COLOR))
+        self.pen.setWidth(2)
+
+    # ブロックの追加・削除や種類の変更で、接続線そのものが変わったときに呼びます。
+    def invalidate_edges(self):
+        self.buckets = None
+        self.paths.clear()
+
+    # 再描画が必要な範囲 (フレームの座標) にかかる接続線を描きます。
+    def paint(self, painter, frame, clip_rect):
+        self.paint_column(painter, frame.model, frame.block_area.geometry(), frame.block_pitch(), frame.block_height, clip_rect)
+
+    # model (document.Frame) のブロックを area (QRect) に pitch の間隔で並べたときの接続線のうち、clip_rect にかかるものを描きます。
+    def paint_column(self, painter, model, area, pitch, height, clip_rect):
+        if len(model) < 2:
+            return
+        if self.buckets is None:
+            self.buckets = self.bucket_edges(flow.build_edges(model.kinds()))
+        geometry = (area.top(), pitch, height)
+        if geometry != self.geometry:
+            # スタイルやフォントの変更でブロックの並びが変わっても、古いパスを描かない
+            self.paths.clear()
+            self.geometry = geometry
+
+        chunk_height = CHUNK_SIZE * pitch
+        first = max(0, (clip_rect.top() - area.top()) // chunk_height)
+        last = (clip_rect.bottom() - area.top()) // chunk_height
+
+        painter.setPen(self.pen)
+        for chunk in range(first, last + 1):
+            edges = self.buckets.get(chunk)
+            if not edges:
+                continue
+            paths = self.paths.get(chunk)
+            if paths is None:
+                paths = self.build_paths(edges, area.top(), pitch, height)
+                self.paths[chunk] = paths
+            # 区間をまたぐ線は両方の区間に入っているので、自分の区間の範囲だけを描く
+            chunk_rect = QRect(clip_rect.left(), area.top() + chunk * chunk_height, clip_rect.width(), chunk_height)
+            painter.save()
+            painter.setClipRect(chunk_rect.intersected(clip_rect))
+            for anchor_x, path in zip((area.left(), area.left() + area.width() / 2, area.right()), paths):
+                painter.translate(anchor_x, 0)
+                painter.drawPath(path)
+                painter.translate(-anchor_x, 0)
+            painter.restore()
+
+    # 接続線を、線がかかる区間ごとに振り分けます。
+    def bucket_edges(self, edges):
+        buckets = {}
+        for edge in edges:
+            source, target, _ = edge
+            low, high = min(source, target), max(source, target)
+            for chunk in range(low // CHUNK_SIZE, high // CHUNK_SIZE + 1):
+                buckets.setdefault(chunk, []).append(edge)
+        return buckets
+
+    # 接続線のリストから、左端・中央・右端を x=0 としたパスを作ります。
+    def build_paths(self, edges, top, pitch, height):
+        left_path = QPainterPath()
+        center_path = QPainterPath()
+        right_path = QPainterPath()
+        for source, target, kind in edges:
+            source_top = top + source * pitch
+            target_top = top + target * pitch
+            if kind == flow.NEXT:
+                # 元のブロックの下部中央から、次のブロックの上部中央へ
+                center_path.moveTo(0, source_top + height)
+                center_path.lineTo(0, target_top)
+                continue
+
+            # 分岐や本体を飛ばす線は左側、ループで戻る線は右側の余白を通す
+            if kind == flow.LOOP:
+                path, side_x = right_path, GUTTER
+            else:
+                path, side_x = left_path, -GUTTER
+            source_y = source_top + height / 2
+            target_y = target_top + height / 2
+            path.moveTo(0, source_y)
+            path.lineTo(side_x, source_y)
+            path.lineTo(side_x, target_y)
+            path.lineTo(0, target_y)
+        return left_path, center_path, right_path
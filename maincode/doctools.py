@@ -0,0 +1,202 @@
+"""ドキュメントの検査・正規化・統計 (PySide6には依存しません)。
+
+サーバー (CodeSmith_ai_agent) やコマンドラインから、GUIを使わずにドキュメントを扱うための関数です。
+問題は codegen の誤りと同じく (フレームの位置, ブロックの番号, メッセージ) の並びで表し、
+位置の分からないものは None にします。JSONとして読めないときは行と列をメッセージに入れます。
+ファイルの中での行と列が要るとき (コマンドラインなど) は locate_problems で問題の位置を求めます。
+"""
+import json
+import re
+from collections import Counter
+
+import flairb
+import flow
+from document import Document, normalize_kind
+
+MAX_PROBLEMS = 1000 # check_data が返す問題の数の上限
+# 解決されていない git のマージの印 (行の先頭の7文字)
+CONFLICT_MARKER = re.compile(r"^(?:<{7}|={7}|>{7}|\|{7})(?: .*)?$", re.MULTILINE)
+# JSONのテキストの字句: 文字列, 括弧, 区切り, それ以外の値
+JSON_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{},:]|[^\s\[\]{},:"]+')
+
+
+class DocumentError(ValueError):
+    """ドキュメントとして読めないデータ。problems に問題の並びを持ちます。
+
+    locations は JSON として読めなかったときの、問題ごとの (行, 列) の並びです (1 から数える)。
+    それ以外は None で、位置は locate_problems で求めます。
+    """
+
+    def __init__(self, problems, locations=None):
+        self.problems = problems
+        self.locations = locations
+        super().__init__(format_problem(*problems[0]) if problems else "正しくないドキュメントです")
+
+    # プロセスプールから返すときも problems を保つ
+    def __reduce__(self):
+        return type(self), (self.problems, self.locations)
+
+
+# 問題を "Frame 1, block 2: メッセージ" の形の文字列にします。
+def format_problem(frame, block, message):
+    if frame is None:
+        return message
+    where = f"Frame {frame + 1}" + (f", block {block + 1}" if block is not None else "")
+    return f"{where}: {message}"
+
+
+# JSONのテキスト (str / bytes) を読みます。読めなければ DocumentError。
+# マージの印が残っているファイルは、JSONの誤りではなく印の位置を返します。
+def loads(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        markers = conflict_markers(e.doc)
+        if markers:
+            markers = markers[:MAX_PROBLEMS]
+            problems = [(None, None, f"解決されていないマージの印があります: {marker!r} (line {line})") for line, marker in markers]
+            raise DocumentError(problems, [(line, 1) for line, marker in markers]) from e
+        raise DocumentError([(None, None, f"{e.msg} (line {e.lineno}, column {e.colno})")], [(e.lineno, e.colno)]) from e
+    except UnicodeDecodeError as e:
+        raise DocumentError([(None, None, f"UTF-8 として読めません (byte {e.start})")]) from e
+
+
+# テキストに残っているマージの印を (行, 印の行) の並びで返します。
+def conflict_markers(text):
+    return [(text.count("\n", 0, match.start()) + 1, match.group()) for match in CONFLICT_MARKER.finditer(text)]
+
+
+# 保存形式のデータを確かめ、問題の並びを返します。問題がなければ空です。
+def check_data(data, limit=MAX_PROBLEMS):
+    if not isinstance(data, list):
+        return [(None, None, "ドキュメントはフレームの配列でなければなりません")]
+    problems = []
+    for frame_index, frame_data in enumerate(data):
+        if not isinstance(frame_data, list):
+            problems.append((frame_index, None, "フレームはブロックの配列でなければなりません"))
+        else:
+            for index, block_data in enumerate(frame_data):
+                message = block_problem(block_data)
+                if message is not None:
+                    problems.append((frame_index, index, message))
+        if len(problems) >= limit:
+            break
+    return problems[:limit]
+
+
+# 1つのブロックのデータの問題を返します。問題がなければ None。
+def block_problem(block_data):
+    if not isinstance(block_data, list):
+        return "ブロックは [テキスト] または [テキスト, 種類] の配列でなければなりません"
+    if len(block_data) > 2:
+        return f"ブロックの要素が多すぎます ({len(block_data)} 個)"
+    if block_data and not isinstance(block_data[0], str):
+        return "ブロックのテキストが文字列ではありません"
+    if len(block_data) == 2:
+        kind = block_data[1]
+        if kind is not None and not isinstance(kind, str):
+            return "ブロックの種類が文字列ではありません"
+        if normalize_kind(kind) is not None and kind not in flow.BLOCK_KINDS:
+            return f"知らない種類です: {kind!r}"
+    return None
+
+
+# 保存形式のデータを確かめてからドキュメントにします。問題があれば DocumentError。
+def from_data(data):
+    problems = check_data(data)
+    if problems:
+        raise DocumentError(problems)
+    return Document.from_data(data)
+
+
+# JSONのテキストを読み、確かめてからドキュメントにします。
+def load_text(text):
+    return from_data(loads(text))
+
+
+# ファイル (.json / .flairb) を読み、確かめてからドキュメントにします。
+# flairb ファイルはすべてのフレームを読み、壊れているフレームはその位置の問題にします。
+# binary を指定すると、ファイル名によらずその形式として読みます。
+def load_file(path, binary=None):
+    if binary is None:
+        binary = flairb.is_binary_path(path)
+    if not binary:
+        with open(path, "rb") as f:
+            return load_text(f.read())
+    try:
+        document = Document.load(path, binary)
+    except (flairb.FormatError, OSError) as e:
+        raise DocumentError([(None, None, str(e))]) from e
+    problems = []
+    for index, frame in enumerate(document.frames):
+        try:
+            frame.blocks
+        except flairb.FormatError as e:
+            problems.append((index, None, str(e)))
+    if not problems:
+        problems = check_data(document.to_data())
+    if problems:
+        raise DocumentError(problems)
+    return document
+
+
+# JSONのテキストの中で、問題のフレームとブロックが始まる位置を (行, 列) の並びで返します (1 から数える)。
+# 位置の分からない問題は None です。テキストは1回だけたどります。
+def locate_problems(text, problems):
+    wanted = {(frame,) if block is None else (frame, block) for frame, block, _ in problems if frame is not None}
+    offsets = {}
+    path = [] # 今いる配列の中での要素の番号 (深さごと)
+    expecting = False # 次の字句が新しい要素の始まりか
+    for match in JSON_TOKEN.finditer(text):
+        if not wanted:
+            break
+        token = match.group()
+        if token in "]}":
+            path.pop()
+            expecting = False
+            continue
+        if token in ",:":
+            expecting = True
+            continue
+        if expecting and path:
+            path[-1] += 1
+            key = tuple(path)
+            if key in wanted:
+                wanted.discard(key)
+                offsets[key] = match.start()
+        expecting = token in "[{"
+        if expecting:
+            path.append(-1)
+
+    locations = []
+    for frame, block, _ in problems:
+        offset = offsets.get((frame,) if block is None else (frame, block)) if frame is not None else None
+        if offset is None:
+            locations.append(None)
+        else:
+            line_start = text.rfind("\n", 0, offset) + 1
+            locations.append((text.count("\n", 0, offset) + 1, offset - line_start + 1))
+    return locations
+
+
+# ドキュメントの統計を辞書で返します。
+def document_stats(document):
+    kinds = Counter()
+    characters = lines = empty = largest = 0
+    for frame in document.frames:
+        largest = max(largest, len(frame))
+        for block in frame.blocks:
+            kinds[block.kind or "none"] += 1
+            characters += len(block.text)
+            lines += block.text.count("\n") + 1
+            if not block.text.strip():
+                empty += 1
+    return {
+        "frames": len(document.frames),
+        "blocks": sum(kinds.values()),
+        "characters": characters,
+        "lines": lines,
+        "empty_blocks": empty,
+        "largest_frame": largest,
+        "kinds": {kind: kinds[kind] for kind in flow.BLOCK_KINDS if kinds[kind]},
+    }
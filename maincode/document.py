@@ -0,0 +1,320 @@
+"""Flairのドキュメントモデル。
+
+フレームとブロックのデータだけを持ち、PySide6には依存しません。
+QtFrame/QtBlockはこのモデルに結び付けられ、編集のたびにモデルを更新します。
+保存はウィジェットをたどらずにこのモデルから直接行います。
+"""
+import contextlib
+import json
+import os
+import re
+
+import flairb
+
+
+# 保存形式は save_file が書いていたものと同じ:
+# [ フレーム, ... ]、フレーム = [ ブロック, ... ]、ブロック = [テキスト]
+# 種類 (if, while など) のあるブロックだけ [テキスト, 種類] になります。
+# ファイル名が .flairb のときは、同じ内容をバイナリ形式 (flairb) で読み書きします。
+JSON_INDENT = 2
+BLOCK_OVERHEAD = 64 # メモリ使用量の見積もりで、ブロック1つに加えるバイト数 (オブジェクトとリストの分)
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+# ブロックの種類を保存用の値にそろえます。"none" や空文字は種類なし (None) として扱います。
+def normalize_kind(kind):
+    if not kind or kind == "none":
+        return None
+    return kind
+
+
+# 一時ファイルに書き、書き終えてから元のファイルと置き換えます。
+# 途中で失敗したり異常終了したりしても、元のファイルは前の内容のまま残ります。
+@contextlib.contextmanager
+def atomic_write(filepath, mode="w"):
+    filepath = os.fspath(filepath)
+    temp_path = filepath + ".tmp"
+    encoding = None if "b" in mode else "utf-8"
+    try:
+        with open(temp_path, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filepath)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+
+class Block:
+    """1つのブロックのデータ。kind はブロックの種類 (flow.BLOCK_KINDS) で、普通のブロックは None。"""
+    __slots__ = ("text", "kind")
+
+    def __init__(self, text="", kind=None):
+        self.text = text
+        self.kind = kind
+
+    # 保存形式のデータに変換します。
+    def to_data(self):
+        if self.kind is None:
+            return [self.text]
+        return [self.text, self.kind]
+
+    # 保存形式のデータからブロックを作ります。
+    @classmethod
+    def from_data(cls, block_data):
+        if not block_data:
+            return cls()
+        if len(block_data) > 1:
+            return cls(block_data[0], normalize_kind(block_data[1]))
+        return cls(block_data[0])
+
+
+class Frame:
+    """1つのフレームのデータ。変更がなければ前回のJSON文字列を使い回します。
+
+    flairb ファイルから読んだフレームは、blocks に最初に触れたときに中身を読み込みます。
+    """
+    __slots__ = ("_blocks", "_source", "width", "_json", "revision")
+
+    def __init__(self, blocks=None, source=None):
+        if blocks is None and source is None:
+            blocks = []
+        self._blocks = blocks
+        self._source = source # 中身をまだ読んでいないときの読み出し元 (flairb.FrameSource)
+        self.width = None # ドラッグで決めた表示上の幅 (None なら既定の幅)。ファイルには保存しない
+        self._json = None # 保存用にシリアライズした文字列 (変更されたらNone)
+        self.revision = 0 # 中身が変わるたびに増える番号 (生成したコードなどのキャッシュの確認用)
+
+    @property
+    def blocks(self):
+        if self._blocks is None:
+            self._blocks = [Block(text, kind) for text, kind in self._source.decode()]
+            self._source = None
+        return self._blocks
+
+    # 中身を読み込み済みかどうかを返します。
+    def is_loaded(self):
+        return self._blocks is not None
+
+    # まだ読んでいない中身を (flairb のバイト列, ブロック数) で返します。読み込み済みなら None。
+    # バイト列はファイルからの写しなので、別のスレッドでデコードしても構いません。
+    def unread_source(self):
+        if self._blocks is not None:
+            return None
+        return self._source.raw(), len(self._source)
+
+    def __len__(self):
+        # ブロック数はフレーム表に書いてあるので、中身を読まずに分かる
+        if self._blocks is None:
+            return len(self._source)
+        return len(self._blocks)
+
+    # フレームの末尾にブロックを追加し、その番号を返します。
+    def append_block(self, text="", kind=None):
+        self.blocks.append(Block(text, normalize_kind(kind)))
+        self._json = None
+        self.revision += 1
+        return len(self.blocks) - 1
+
+    # 末尾のブロックを取り除いて返します。
+    def pop_block(self):
+        block = self.blocks.pop()
+        self._json = None
+        self.revision += 1
+        return block
+
+    # 取り除いたブロック (pop_block の結果) を末尾に戻し、その番号を返します。
+    def push_block(self, block):
+        self.blocks.append(block)
+        self._json = None
+        self.revision += 1
+        return len(self.blocks) - 1
+
+    # ブロックのテキストを変更します。
+    def set_text(self, index, text):
+        block = self.blocks[index]
+        if block.text == text:
+            return
+        block.text = text
+        self._json = None
+        self.revision += 1
+
+    # ブロックのテキストを返します。
+    def text(self, index):
+        return self.blocks[index].text
+
+    # ブロックの種類を変更します。
+    def set_kind(self, index, kind):
+        block = self.blocks[index]
+        kind = normalize_kind(kind)
+        if block.kind == kind:
+            return
+        block.kind = kind
+        self._json = None
+        self.revision += 1
+
+    # 全ブロックの種類を並びで返します。
+    def kinds(self):
+        return [block.kind for block in self.blocks]
+
+    # 保存形式のデータに変換します。
+    def to_data(self):
+        return [block.to_data() for block in self.blocks]
+
+    # 保存形式のデータからフレームを作ります。
+    @classmethod
+    def from_data(cls, frame_data):
+        return cls([Block.from_data(block_data) for block_data in frame_data])
+
+    # flairb 形式のバイト列 (to_binary の結果) からフレームを作ります。
+    @classmethod
+    def from_binary(cls, data, count):
+        return cls([Block(text, kind) for text, kind in flairb.decode_blocks(data, count)])
+
+    # このフレームが使っているメモリのおおよそのバイト数を返します。読んでいない中身は読みません。
+    def estimated_size(self):
+        if self._blocks is None:
+            return self._source.length + BLOCK_OVERHEAD * len(self._source)
+        return sum(len(block.text) for block in self._blocks) + BLOCK_OVERHEAD * len(self._blocks)
+
+    # ドキュメントの中の1要素としてのJSON文字列を返します。変更がなければキャッシュを返します。
+    def to_json(self):
+        if self._json is None:
+            text = json.dumps(self.to_data(), indent=JSON_INDENT, ensure_ascii=False)
+            # ドキュメントの配列の中に入るので、1段深くインデントする
+            # (JSONの文字列に生の改行は入らないので、行ごとにずらしても中身は変わらない)
+            self._json = text.replace("\n", "\n" + " " * JSON_INDENT)
+        return self._json
+
+    # flairb 形式のバイト列を返します。中身を読んでいないフレームはファイルのバイト列をそのまま使います。
+    def to_binary(self):
+        if self._blocks is None:
+            return self._source.raw()
+        return flairb.encode_blocks(self._blocks)
+
+
+class Document:
+    """フレームの並び。Flairで開いている1つのファイルに対応します。"""
+
+    def __init__(self, frames=None):
+        self.frames = frames if frames is not None else []
+
+    def __len__(self):
+        return len(self.frames)
+
+    # 末尾に新しいフレームを追加し、そのフレームを返します。
+    def add_frame(self):
+        frame = Frame()
+        self.frames.append(frame)
+        return frame
+
+    # 全フレームのブロック数の合計を返します。
+    def block_count(self):
+        return sum(len(frame) for frame in self.frames)
+
+    # ドキュメントが使っているメモリのおおよそのバイト数を返します。
+    def estimated_size(self):
+        return sum(frame.estimated_size() for frame in self.frames)
+
+    # 保存形式のデータ (リスト) に変換します。
+    def to_data(self):
+        return [frame.to_data() for frame in self.frames]
+
+    # 保存形式のデータからドキュメントを作ります。
+    @classmethod
+    def from_data(cls, data):
+        return cls([Frame.from_data(frame_data) for frame_data in data])
+
+    # json.dump(data, indent=2, ensure_ascii=False) と同じ文字列を返します。
+    # 変更されていないフレームは前回の文字列をそのまま使います。
+    def dumps(self):
+        if not self.frames:
+            return "[]"
+        indent = "\n" + " " * JSON_INDENT
+        return "[" + indent + ("," + indent).join(frame.to_json() for frame in self.frames) + "\n]"
+
+    # ファイルに保存します。ファイル名が .flairb ならバイナリ形式、それ以外はJSONで書きます。
+    # binary を指定すると、ファイル名によらずその形式で書きます。
+    def save(self, filepath, binary=None):
+        if binary is None:
+            binary = flairb.is_binary_path(filepath)
+        if binary:
+            frames = [(frame.to_binary(), len(frame)) for frame in self.frames]
+            self.detach_file(filepath)
+            with atomic_write(filepath, "wb") as f:
+                flairb.dump(frames, f)
+            return
+        text = self.dumps()
+        with atomic_write(filepath) as f:
+            f.write(text)
+
+    # 上書きするファイルから遅延読み込みしているフレームを読み込み、マップを閉じます。
+    # (マップしたままのファイルは、環境によって置き換えに失敗する)
+    def detach_file(self, filepath):
+        if not os.path.exists(filepath):
+            return
+        files = set()
+        for frame in self.frames:
+            source = frame._source
+            if source is not None and os.path.samefile(source.file.path, filepath):
+                files.add(source.file)
+                frame.blocks # 中身を読み込む
+        for file in files:
+            file.close()
+
+    # ファイルを読み込みます。flairb 形式はフレーム表だけを読み、中身は使うときに読みます。
+    # binary を指定すると、ファイル名によらずその形式として読みます。
+    @classmethod
+    def load(cls, filepath, binary=None):
+        if binary is None:
+            binary = flairb.is_binary_path(filepath)
+        if binary:
+            return cls([Frame(source=source) for source in flairb.FlairbFile(filepath).frames()])
+        with open(filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls.from_data(data)
+
+
+# ファイルからフレームを1つずつ読み出し、(フレーム, 進み具合 0-100) を順に返します。
+def iter_file_frames(filepath):
+    if flairb.is_binary_path(filepath):
+        sources = flairb.FlairbFile(filepath).frames()
+        total = max(1, len(sources))
+        for number, source in enumerate(sources, 1):
+            yield Frame(source=source), number * 100 // total
+        return
+
+    with open(filepath, "r", encoding="utf-8") as f:
+        text = f.read()
+    total = max(1, len(text))
+    for frame, pos in iter_frames(text):
+        yield frame, pos * 100 // total
+
+
+# JSONのテキストからフレームを1つずつ読み出します。
+# (フレーム, 読み終えた位置) を順に返すので、全体を読み終える前に表示を始められます。
+def iter_frames(text):
+    decoder = json.JSONDecoder()
+    pos = _WHITESPACE.match(text, 0).end()
+    if not text.startswith("[", pos):
+        raise json.JSONDecodeError("Expecting '['", text, pos)
+    pos = _WHITESPACE.match(text, pos + 1).end()
+
+    if not text.startswith("]", pos):
+        while True:
+            frame_data, pos = decoder.raw_decode(text, pos)
+            yield Frame.from_data(frame_data), pos
+            pos = _WHITESPACE.match(text, pos).end()
+            if text.startswith(",", pos):
+                pos = _WHITESPACE.match(text, pos + 1).end()
+                continue
+            if text.startswith("]", pos):
+                break
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    if pos != len(text):
+        raise json.JSONDecodeError("Extra data", text, pos)
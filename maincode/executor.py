@@ -0,0 +1,475 @@
+"""生成したコードを別のプロセスで実行します (PySide6には依存しません)。
+
+ExecutionPool はワーカープロセスをいくつか起動しておき、実行の依頼を空いているワーカーに渡します。
+GUIのプロセスではコードを一切実行しないので、終わらない while ブロックがあってもイベントループは止まりません。
+    - 時間の上限: 上限を過ぎた実行はワーカーごと止め、新しいワーカーを起動し直します。
+    - メモリの上限: ワーカーのアドレス空間を resource.setrlimit で制限します (resource のない環境では制限しません)。
+    - 出力: print の出力は、その print を実行したブロック (フレームの位置, ブロックの番号) と一緒に少しずつ送られます。
+    - 計測: profile=True なら、ブロックごとの実行回数と時間 (そのブロックの行にいた時間) を集計します。
+結果やイベントは監視スレッドから on_event(種類, 実行の番号, ...) で知らせます。wait() で待つこともできます。
+
+たくさんのドキュメントや入力をまとめて実行するコマンドライン:
+    python maincode/executor.py doc.json --entry frame_1 --inputs inputs.json --jobs 4 --timeout 5
+inputs.json は引数のリストのリストです。結果は1行に1つのJSONで出力します。
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+try:
+    import resource # POSIX のみ
+except ImportError:
+    resource = None
+
+FILENAME = "<flair>" # 生成したコードのファイル名 (トレースバックと計測でブロックを探すのに使う)
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_MEMORY_LIMIT = 1024 * 1024 * 1024 # ワーカーのアドレス空間の上限 (バイト)
+STARTUP_GRACE = 10.0 # ワーカーの起動を待つ時間 (時間の上限には含めない)
+MAX_OUTPUT = 1024 * 1024 # 1回の実行で送る出力の上限 (文字)
+MAX_REPR = 2000 # 結果の repr の上限 (文字)
+OUTPUT_INTERVAL = 0.05 # 出力をまとめて送る間隔 (秒)
+POLL_INTERVAL = 0.05 # 監視スレッドが時間の上限を確かめる間隔 (秒)
+
+# 実行の結果の状態
+OK = "ok"
+ERROR = "error" # 例外 (文法の誤りを含む)
+TIMEOUT = "timeout"
+MEMORY = "memory" # メモリの上限を超えた
+CRASHED = "crashed" # ワーカーが異常終了した
+CANCELLED = "cancelled"
+
+# on_event の種類
+STARTED = "started" # (実行の番号,)
+OUTPUT = "output" # (実行の番号, フレームの位置, ブロックの番号, テキスト)。ブロックが分からなければ None
+FINISHED = "finished" # (実行の番号, RunResult)
+
+
+class RunResult:
+    """1回の実行の結果。"""
+    __slots__ = ("run_id", "status", "value", "error", "error_block", "output", "counts", "timings", "elapsed")
+
+    def __init__(self, run_id, status, value=None, error=None, error_block=None, output="", counts=None, timings=None, elapsed=0.0):
+        self.run_id = run_id
+        self.status = status
+        self.value = value # 関数が返した値の repr
+        self.error = error # 例外のメッセージ (トレースバック)
+        self.error_block = error_block # 例外が起きたブロック (フレームの位置, ブロックの番号)
+        self.output = output # 出力をすべてつなげたもの
+        self.counts = counts or {} # (フレームの位置, ブロックの番号) -> 実行回数
+        self.timings = timings or {} # (フレームの位置, ブロックの番号) -> 時間 (秒)
+        self.elapsed = elapsed
+
+    def to_data(self):
+        return {
+            "status": self.status, "value": self.value, "error": self.error,
+            "error_block": self.error_block, "output": self.output, "elapsed": self.elapsed,
+            "counts": [[*key, count] for key, count in self.counts.items()],
+            "timings": [[*key, seconds] for key, seconds in self.timings.items()],
+        }
+
+
+# --- ワーカープロセス ---
+
+class _BlockOutput(io.TextIOBase):
+    """print の出力を、実行中のブロックごとにまとめて送るストリーム。"""
+
+    def __init__(self, run_id, events, line_blocks):
+        self.run_id = run_id
+        self.events = events
+        self.line_blocks = line_blocks
+        self.block = None
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.sent = 0
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if self.sent >= MAX_OUTPUT:
+            return len(text)
+        text = text[:MAX_OUTPUT - self.sent]
+        self.sent += len(text)
+        block = _current_block(self.line_blocks)
+        if block != self.block:
+            self.flush()
+            self.block = block
+        self.buffer.append(text)
+        self.chunks.append(text)
+        if time.monotonic() - self.last_flush >= OUTPUT_INTERVAL:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            frame, index = self.block if self.block is not None else (None, None)
+            self.events.put((OUTPUT, self.run_id, frame, index, "".join(self.buffer)))
+            self.buffer = []
+        self.last_flush = time.monotonic()
+
+
+# 呼び出し元をたどって、実行中の生成コードの行のブロックを返します。
+def _current_block(line_blocks):
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_filename == FILENAME:
+            return _line_block(line_blocks, frame.f_lineno)
+        frame = frame.f_back
+    return None
+
+
+def _line_block(line_blocks, lineno):
+    if lineno is None or not 0 < lineno <= len(line_blocks):
+        return None
+    block = line_blocks[lineno - 1]
+    return tuple(block) if block is not None else None
+
+
+class _BlockProfiler:
+    """生成コードの行の実行を数え、ブロックごとの回数と時間を集計するトレーサー。"""
+
+    def __init__(self, line_blocks):
+        self.line_blocks = line_blocks
+        # ブロックの最初の行だけを回数として数える (複数行のブロックを1回と数えるため)
+        self.first_lines = set()
+        seen = set()
+        for lineno, block in enumerate(line_blocks, 1):
+            if block is not None and tuple(block) not in seen:
+                seen.add(tuple(block))
+                self.first_lines.add(lineno)
+        self.counts = {}
+        self.timings = {}
+        self.current = None
+        self.since = 0
+
+    def trace(self, frame, event, arg):
+        if frame.f_code.co_filename != FILENAME:
+            return None
+        return self.trace_line
+
+    def trace_line(self, frame, event, arg):
+        if event == "line":
+            now = time.perf_counter()
+            if self.current is not None:
+                self.timings[self.current] = self.timings.get(self.current, 0.0) + now - self.since
+            lineno = frame.f_lineno
+            self.current = _line_block(self.line_blocks, lineno)
+            self.since = now
+            if lineno in self.first_lines:
+                self.counts[self.current] = self.counts.get(self.current, 0) + 1
+        return self.trace_line
+
+    def stop(self):
+        if self.current is not None:
+            self.timings[self.current] = self.timings.get(self.current, 0.0) + time.perf_counter() - self.since
+            self.current = None
+
+
+# アドレス空間の上限を limit にし、前の上限を返します (実行の後に _restore_memory_limit に渡す)。
+def _set_memory_limit(limit):
+    if resource is None or not limit:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    return soft
+
+
+# 上限を _set_memory_limit の前の値に戻します。
+def _restore_memory_limit(soft):
+    if soft is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+# 例外のトレースバックのうち、生成したコードの行を返します。なければ None。
+def _error_block(error, line_blocks):
+    if isinstance(error, SyntaxError) and error.filename == FILENAME:
+        return _line_block(line_blocks, error.lineno)
+    block = None
+    for frame_summary in traceback.extract_tb(error.__traceback__):
+        if frame_summary.filename == FILENAME:
+            block = _line_block(line_blocks, frame_summary.lineno)
+    return block
+
+
+def _run_task(task, events):
+    run_id, source, entry, args, memory_limit, profile, line_blocks = task
+    events.put((STARTED, run_id, os.getpid()))
+    previous_limit = _set_memory_limit(memory_limit)
+    output = _BlockOutput(run_id, events, line_blocks)
+    profiler = _BlockProfiler(line_blocks) if profile else None
+    status, value, error, error_block = OK, None, None, None
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            namespace = {"__name__": "__flair__"}
+            exec(compile(source, FILENAME, "exec"), namespace)
+            function = namespace[entry]
+            if profiler is not None:
+                sys.settrace(profiler.trace)
+            try:
+                value = repr(function(*args))[:MAX_REPR]
+            finally:
+                sys.settrace(None)
+    except MemoryError as e:
+        status, error, error_block = MEMORY, "メモリの上限を超えました", _error_block(e, line_blocks)
+    except BaseException as e: # 生成したコードの例外はすべて結果として返す (SystemExit も含む)
+        status, error, error_block = ERROR, "".join(traceback.format_exception_only(type(e), e)).strip(), _error_block(e, line_blocks)
+    elapsed = time.perf_counter() - start
+    if profiler is not None:
+        profiler.stop()
+    output.flush()
+    counts = profiler.counts if profiler else {}
+    timings = profiler.timings if profiler else {}
+    events.put((FINISHED, run_id, RunResult(
+        run_id, status, value, error, error_block, "".join(output.chunks), counts, timings, elapsed,
+    )))
+    _restore_memory_limit(previous_limit)
+
+
+# ワーカープロセスの本体: 自分のキューから依頼を受け取って順に実行します。
+def _worker_main(tasks, events):
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        _run_task(task, events)
+
+
+# --- 親プロセス側 ---
+
+class _Worker:
+    __slots__ = ("process", "tasks", "run_id", "deadline", "timeout")
+
+    def __init__(self, context, events):
+        self.tasks = context.SimpleQueue()
+        self.process = context.Process(target=_worker_main, args=(self.tasks, events), daemon=True)
+        self.process.start()
+        self.run_id = None # 実行中の依頼の番号
+        self.deadline = None
+        self.timeout = None
+
+
+class ExecutionPool:
+    def __init__(self, workers=None, on_event=None):
+        self.size = workers or os.cpu_count() or 1
+        self.on_event = on_event # on_event(種類, 実行の番号, ...) は監視スレッドから呼ばれる
+        # Qt のスレッドがあるプロセスで fork するのは危ないので、ワーカーは spawn で起動する
+        self.context = multiprocessing.get_context("spawn")
+        self.events = self.context.Queue()
+        self.workers = [] # 起動は最初の依頼のときまで遅らせる
+        self.waiting = deque() # 空いているワーカーを待っている依頼
+        self.results = {} # 実行の番号 -> RunResult
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.finished = threading.Condition(self.lock)
+        self.closed = False
+        self.monitor = None
+
+    # 実行を依頼し、実行の番号を返します。source は生成したコード全体、entry は呼び出す関数の名前です。
+    # line_blocks は行ごとの (フレームの位置, ブロックの番号) で、出力や計測をブロックに結び付けるのに使います。
+    def submit(self, source, entry, args=(), timeout=DEFAULT_TIMEOUT, memory_limit=DEFAULT_MEMORY_LIMIT, profile=False, line_blocks=()):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("ExecutionPool は閉じられています")
+            run_id = next(self.ids)
+            task = (run_id, source, entry, tuple(args), memory_limit, profile, list(line_blocks))
+            self.waiting.append((task, timeout))
+            self.start_monitor()
+            self.dispatch()
+        return run_id
+
+    # 結果が出るまで待って返します。
+    def wait(self, run_id, timeout=None):
+        with self.finished:
+            if not self.finished.wait_for(lambda: run_id in self.results, timeout):
+                raise TimeoutError(f"実行 {run_id} が終わっていません")
+            return self.results.pop(run_id)
+
+    # たくさんの実行をワーカーに並列に割り振り、すべての結果を依頼の順に返します。
+    # tasks は submit の引数の辞書の並びです。
+    def run_batch(self, tasks):
+        run_ids = [self.submit(**task) for task in tasks]
+        return [self.wait(run_id) for run_id in run_ids]
+
+    # 実行を取り消します。実行中ならワーカーを止めて起動し直します。
+    def cancel(self, run_id):
+        with self.lock:
+            for position, (task, _) in enumerate(self.waiting):
+                if task[0] == run_id:
+                    del self.waiting[position]
+                    self.finish(RunResult(run_id, CANCELLED))
+                    return
+            for worker in self.workers:
+                if worker.run_id == run_id:
+                    self.restart(worker, RunResult(run_id, CANCELLED))
+                    self.dispatch()
+                    return
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            for worker in self.workers:
+                if worker.run_id is None:
+                    worker.tasks.put(None)
+                else:
+                    worker.process.kill()
+        if self.monitor is not None:
+            self.monitor.join()
+        for worker in self.workers:
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.process.kill()
+
+    # --- 以下は lock を取ってから呼ぶ ---
+
+    def start_monitor(self):
+        if self.monitor is None:
+            self.monitor = threading.Thread(target=self.run_monitor, name="flair-executor", daemon=True)
+            self.monitor.start()
+
+    # 待っている依頼を空いているワーカーに渡します。ワーカーは必要になるまで起動しません。
+    def dispatch(self):
+        while self.waiting:
+            worker = next((worker for worker in self.workers if worker.run_id is None), None)
+            if worker is None:
+                if len(self.workers) >= self.size:
+                    return
+                worker = _Worker(self.context, self.events)
+                self.workers.append(worker)
+            task, timeout = self.waiting.popleft()
+            worker.run_id = task[0]
+            worker.timeout = timeout
+            worker.deadline = time.monotonic() + STARTUP_GRACE + (timeout or 0) if timeout else None
+            worker.tasks.put(task)
+
+    def finish(self, result):
+        self.results[result.run_id] = result
+        self.finished.notify_all()
+        self.notify(FINISHED, result.run_id, result)
+
+    def notify(self, kind, run_id, *data):
+        if self.on_event is not None:
+            self.on_event(kind, run_id, *data)
+
+    # ワーカーを止めて新しいワーカーに入れ替えます。実行中だった依頼は result で終わらせます。
+    def restart(self, worker, result):
+        worker.process.kill()
+        worker.process.join()
+        self.workers.remove(worker)
+        if not self.closed:
+            self.workers.append(_Worker(self.context, self.events))
+        self.finish(result)
+
+    # --- 監視スレッド ---
+
+    def run_monitor(self):
+        while True:
+            try:
+                event = self.events.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                event = None
+            with self.lock:
+                if event is not None:
+                    self.handle_event(event)
+                self.check_workers()
+                if self.closed and all(worker.run_id is None or not worker.process.is_alive() for worker in self.workers):
+                    return
+
+    def handle_event(self, event):
+        kind, run_id = event[0], event[1]
+        worker = next((worker for worker in self.workers if worker.run_id == run_id), None)
+        if worker is None:
+            return # 取り消した実行の残りのイベント
+        if kind == STARTED:
+            # 時間の上限は、ワーカーが実際に実行を始めたときから数える
+            worker.deadline = time.monotonic() + worker.timeout if worker.timeout else None
+            self.notify(STARTED, run_id)
+        elif kind == OUTPUT:
+            self.notify(OUTPUT, run_id, *event[2:])
+        elif kind == FINISHED:
+            worker.run_id = None
+            worker.deadline = None
+            self.finish(event[2])
+            self.dispatch()
+
+    # 時間の上限を過ぎたワーカーと、異常終了したワーカーを入れ替えます。
+    def check_workers(self):
+        now = time.monotonic()
+        for worker in list(self.workers):
+            if worker.run_id is None:
+                continue
+            if worker.deadline is not None and now > worker.deadline:
+                self.restart(worker, RunResult(worker.run_id, TIMEOUT, error=f"{worker.timeout:g} 秒の上限を超えました", elapsed=worker.timeout))
+            elif not worker.process.is_alive():
+                self.restart(worker, RunResult(worker.run_id, CRASHED, error=f"ワーカーが異常終了しました (終了コード {worker.process.exitcode})"))
+        self.dispatch()
+
+
+# --- コマンドライン ---
+
+def main(argv=None):
+    # スクリプトとして実行したときも、ワーカーとやり取りするクラスは executor モジュールのものを使う
+    import executor
+    from codegen import CodeGenerator
+    from document import Document
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="実行するドキュメント (.json / .flairb)")
+    parser.add_argument("--entry", default="frame_1", help="呼び出す関数の名前")
+    parser.add_argument("--inputs", help="引数のリストのリスト (JSON)。省略すると引数なしで1回だけ呼ぶ")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument("--memory-limit", type=int, default=DEFAULT_MEMORY_LIMIT // (1024 * 1024), help="ワーカーのメモリの上限 (MB)")
+    parser.add_argument("--profile", action="store_true", help="ブロックごとの実行回数と時間も出力する")
+    args = parser.parse_args(argv)
+
+    inputs = [[]]
+    if args.inputs:
+        with open(args.inputs, encoding="utf-8") as f:
+            inputs = json.load(f)
+
+    tasks = []
+    labels = []
+    for path in args.paths:
+        module = CodeGenerator().generate(Document.load(path))
+        for position, input_args in enumerate(inputs):
+            tasks.append({
+                "source": module.source, "entry": args.entry, "args": input_args, "timeout": args.timeout,
+                "memory_limit": args.memory_limit * 1024 * 1024, "profile": args.profile,
+                "line_blocks": module.line_map(),
+            })
+            labels.append((path, position))
+
+    pool = executor.ExecutionPool(args.jobs)
+    failed = False
+    try:
+        for (path, position), result in zip(labels, pool.run_batch(tasks)):
+            failed = failed or result.status != executor.OK
+            data = result.to_data()
+            if not args.profile:
+                del data["counts"], data["timings"]
+            print(json.dumps({"path": path, "input": position, **data}, ensure_ascii=False))
+    finally:
+        pool.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,403 @@
+"""フローチャート全体を画像 (PNG / SVG / PDF) に書き出します。
+
+キャンバス (メインバーの中身) を1枚の画像に描くと、フレームの多いドキュメントでは巨大な画像が必要になります。
+ここではウィジェットを使わずにドキュメントのモデルから配置を計算し、キャンバスを一定の大きさのタイルに分けて
+1枚ずつ描きます。描くのはタイルにかかるフレームとブロックだけです。
+    PNG : 横に並んだタイルの帯ごとに行を圧縮してファイルへ流し込みます。持つのはタイル1枚と帯1本の画素だけです
+    PDF : タイル1枚を1ページにします (QPdfWriter はページごとにファイルへ書き出す)
+    SVG : タイルごとに QSvgGenerator で描き、<g> としてファイルへ流し込みます。持つのはタイル1枚分の要素だけです
+QtGui だけを使い、ワーカースレッドからも、GUIのないコマンドラインからも使えます。
+    python maincode/export.py doc1.json doc2.flairb --format png --output-dir build/
+    python maincode/export.py docs/*.json --format pdf --jobs 4
+"""
+import argparse
+import html
+import os
+import struct
+import sys
+import threading
+import zlib
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PySide6.QtCore import QBuffer, QIODevice, QMarginsF, QObject, QPoint, QRect, QRectF, QSize, QSizeF, Qt, Signal
+from PySide6.QtGui import (
+    QBrush, QColor, QFont, QFontMetrics, QGuiApplication, QImage, QPageSize, QPainter, QPalette, QPdfWriter, QPen, QStaticText
+)
+from PySide6.QtSvg import QSvgGenerator
+
+import theme
+from connectors import ConnectorCache
+from document import Document, Frame
+from highlighter import rich_text
+from syntax import CODE_KINDS, tokenize_text
+
+FORMATS = ("png", "svg", "pdf")
+TILE_SIZE = 1024 # タイルの一辺 (ピクセル)
+MAX_STRIP_PIXELS = 1 << 22 # PNG の帯1本の画素数の上限。キャンバスがとても広いときは帯を低くする
+
+# --- キャンバスの配置 (メインバーの既定の見た目と同じ) ---
+CANVAS_MARGIN = 9 # メインバーの余白
+FRAME_SPACING = 6 # フレームの間隔
+FRAME_WIDTH = 300 # 幅を決めていないフレームの幅
+FRAME_MARGIN = 10 # フレームの枠からタイトルとブロックまで
+TITLE_HEIGHT = 30
+TITLE_PADDING = 5
+BLOCK_HEIGHT = 80
+BLOCK_SPACING = 10
+BLOCK_TOP = FRAME_MARGIN + TITLE_HEIGHT + BLOCK_SPACING # フレームの上端からブロック領域まで
+TEXT_INSET = 14 # ブロックの枠からテキストまで (枠 1 + エディターの余白 9 + テキストの余白 4)
+KIND_BORDER = 4 # if / while / for / function / return のブロックの左の線の太さ
+KIND_COLORS = {"if": theme.CONTROL_COLOR, "while": theme.CONTROL_COLOR, "for": theme.CONTROL_COLOR,
+               "function": theme.FUNCTION_COLOR, "return": theme.FUNCTION_COLOR}
+LINE_SEPARATOR = "\u2028" # QStaticText は "\n" では改行しない
+SVG_HEADER = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.2" baseProfile="tiny">
+<title>{title}</title>
+<rect x="0" y="0" width="{width}" height="{height}" fill="{background}"/>
+"""
+
+
+# 保存先の拡張子から形式を返します。分からなければ ValueError。
+def format_of(path):
+    suffix = Path(path).suffix.lower().lstrip(".")
+    if suffix not in FORMATS:
+        raise ValueError(f"書き出せない形式です: {Path(path).name} ({', '.join(FORMATS)} のどれかにしてください)")
+    return suffix
+
+
+# ドキュメントのフレームを、別のスレッドで読んでも構わない写しにします (GUIスレッドで呼びます)。
+# 中身はジャーナルと同じ flairb のバイト列で渡し、読み込んでいないフレームはデコードしません。
+def snapshot_frames(document):
+    frames = []
+    for frame in document.frames:
+        unread = frame.unread_source()
+        data, count = unread if unread is not None else (frame.to_binary(), len(frame))
+        copy = Frame.from_binary(data, count)
+        copy.width = frame.width
+        frames.append(copy)
+    return frames
+
+
+class CanvasRenderer:
+    """フレームの並びをキャンバスの配置で、指定した範囲だけ描きます。"""
+    def __init__(self, frames):
+        self.frames = frames
+        self.lefts = [] # フレームの位置 -> キャンバスでの左端
+        self.rights = []
+        x = CANVAS_MARGIN
+        height = 0
+        for frame in frames:
+            width = frame.width or FRAME_WIDTH
+            self.lefts.append(x)
+            self.rights.append(x + width)
+            x += width + FRAME_SPACING
+            height = max(height, self.frame_height(frame))
+        width = x - FRAME_SPACING + CANVAS_MARGIN if frames else 2 * CANVAS_MARGIN
+        self.size = QSize(width, height + 2 * CANVAS_MARGIN)
+        self.connectors = {} # フレームの位置 -> ConnectorCache
+        self.font = QFont()
+        self.text_color = QGuiApplication.palette().color(QPalette.ColorRole.Text)
+
+    @staticmethod
+    def frame_height(frame):
+        count = len(frame)
+        area_height = count * (BLOCK_HEIGHT + BLOCK_SPACING) - BLOCK_SPACING if count else 0
+        return BLOCK_TOP + area_height + FRAME_MARGIN
+
+    # キャンバスの座標の rect にかかるものを描きます。
+    # vector が True なら、タイルを切り取らずに重ねていく形式 (SVG) のために、前のタイルで描いたものを上から塗らないように
+    # 背景は描かず、フレームの枠はフレームの左上を含むタイル (フレームにかかる最初のタイル) でだけ描きます。
+    def render(self, painter, rect, vector=False):
+        if not vector:
+            painter.fillRect(rect, QColor(theme.MAINBAR_COLOR))
+        painter.setFont(self.font)
+        position = bisect_right(self.rights, rect.left())
+        while position < len(self.frames) and self.lefts[position] <= rect.right():
+            left = self.lefts[position]
+            painter.translate(left, CANVAS_MARGIN)
+            self.paint_frame(painter, position, rect.translated(-left, -CANVAS_MARGIN), vector)
+            painter.translate(-left, -CANVAS_MARGIN)
+            position += 1
+
+    # フレームを1つ描きます。clip はフレームの座標で描く範囲です。
+    def paint_frame(self, painter, position, clip, vector=False):
+        frame = self.frames[position]
+        width = self.rights[position] - self.lefts[position]
+        outline = QRect(0, 0, width, self.frame_height(frame))
+        if not outline.intersects(clip):
+            return
+        painter.setPen(QPen(QColor(theme.BORDER_COLOR)))
+        painter.setBrush(QBrush(QColor(theme.FRAME_COLOR)))
+        if not vector or clip.contains(outline.topLeft()):
+            painter.drawRoundedRect(QRectF(outline).adjusted(0.5, 0.5, -0.5, -0.5), 5, 5)
+
+        title = f"Frame {position + 1}"
+        title_width = QFontMetrics(self.font).horizontalAdvance(title) + 2 * (TITLE_PADDING + 1)
+        title_rect = QRect(FRAME_MARGIN + 1, FRAME_MARGIN + 1, title_width, TITLE_HEIGHT)
+        if title_rect.intersects(clip):
+            painter.drawRoundedRect(QRectF(title_rect).adjusted(0.5, 0.5, -0.5, -0.5), 5, 5)
+            painter.setPen(QColor(theme.TITLE_TEXT_COLOR))
+            painter.drawText(title_rect.adjusted(TITLE_PADDING + 1, 0, 0, 0), Qt.AlignmentFlag.AlignVCenter, title)
+
+        pitch = BLOCK_HEIGHT + BLOCK_SPACING
+        area = QRect(FRAME_MARGIN, BLOCK_TOP, width - 2 * (FRAME_MARGIN + 1), outline.height() - BLOCK_TOP - FRAME_MARGIN)
+        connectors = self.connectors.get(position)
+        if connectors is None:
+            connectors = self.connectors[position] = ConnectorCache()
+        painter.save()
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        connectors.paint_column(painter, frame, area, pitch, BLOCK_HEIGHT, clip)
+        painter.restore()
+
+        first = max(0, (clip.top() - area.top()) // pitch)
+        last = min(len(frame) - 1, (clip.bottom() - area.top()) // pitch)
+        for index in range(first, last + 1):
+            self.paint_block(painter, frame.blocks[index], QRect(area.left(), area.top() + index * pitch, area.width(), BLOCK_HEIGHT))
+
+    # ブロックを1つ描きます (QtBlock と同じ見た目)。
+    def paint_block(self, painter, block, rect):
+        painter.setPen(QPen(QColor(theme.BORDER_COLOR)))
+        painter.setBrush(QBrush(QColor(theme.BLOCK_COLOR)))
+        painter.drawRoundedRect(QRectF(rect).adjusted(0.5, 0.5, -0.5, -0.5), 4, 4)
+        kind_color = KIND_COLORS.get(block.kind)
+        if kind_color is not None:
+            painter.fillRect(QRect(rect.left(), rect.top(), KIND_BORDER, rect.height()), QColor(kind_color))
+        if not block.text:
+            return
+
+        text_rect = rect.adjusted(TEXT_INSET, TEXT_INSET, -TEXT_INSET, -TEXT_INSET)
+        if block.kind in CODE_KINDS:
+            text = QStaticText(rich_text(block.text, tokenize_text(block.text)))
+            text.setTextFormat(Qt.TextFormat.RichText)
+        else:
+            text = QStaticText(block.text.replace("\n", LINE_SEPARATOR))
+            text.setTextFormat(Qt.TextFormat.PlainText)
+        text.setTextWidth(text_rect.width())
+        painter.save()
+        if text.size().height() > text_rect.height():
+            painter.setClipRect(text_rect, Qt.ClipOperation.IntersectClip) # タイルの切り取りの中でさらに切り取る
+        painter.setPen(self.text_color)
+        painter.drawStaticText(text_rect.topLeft(), text)
+        painter.restore()
+
+
+# キャンバスを左上から、横に並んだ帯ごとにタイルへ分けます。
+def iter_tiles(size, tile_width, tile_height):
+    for top in range(0, size.height(), tile_height):
+        for left in range(0, size.width(), tile_width):
+            yield QRect(left, top, min(tile_width, size.width() - left), min(tile_height, size.height() - top))
+
+
+class PngWriter:
+    """行を上から順に受け取り、圧縮しながらPNGファイルに書き出します (画像全体をメモリに持ちません)。"""
+    SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+    def __init__(self, path, width, height):
+        self.file = open(path, "wb")
+        self.file.write(self.SIGNATURE)
+        self.write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) # 8ビットのRGB
+        self.compressor = zlib.compressobj(6)
+
+    # フィルターの種類 (0) を先頭に付けた行を並べたバイト列を書き出します。
+    def write_rows(self, rows):
+        data = self.compressor.compress(rows)
+        if data:
+            self.write_chunk(b"IDAT", data)
+
+    def close(self):
+        try:
+            self.write_chunk(b"IDAT", self.compressor.flush())
+            self.write_chunk(b"IEND", b"")
+        finally:
+            self.file.close()
+
+    def write_chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data)))
+
+
+class Cancelled(Exception):
+    pass
+
+
+# renderer のキャンバスを PNG に書き出します。帯の高さは MAX_STRIP_PIXELS に収まるように決めます。
+def export_png(renderer, path, tile_size, step):
+    size = renderer.size
+    strip_height = max(1, min(tile_size, MAX_STRIP_PIXELS // size.width()))
+    row_length = 1 + 3 * size.width()
+    writer = PngWriter(path, size.width(), size.height())
+    try:
+        tile = QImage(tile_size, strip_height, QImage.Format.Format_RGB888)
+        strip = bytearray(row_length * strip_height) # 各行の先頭はフィルターの種類 0 のまま
+        for rect in iter_tiles(size, tile_size, strip_height):
+            painter = QPainter(tile)
+            painter.translate(-rect.left(), -rect.top())
+            renderer.render(painter, rect)
+            painter.end()
+            bits = tile.constBits()
+            line = tile.bytesPerLine()
+            width = 3 * rect.width()
+            for y in range(rect.height()):
+                start = y * row_length + 1 + 3 * rect.left()
+                strip[start:start + width] = bits[y * line:y * line + width]
+            if rect.right() == size.width() - 1: # 帯の最後のタイル
+                writer.write_rows(bytes(strip[:row_length * rect.height()]))
+            step()
+    finally:
+        writer.close()
+
+
+# renderer のキャンバスを、タイル1枚を1ページにした PDF に書き出します。
+def export_pdf(renderer, path, tile_size, step):
+    writer = QPdfWriter(path)
+    writer.setResolution(72) # 1ピクセル = 1ポイント
+    writer.setPageMargins(QMarginsF(0, 0, 0, 0))
+    painter = None
+    try:
+        for rect in iter_tiles(renderer.size, tile_size, tile_size):
+            writer.setPageSize(QPageSize(QSizeF(rect.size()), QPageSize.Unit.Point))
+            if painter is None:
+                painter = QPainter(writer)
+            else:
+                writer.newPage()
+            painter.save()
+            painter.translate(-rect.left(), -rect.top())
+            renderer.render(painter, rect)
+            painter.restore()
+            step()
+    finally:
+        if painter is not None:
+            painter.end()
+
+
+# renderer のキャンバスを SVG に書き出します。
+# QSvgGenerator は end() まで本体を文字列で持つので、タイルごとに別の QSvgGenerator で描き、その中身をタイルの位置へ
+# ずらした <g> としてファイルへ順に書き出します。タイルの境目にかかるものは両方のタイルで同じに描き、切り取りはしません
+# (入れ子の <svg> や clip-path は Qt の SVG (Tiny 1.2) で表示できないため)。背景はファイルの先頭で1回だけ描きます。
+def export_svg(renderer, path, tile_size, step):
+    size = renderer.size
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(SVG_HEADER.format(width=size.width(), height=size.height(), title=html.escape(Path(path).stem), background=theme.MAINBAR_COLOR))
+        for rect in iter_tiles(size, tile_size, tile_size):
+            buffer = QBuffer()
+            buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+            generator = QSvgGenerator()
+            generator.setOutputDevice(buffer)
+            generator.setSize(rect.size())
+            generator.setViewBox(QRect(QPoint(0, 0), rect.size()))
+            painter = QPainter(generator)
+            painter.translate(-rect.left(), -rect.top())
+            renderer.render(painter, rect, vector=True)
+            painter.end()
+            tile = bytes(buffer.data()).decode("utf-8")
+            body = tile[tile.index(">", tile.index("<svg")) + 1:tile.rindex("</svg>")] # タイルのルート要素の中身
+            file.write(f'<g transform="translate({rect.left()},{rect.top()})">{body}</g>\n')
+            step()
+        file.write("</svg>\n")
+
+
+EXPORTERS = {"png": export_png, "pdf": export_pdf, "svg": export_svg}
+
+
+# フレームの並びを path に書き出します。形式は拡張子で決めます。
+# progress(0 - 100) は描いたタイルの割合で呼ばれ、cancel (threading.Event) が立つと途中でやめて書きかけのファイルを消します。
+def export_frames(frames, path, tile_size=TILE_SIZE, progress=None, cancel=None):
+    exporter = EXPORTERS[format_of(path)]
+    renderer = CanvasRenderer(frames)
+    size = renderer.size
+    total = -(-size.width() // tile_size) * -(-size.height() // tile_size)
+    done = 0
+
+    def step():
+        nonlocal done
+        if cancel is not None and cancel.is_set():
+            raise Cancelled()
+        done += 1
+        if progress is not None:
+            progress(min(100, done * 100 // max(1, total)))
+
+    try:
+        exporter(renderer, path, tile_size, step)
+    except Cancelled:
+        Path(path).unlink(missing_ok=True)
+        return False
+    return True
+
+
+class ExportJob(QObject):
+    """書き出しをワーカースレッドで行います。シグナルはGUIスレッドで受け取れます。"""
+    progress = Signal(int) # 0 - 100
+    finished = Signal(str) # 書き出したファイル
+    failed = Signal(str)
+
+    # document はGUIスレッドで写してから渡すので、書き出している間も編集できます。
+    def __init__(self, document, path, tile_size=TILE_SIZE, parent=None):
+        super().__init__(parent)
+        self.frames = snapshot_frames(document)
+        self.path = path
+        self.tile_size = tile_size
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        try:
+            if export_frames(self.frames, self.path, self.tile_size, self.progress.emit, self.cancel_event):
+                self.finished.emit(self.path)
+        except Exception as e: # ワーカーの例外はGUIスレッドに伝えないと進捗のダイアログが閉じない
+            self.failed.emit(str(e))
+
+
+# --- コマンドライン ---
+
+# 1つのドキュメントを書き出し、(入力のパス, 誤りのメッセージか None) を返します。
+def export_file(path, output, tile_size=TILE_SIZE):
+    QGuiApplication.instance() or QGuiApplication(["flair-export"]) # フォントを使うのに必要 (プロセスごとに1つ)
+    try:
+        export_frames(Document.load(path).frames, output, tile_size)
+    except Exception as e:
+        return path, str(e)
+    return path, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="書き出すドキュメント (.json / .flairb)")
+    parser.add_argument("--format", choices=FORMATS, default="png")
+    parser.add_argument("--output-dir", help="書き出すディレクトリ (省略すると入力と同じ場所に書き出す)")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help="タイルの一辺 (ピクセル)")
+    parser.add_argument("--jobs", type=int, default=1, help="並列に書き出すプロセスの数")
+    args = parser.parse_args(argv)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen") # 画面のない環境 (CI) でも動くように
+
+    outputs = []
+    for path in args.paths:
+        name = Path(path).stem + "." + args.format
+        outputs.append(str(Path(args.output_dir) / name) if args.output_dir else str(Path(path).with_name(name)))
+    if args.output_dir:
+        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    tile_sizes = [args.tile_size] * len(args.paths)
+
+    if args.jobs > 1:
+        # 親プロセスでは QGuiApplication を作らない (子プロセスがそれぞれ作る)
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            results = list(executor.map(export_file, args.paths, outputs, tile_sizes))
+    else:
+        results = [export_file(path, output, tile_size) for path, output, tile_size in zip(args.paths, outputs, tile_sizes)]
+
+    failed = False
+    for path, error in results:
+        if error is not None:
+            failed = True
+            print(f"{path}: {error}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
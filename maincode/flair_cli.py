@@ -0,0 +1,262 @@
+"""Flair のドキュメントをまとめて扱うコマンドライン (PySide6には依存しません)。
+
+ファイルかディレクトリ (中の .json / .flairb をすべて) を受け取り、1ファイルずつプロセスプールで処理して、
+結果を1ファイル1行のJSONで標準出力に順に書きます。1つでも失敗すれば終了コードは 1 です。
+    python maincode/flair_cli.py validate test_json/ docs/a.json
+    python maincode/flair_cli.py stats docs/ --jobs 8
+    python maincode/flair_cli.py convert docs/ --to flairb --output-dir build/    # json / flairb / py
+    python maincode/flair_cli.py normalize docs/ --check    # 保存したときと同じ形でなければ失敗
+    python maincode/flair_cli.py diff old.json new.json    # 構造の差分 (merge.py)
+    python maincode/flair_cli.py merge base.json ours.json theirs.json    # 3方向のマージ (結果は ours に書く)
+リポジトリの直下の flair (flair.bat) からも同じように実行できます。
+merge は git のマージドライバーとして使えます (衝突が残れば終了コード 1)。
+    git config merge.flair.driver "./flair merge %O %A %B"
+
+読めないファイルの問題には、ファイルの中の行と列 (1 から数える) を付けます。
+    {"path": "test_json/test.json", "ok": false, "problems": [{"frame": null, "block": null, "line": 1, "column": 1, ...}]}
+frame と block は 0 から数えた位置で、CodeSmith のサーバーの /documents/validate と同じ形です。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import doctools
+import flairb
+from codegen import CodeGenerator
+from doctools import DocumentError
+from document import Document
+from merge import Merger, diff_documents
+
+COMMANDS = ("validate", "stats", "convert", "normalize")
+SUFFIXES = (".json", flairb.SUFFIX)
+TARGETS = ("json", "flairb", "py") # convert で書き出せる形式
+CHUNKS_PER_JOB = 8 # 1つのプロセスに渡すファイルのまとまりの数 (の目安)
+
+
+# 引数のパスを処理するファイルの並びにします。ディレクトリはその下の .json / .flairb をすべて (名前順) 加えます。
+def collect_paths(paths):
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+            files.extend(os.path.join(root, name) for name in sorted(filenames) if name.lower().endswith(SUFFIXES))
+    return files
+
+
+# 問題の並びを、ファイルの中の位置を付けた辞書の並びにします。
+def problem_list(problems, locations=None):
+    if locations is None:
+        locations = [None] * len(problems)
+    return [
+        {
+            "frame": frame,
+            "block": block,
+            "line": location[0] if location else None,
+            "column": location[1] if location else None,
+            "message": message,
+        }
+        for (frame, block, message), location in zip(problems, locations)
+    ]
+
+
+# ファイルを読み、確かめてから (ドキュメント, JSONのバイト列) を返します。flairb ファイルのバイト列は None です。
+# 読めなければ DocumentError で、JSONのファイルなら問題ごとの位置 (locations) も付けます。
+# binary を指定すると、ファイル名によらずその形式として読みます。
+def load(path, binary=None):
+    if binary is None:
+        binary = flairb.is_binary_path(path)
+    if binary:
+        return doctools.load_file(path, True), None
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError as e:
+        raise DocumentError([(None, None, str(e))]) from e
+    try:
+        return doctools.load_text(raw), raw
+    except DocumentError as e:
+        if e.locations is None:
+            e.locations = doctools.locate_problems(raw.decode("utf-8"), e.problems)
+        raise
+
+
+# convert の書き出し先のパス
+def output_path(path, target, output_dir):
+    name = Path(path).stem + (flairb.SUFFIX if target == "flairb" else "." + target)
+    return str(Path(output_dir) / name) if output_dir else str(Path(path).with_name(name))
+
+
+def validate(path, document, raw, options):
+    return {"ok": True, "frames": len(document), "blocks": document.block_count()}
+
+
+def stats(path, document, raw, options):
+    return {"ok": True, **doctools.document_stats(document)}
+
+
+def convert(path, document, raw, options):
+    output = output_path(path, options.to, options.output_dir)
+    if os.path.abspath(output) == os.path.abspath(path):
+        return {"ok": False, "problems": problem_list([(None, None, f"変換先が入力と同じファイルです: {output}")])}
+    if options.to != "py":
+        document.save(output)
+        return {"ok": True, "output": output}
+    module = CodeGenerator().generate(document)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(module.source)
+    # 生成したコードの文法の誤りは、ブロックの位置と一緒に問題として返す (ファイルは書き出す)
+    errors = module.errors()
+    return {"ok": not errors, "output": output, "problems": problem_list(errors)}
+
+
+# 保存したときと同じ形 (Document.dumps / flairb) でなければ書き直します。--check のときは書かずに失敗にします。
+def normalize(path, document, raw, options):
+    if raw is None:
+        # flairb ファイルは読めた時点で保存したときと同じ形
+        return {"ok": True, "changed": False}
+    changed = document.dumps().encode("utf-8") != raw
+    if changed and not options.check:
+        document.save(path)
+    return {"ok": not (changed and options.check), "changed": changed}
+
+
+HANDLERS = {"validate": validate, "stats": stats, "convert": convert, "normalize": normalize}
+
+
+# diff / merge で読むファイル。git の一時ファイルには拡張子がないので、形式は先頭のマジックで決め、
+# 空のファイル (共通の祖先がないとき) は空のドキュメントにします。
+def load_revision(path):
+    try:
+        if os.path.getsize(path) == 0:
+            return Document(), False
+        binary = flairb.is_binary_file(path)
+    except OSError as e:
+        raise DocumentError([(None, None, str(e))]) from e
+    return load(path, binary)[0], binary
+
+
+# 読めないファイルがあれば、validate と同じ形の行を書いて False を返します。
+def load_revisions(paths):
+    documents = []
+    for path in paths:
+        try:
+            documents.append(load_revision(path))
+        except DocumentError as e:
+            print(json.dumps({"path": path, "ok": False, "problems": problem_list(e.problems, e.locations)}, ensure_ascii=False))
+            return None
+    return documents
+
+
+def run_diff(options):
+    revisions = load_revisions([options.old, options.new])
+    if revisions is None:
+        return 2
+    changed = False
+    for change in diff_documents(revisions[0][0], revisions[1][0]):
+        changed = True
+        print(json.dumps(change, ensure_ascii=False))
+    return 1 if changed else 0
+
+
+# 3方向にマージして output (省略すると ours) に書きます。衝突が残れば 1 を返します。
+# 形式は output の拡張子 (.json / .flairb) で決め、拡張子がなければ ours と同じ形式にします。
+def run_merge(options):
+    revisions = load_revisions([options.base, options.ours, options.theirs])
+    if revisions is None:
+        return 2
+    merger = Merger()
+    document = merger.merge(*(document for document, _ in revisions))
+    output = options.output or options.ours
+    binary = flairb.is_binary_path(output) if output.lower().endswith(SUFFIXES) else revisions[1][1]
+    document.save(output, binary)
+    conflicts = [{"frame": frame, "block": block} for frame, block in merger.conflicts]
+    print(json.dumps({"path": output, "ok": not conflicts, "conflicts": conflicts}, ensure_ascii=False))
+    return 1 if conflicts else 0
+
+
+# 1つのファイルを処理し、出力する1行の辞書を返します (ワーカープロセスで実行する)。
+def run_file(options, path):
+    result = {"path": path}
+    try:
+        document, raw = load(path)
+        result.update(HANDLERS[options.command](path, document, raw, options))
+    except DocumentError as e:
+        result.update(ok=False, problems=problem_list(e.problems, e.locations))
+    except (OSError, ValueError) as e:
+        result.update(ok=False, problems=problem_list([(None, None, str(e))]))
+    return result
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="flair", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    helps = {
+        "validate": "ドキュメントとして正しいかを確かめる",
+        "stats": "ブロックの数や種類ごとの数を出す",
+        "convert": "別の形式 (json / flairb / py) に変換する",
+        "normalize": "保存したときと同じ形に書き直す",
+    }
+    for command in COMMANDS:
+        sub = commands.add_parser(command, help=helps[command])
+        sub.add_argument("paths", nargs="+", help="ドキュメント (.json / .flairb) かディレクトリ")
+        sub.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="並列に処理するプロセスの数")
+        if command == "convert":
+            sub.add_argument("--to", choices=TARGETS, required=True, help="変換先の形式")
+            sub.add_argument("--output-dir", help="書き出すディレクトリ (省略すると入力と同じ場所に書き出す)")
+        if command == "normalize":
+            sub.add_argument("--check", action="store_true", help="書き直さずに、同じ形でないファイルを失敗にする")
+
+    sub = commands.add_parser("diff", help="2つのドキュメントの構造の差分を出す")
+    sub.add_argument("old")
+    sub.add_argument("new")
+    sub = commands.add_parser("merge", help="共通の祖先から3方向にマージする (git のマージドライバー)")
+    sub.add_argument("base", help="共通の祖先 (git の %%O)")
+    sub.add_argument("ours", help="こちらの版 (git の %%A)")
+    sub.add_argument("theirs", help="相手の版 (git の %%B)")
+    sub.add_argument("-o", "--output", help="結果を書き出すファイル (省略すると ours に書く)")
+    return parser
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    if options.command == "diff":
+        return run_diff(options)
+    if options.command == "merge":
+        return run_merge(options)
+    paths = collect_paths(options.paths)
+    if options.command == "convert" and options.output_dir:
+        Path(options.output_dir).mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    task = partial(run_file, options)
+    failed = 0
+    executor = None
+    if options.jobs > 1 and len(paths) > 1:
+        executor = ProcessPoolExecutor(max_workers=options.jobs)
+        chunksize = max(1, len(paths) // (options.jobs * CHUNKS_PER_JOB))
+        results = executor.map(task, paths, chunksize=chunksize)
+    else:
+        results = map(task, paths)
+    try:
+        # 結果はファイルの順に、できたものから1行ずつ書く
+        for result in results:
+            if not result["ok"]:
+                failed += 1
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    print(f"{options.command}: {len(paths)} files, {failed} failed ({time.perf_counter() - start:.2f} s)", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""Flairのバイナリ形式 (.flairb) の読み書き (PySide6には依存しません)。
+
+JSON形式は全体を解析し終えるまで中身を使えませんが、この形式は先頭の表に
+各フレームの位置が書いてあるので、開くときはファイルをmmapして表を読むだけで済みます。
+フレームの中身は、表示されるときに1フレームずつ読み出します。
+
+ファイルの構成 (数値はすべてリトルエンディアン):
+    ヘッダー   : マジック "FLRB", バージョン (u16), フラグ (u16, 未使用), フレーム数 (u32)
+    フレーム表 : フレームごとに 開始位置 (u64), バイト数 (u32), ブロック数 (u32)
+    フレーム   : ブロックごとに テキストのバイト数 (u32), テキスト (UTF-8),
+                 種類のバイト数 (u8), 種類 (UTF-8、種類のないブロックは0バイト)
+"""
+import mmap
+import os
+import struct
+
+SUFFIX = ".flairb"
+MAGIC = b"FLRB"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHI")
+_ENTRY = struct.Struct("<QII")
+_TEXT_LENGTH = struct.Struct("<I")
+MAX_KIND_LENGTH = 0xFF
+
+# JSONの文字列には対になっていないサロゲートも書けるので、そのまま往復できるようにする
+_TEXT_ERRORS = "surrogatepass"
+
+
+class FormatError(ValueError):
+    """flairb ファイルとして読めないときに送出されます。"""
+
+
+# ファイル名から flairb 形式かどうかを判定します。
+def is_binary_path(filepath):
+    return str(filepath).lower().endswith(SUFFIX)
+
+
+# ファイルの先頭のマジックから flairb 形式かどうかを判定します (git のマージの一時ファイルなど、拡張子のないファイル用)。
+def is_binary_file(filepath):
+    with open(filepath, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+# ブロックの並び (text と kind を持つオブジェクト) を1フレーム分のバイト列にします。
+def encode_blocks(blocks):
+    parts = []
+    for block in blocks:
+        text = block.text.encode("utf-8", _TEXT_ERRORS)
+        kind = block.kind.encode("utf-8") if block.kind else b""
+        if len(kind) > MAX_KIND_LENGTH:
+            raise FormatError(f"ブロックの種類が長すぎます: {block.kind!r}")
+        parts.append(_TEXT_LENGTH.pack(len(text)))
+        parts.append(text)
+        parts.append(bytes((len(kind),)))
+        parts.append(kind)
+    return b"".join(parts)
+
+
+# (フレームのバイト列, ブロック数) の並びをファイルに書き込みます。
+def dump(frames, f):
+    offset = _HEADER.size + _ENTRY.size * len(frames)
+    f.write(_HEADER.pack(MAGIC, VERSION, 0, len(frames)))
+    for payload, count in frames:
+        f.write(_ENTRY.pack(offset, len(payload), count))
+        offset += len(payload)
+    for payload, _ in frames:
+        f.write(payload)
+
+
+class FlairbFile:
+    """mmapした flairb ファイル。開くときに読むのはヘッダーとフレーム表だけです。"""
+
+    def __init__(self, filepath):
+        self.path = os.fspath(filepath)
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise FormatError("flairb ファイルではありません (ヘッダーがありません)")
+            # ファイルを閉じてもマップは残る
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, count = _HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise FormatError("flairb ファイルではありません (マジックが一致しません)")
+        if version != VERSION:
+            self.close()
+            raise FormatError(f"対応していないバージョンです: {version}")
+        table_end = _HEADER.size + _ENTRY.size * count
+        if table_end > size:
+            self.close()
+            raise FormatError("フレーム表が途中で切れています")
+
+        self.entries = list(_ENTRY.iter_unpack(self.map[_HEADER.size:table_end]))
+        for offset, length, _ in self.entries:
+            if offset < table_end or offset + length > size:
+                self.close()
+                raise FormatError("フレームの位置がファイルの範囲外です")
+
+    def __len__(self):
+        return len(self.entries)
+
+    # 各フレームの読み出し元を、ファイル内の順に返します。
+    def frames(self):
+        return [FrameSource(self, offset, length, count) for offset, length, count in self.entries]
+
+    # マップを閉じます。閉じた後はまだ読んでいないフレームを読めません。
+    def close(self):
+        if not self.map.closed:
+            self.map.close()
+
+
+class FrameSource:
+    """flairb ファイルの中の1フレーム。decode() を呼ぶまで中身は読みません。"""
+    __slots__ = ("file", "offset", "length", "count")
+
+    def __init__(self, file, offset, length, count):
+        self.file = file
+        self.offset = offset
+        self.length = length
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    # フレームのバイト列をそのまま返します (変更のないフレームを保存し直すときに使う)。
+    def raw(self):
+        return self.file.map[self.offset:self.offset + self.length]
+
+    # フレームの中身を読み、(テキスト, 種類) の並びを返します。
+    def decode(self):
+        return decode_blocks(self.raw(), self.count)
+
+
+# 1フレーム分のバイト列 (encode_blocks の結果) から、(テキスト, 種類) の並びを返します。
+def decode_blocks(data, count):
+    blocks = []
+    kinds = {} # 種類はほとんど同じ値なので、同じ文字列を使い回す
+    pos = 0
+    try:
+        for _ in range(count):
+            (text_length,) = _TEXT_LENGTH.unpack_from(data, pos)
+            pos += _TEXT_LENGTH.size
+            text = data[pos:pos + text_length].decode("utf-8", _TEXT_ERRORS)
+            pos += text_length
+            kind_length = data[pos]
+            pos += 1
+            kind = None
+            if kind_length:
+                kind_bytes = data[pos:pos + kind_length]
+                kind = kinds.get(kind_bytes)
+                if kind is None:
+                    kind = kinds[kind_bytes] = kind_bytes.decode("utf-8")
+                pos += kind_length
+            blocks.append((text, kind))
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise FormatError(f"フレームのデータが壊れています: {e}") from e
+    if pos != len(data):
+        raise FormatError("フレームのデータの長さが一致しません")
+    return blocks
@@ -0,0 +1,110 @@
+"""ブロックの種類からフローチャートの構造を求めます (PySide6に依存しません)。
+
+ブロックは上から順に実行される文で、種類によって次のように扱います。
+    if / while / for : ブロックのテキストが条件。直後の構造 (1ブロック、または入れ子の制御ブロック) が本体。
+    true             : if の直後に置くと、真のときの本体の目印になる (省略可)。
+    false            : if の本体の直後に置くと、偽のときの本体 (else) の目印になる。
+    return           : ここで処理が終わり、次のブロックへは進まない。
+    function         : 関数の宣言。それ以外の種類と同じく、次のブロックへ進む。
+種類のないブロック (None) は普通の文です。
+"""
+
+BLOCK_KINDS = ("none", "if", "while", "for", "true", "false", "return", "function")
+LOOP_KINDS = ("while", "for")
+CONTROL_KINDS = ("if",) + LOOP_KINDS
+
+# --- 接続線の種類 ---
+NEXT = "next" # 次のブロックへ
+BRANCH = "branch" # if の条件が偽のときの分岐
+SKIP = "skip" # 本体を飛ばして後ろへ (ループの出口、then の終わり)
+LOOP = "loop" # ループの先頭へ戻る
+
+
+# 各ブロックから始まる構造が、どのブロックで終わるかを返します。
+# 後ろから1回たどるだけなので、ブロック数に比例した時間で求まります。
+def construct_ends(kinds):
+    n = len(kinds)
+    ends = list(range(n))
+    for i in range(n - 2, -1, -1):
+        kind = kinds[i]
+        if kind in LOOP_KINDS:
+            ends[i] = ends[i + 1]
+        elif kind == "if":
+            then_start = then_body_start(kinds, i)
+            then_end = ends[then_start]
+            else_start = else_body_start(kinds, then_end)
+            ends[i] = ends[else_start] if else_start is not None else then_end
+    return ends
+
+
+# if の本体 (then) が始まるブロックを返します。true の目印があれば飛ばします。
+def then_body_start(kinds, index):
+    start = index + 1
+    if kinds[start] == "true" and start + 1 < len(kinds):
+        start += 1
+    return start
+
+
+# then の本体の後ろに false の目印があれば、else の本体が始まるブロックを返します。
+def else_body_start(kinds, then_end):
+    marker = then_end + 1
+    if marker + 1 < len(kinds) and kinds[marker] == "false":
+        return marker + 1
+    return None
+
+
+# ブロック間の接続線を (元, 先, 種類) のリストで返します。
+def build_edges(kinds):
+    n = len(kinds)
+    ends = construct_ends(kinds)
+    edges = []
+
+    def connect(source, target, edge_kind=None):
+        if target is None:
+            return
+        if edge_kind is None:
+            if target == source + 1:
+                edge_kind = NEXT
+            elif target <= source:
+                edge_kind = LOOP
+            else:
+                edge_kind = SKIP
+        edges.append((source, target, edge_kind))
+
+    # (構造の先頭, 構造が終わった後に進むブロック) を順に処理する
+    work = []
+    index = 0
+    while index < n:
+        after = ends[index] + 1
+        work.append((index, after if after < n else None))
+        index = after
+    work.reverse()
+
+    while work:
+        start, after = work.pop()
+        kind = kinds[start]
+        is_control = kind in CONTROL_KINDS and start + 1 < n
+
+        if is_control and kind in LOOP_KINDS:
+            connect(start, start + 1)
+            connect(start, after) # ループの出口
+            work.append((start + 1, start)) # 本体の後はループの先頭へ戻る
+        elif is_control:
+            then_start = then_body_start(kinds, start)
+            if then_start != start + 1:
+                connect(start, start + 1) # true の目印
+                connect(start + 1, then_start)
+            else:
+                connect(start, then_start)
+            else_start = else_body_start(kinds, ends[then_start])
+            if else_start is not None:
+                connect(start, else_start - 1, BRANCH) # false の目印へ
+                connect(else_start - 1, else_start)
+                work.append((else_start, after))
+            else:
+                connect(start, after, BRANCH)
+            work.append((then_start, after))
+        elif kind != "return":
+            connect(start, after)
+
+    return edges
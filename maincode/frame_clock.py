@@ -0,0 +1,45 @@
+"""表示フレームごとに1回だけ処理をまとめて実行するための仕組み。
+
+マウスの移動やタイマーのたびにレイアウトをやり直すと、1回の描画の間に
+何度も同じ計算をすることになります。FrameClock に登録した処理は、
+次の表示フレーム (約16ms後) にまとめて1回だけ実行されます。
+"""
+from PySide6.QtCore import QTimer
+
+FRAME_INTERVAL_MS = 16
+
+
+class FrameClock:
+    def __init__(self, interval_ms=FRAME_INTERVAL_MS):
+        self.pending = {} # キー -> 処理 (同じキーの処理は最後に登録したものだけが残る)
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.flush)
+
+    # 次の表示フレームで callback を実行するように登録します。
+    def request(self, key, callback):
+        self.pending[key] = callback
+        if not self.timer.isActive():
+            self.timer.start()
+
+    # 登録されている処理を取り消します。
+    def cancel(self, key):
+        self.pending.pop(key, None)
+
+    # 登録されている処理をすぐに実行します。
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        for callback in pending.values():
+            callback()
+
+
+_shared_clock = None
+
+
+# アプリ全体で共有するFrameClockを返します。
+def shared_clock():
+    global _shared_clock
+    if _shared_clock is None:
+        _shared_clock = FrameClock()
+    return _shared_clock
@@ -0,0 +1,93 @@
+"""コードを持つブロックの色付け。
+
+ブロック (QtBlock) は描くときに shared_highlights().tokens(block) でトークンを引きます。
+キャッシュになければ syntax.SyntaxCache のスレッドで解析し、その間は色なしで描いて、
+できたらそのブロックだけを描き直します。描かれるのは見えているブロックだけなので、
+ファイルを開いたときに解析するのも見えているブロックだけで、残りはスクロールして見えたときに解析します。
+
+編集中のブロックは共有のエディター (block_editor.BlockEditor) の CodeHighlighter で色を付けます。
+QSyntaxHighlighter は変更された行 (と、三重引用符の状態が変わった後ろの行) だけを色付けし直し、
+1行ごとの結果は syntax.tokenize_line が覚えているので、変わっていない行は区切り直しません。
+"""
+import html
+import weakref
+
+from PySide6.QtCore import QObject, Signal
+from PySide6.QtGui import QColor, QSyntaxHighlighter, QTextCharFormat
+
+import theme
+from syntax import CODE_KINDS, SyntaxCache, text_key, tokenize_line
+
+
+# テキストを、トークンに色を付けた QStaticText 用のリッチテキストにします (空白と改行はそのまま)。
+def rich_text(text, lines):
+    parts = []
+    for line, tokens in zip(text.split("\n"), lines):
+        if parts:
+            parts.append("<br>")
+        position = 0
+        for start, length, kind in tokens:
+            parts.append(html.escape(line[position:start]))
+            parts.append(f'<span style="color:{theme.SYNTAX_COLORS[kind]}">{html.escape(line[start:start + length])}</span>')
+            position = start + length
+        parts.append(html.escape(line[position:]))
+    return '<span style="white-space:pre-wrap">' + "".join(parts) + "</span>"
+
+
+class BlockHighlights(QObject):
+    ready = Signal(object) # 解析が終わったテキストのキーの並び (スレッドから送られ、GUIスレッドで受け取る)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cache = SyntaxCache(on_ready=self.ready.emit)
+        self.waiting = {} # キー -> 解析を待っているブロック
+        self.ready.connect(self.on_ready)
+        self.cache.start()
+
+    # ブロックのテキストの行ごとのトークンを返します。まだなければ None を返し、できたらブロックを描き直します。
+    def tokens(self, block):
+        key = text_key(block.text)
+        tokens = self.cache.request(block.text, key)
+        if tokens is None:
+            self.waiting.setdefault(key, weakref.WeakSet()).add(block)
+        return tokens
+
+    def on_ready(self, keys):
+        for key in keys:
+            for block in self.waiting.pop(key, ()):
+                block.refresh_preview()
+
+
+_shared_highlights = None
+
+
+# アプリ全体で共有するBlockHighlightsを返します。
+def shared_highlights():
+    global _shared_highlights
+    if _shared_highlights is None:
+        _shared_highlights = BlockHighlights()
+    return _shared_highlights
+
+
+class CodeHighlighter(QSyntaxHighlighter):
+    """共有のエディターで、コードを持つブロックのテキストに色を付けます。"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.formats = {}
+        for kind, color in theme.SYNTAX_COLORS.items():
+            text_format = QTextCharFormat()
+            text_format.setForeground(QColor(color))
+            self.formats[kind] = text_format
+
+    # ブロックの種類に合わせて、エディターのテキストに色を付けるかどうかを切り替えます。
+    def set_kind(self, kind, document):
+        target = document if kind in CODE_KINDS else None
+        if self.document() is not target:
+            self.setDocument(target)
+
+    def highlightBlock(self, line):
+        state = max(self.previousBlockState(), 0)
+        tokens, state = tokenize_line(line, state)
+        for start, length, kind in tokens:
+            self.setFormat(start, length, self.formats[kind])
+        self.setCurrentBlockState(state)
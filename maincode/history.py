@@ -0,0 +1,248 @@
+"""元に戻す・やり直しの履歴 (PySide6には依存しません)。
+
+履歴には変更の差分だけを入れます。テキストの変更は変わった範囲 (開始位置、消した文字列、入れた文字列) で持ち、
+同じブロックへの続けての入力は1つのコマンドにまとめます。ファイルを開いたときだけは、
+開く前のドキュメントをそのまま持ちます (ドキュメントの入れ替えなので、戻すのは参照の付け替えだけです)。
+
+コマンドは undo(editor) / redo(editor) で editor (FlairApp) の操作を呼び出し、
+モデル・ウィジェット・ジャーナルの更新は editor に任せます。editor が持つ操作:
+    append_frame(frame) / remove_last_frame()
+    append_block(frame_index, block) / remove_last_block(frame_index)
+    block_text(frame_index, index) / set_block_text(frame_index, index, text, cursor)
+    set_frame_width(frame_index, width)
+    replace_document(document)
+
+履歴全体のおおよそのメモリ使用量が memory_budget を超えたら、古いコマンドから捨てます。
+"""
+import time
+from collections import deque
+
+DEFAULT_MEMORY_BUDGET = 32 * 1024 * 1024
+COALESCE_SECONDS = 1.0 # この時間より間を空けずに続けた入力は、1回の操作として元に戻す
+COMMAND_OVERHEAD = 64 # メモリ使用量の見積もりで、コマンド1つに加えるバイト数
+
+
+# old から new への変更を (開始位置, 消した文字列, 入れた文字列) で返します。
+def text_diff(old, new):
+    start = 0
+    limit = min(len(old), len(new))
+    while start < limit and old[start] == new[start]:
+        start += 1
+    old_end = len(old)
+    new_end = len(new)
+    while old_end > start and new_end > start and old[old_end - 1] == new[new_end - 1]:
+        old_end -= 1
+        new_end -= 1
+    return start, old[start:old_end], new[start:new_end]
+
+
+# text の start から removed を inserted に置き換えた文字列を返します。
+def apply_diff(text, start, removed, inserted):
+    return text[:start] + inserted + text[start + len(removed):]
+
+
+class AddFrame:
+    __slots__ = ("frame",)
+
+    def __init__(self, frame):
+        self.frame = frame # 追加したフレーム (document.Frame)。やり直すときに同じものを戻す
+
+    def size(self):
+        return COMMAND_OVERHEAD
+
+    def undo(self, editor):
+        editor.remove_last_frame()
+
+    def redo(self, editor):
+        editor.append_frame(self.frame)
+
+
+class AddBlock:
+    __slots__ = ("frame", "block")
+
+    def __init__(self, frame, block=None):
+        self.frame = frame # フレームの番号
+        self.block = block # 元に戻したときに取り除いたブロック (document.Block)
+
+    def size(self):
+        return COMMAND_OVERHEAD + (len(self.block.text) if self.block is not None else 0)
+
+    def undo(self, editor):
+        self.block = editor.remove_last_block(self.frame)
+
+    def redo(self, editor):
+        editor.append_block(self.frame, self.block)
+        self.block = None
+
+
+class EditText:
+    __slots__ = ("frame", "index", "start", "removed", "inserted", "time")
+
+    def __init__(self, frame, index, old_text, new_text):
+        self.frame = frame
+        self.index = index
+        self.start, self.removed, self.inserted = text_diff(old_text, new_text)
+        self.time = time.monotonic()
+
+    def size(self):
+        return COMMAND_OVERHEAD + len(self.removed) + len(self.inserted)
+
+    # 続けて入力した変更 (other) をこのコマンドにまとめます。まとめられなければ False を返します。
+    def merge(self, other):
+        if other.frame != self.frame or other.index != self.index or other.time - self.time > COALESCE_SECONDS:
+            return False
+        # 2つの変更が触れている区間 (このコマンドの変更後のテキストでの位置) の中身を、
+        # このコマンドで入れた文字列と other で消した文字列から組み立てる
+        inserted_end = self.start + len(self.inserted)
+        removed_end = other.start + len(other.removed)
+        first = min(self.start, other.start)
+        last = max(inserted_end, removed_end)
+        span = [None] * (last - first)
+        span[self.start - first:inserted_end - first] = self.inserted
+        span[other.start - first:removed_end - first] = other.removed
+        if None in span:
+            return False # 2つの変更の間に、どちらも触れていない文字がある (離れた場所の編集)
+        span = "".join(span)
+
+        old_span = span[:self.start - first] + self.removed + span[inserted_end - first:]
+        new_span = apply_diff(span, other.start - first, other.removed, other.inserted)
+        start, self.removed, self.inserted = text_diff(old_span, new_span)
+        self.start = first + start
+        self.time = other.time
+        return True
+
+    def undo(self, editor):
+        text = editor.block_text(self.frame, self.index)
+        text = apply_diff(text, self.start, self.inserted, self.removed)
+        editor.set_block_text(self.frame, self.index, text, self.start + len(self.removed))
+
+    def redo(self, editor):
+        text = editor.block_text(self.frame, self.index)
+        text = apply_diff(text, self.start, self.removed, self.inserted)
+        editor.set_block_text(self.frame, self.index, text, self.start + len(self.inserted))
+
+
+class EditGroup:
+    __slots__ = ("commands",)
+
+    def __init__(self, commands):
+        self.commands = commands # まとめて1回で元に戻すコマンド (文書全体の置換など)
+
+    def size(self):
+        return COMMAND_OVERHEAD + sum(command.size() for command in self.commands)
+
+    def undo(self, editor):
+        for command in reversed(self.commands):
+            command.undo(editor)
+
+    def redo(self, editor):
+        for command in self.commands:
+            command.redo(editor)
+
+
+class ResizeFrames:
+    __slots__ = ("changes",)
+
+    def __init__(self, changes):
+        self.changes = changes # (フレームの番号, 前の幅, 後の幅) の並び
+
+    def size(self):
+        return COMMAND_OVERHEAD * len(self.changes)
+
+    def undo(self, editor):
+        for frame, old_width, _ in self.changes:
+            editor.set_frame_width(frame, old_width)
+
+    def redo(self, editor):
+        for frame, _, new_width in self.changes:
+            editor.set_frame_width(frame, new_width)
+
+
+class LoadDocument:
+    __slots__ = ("old", "new", "old_size")
+
+    def __init__(self, old, new):
+        self.old = old # 開く前のドキュメント
+        self.new = new # 開いたドキュメント (読み込み中はフレームが増えていく)
+        self.old_size = old.estimated_size()
+
+    def size(self):
+        # 開いたドキュメントは画面に表示されている間は履歴がなくても残るので、開く前の分だけ数える
+        return COMMAND_OVERHEAD + self.old_size
+
+    def undo(self, editor):
+        editor.replace_document(self.old)
+
+    def redo(self, editor):
+        editor.replace_document(self.new)
+
+
+class History:
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self.undo_stack = deque() # 左が古いコマンド
+        self.redo_stack = []
+        self.size = 0 # 両方のスタックのコマンドの見積もりの合計
+        self.can_merge = False # 次の EditText を直前のコマンドにまとめてよいか
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    # 実行済みの操作を履歴に加えます。やり直しの履歴は捨てます。
+    def push(self, command):
+        for dropped in self.redo_stack:
+            self.size -= dropped.size()
+        self.redo_stack.clear()
+
+        top = self.undo_stack[-1] if self.undo_stack else None
+        if self.can_merge and isinstance(top, EditText) and isinstance(command, EditText):
+            before = top.size()
+            if top.merge(command):
+                self.size += top.size() - before
+                return
+        self.undo_stack.append(command)
+        self.size += command.size()
+        self.can_merge = True
+        self.evict()
+
+    def undo(self, editor):
+        if not self.undo_stack:
+            return False
+        command = self.undo_stack.pop()
+        before = command.size()
+        command.undo(editor)
+        self.size += command.size() - before
+        self.redo_stack.append(command)
+        self.can_merge = False
+        self.evict()
+        return True
+
+    def redo(self, editor):
+        if not self.redo_stack:
+            return False
+        command = self.redo_stack.pop()
+        before = command.size()
+        command.redo(editor)
+        self.size += command.size() - before
+        self.undo_stack.append(command)
+        self.can_merge = False
+        return True
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.size = 0
+        self.can_merge = False
+
+    # 見積もりが予算を超えている間、いちばん古いコマンドから捨てます。
+    # 直前のコマンドだけは、予算を超えていても元に戻せるように残します。
+    def evict(self):
+        while self.size > self.memory_budget and len(self.undo_stack) + len(self.redo_stack) > 1:
+            if self.undo_stack:
+                dropped = self.undo_stack.popleft()
+            else:
+                dropped = self.redo_stack.pop(0) # いちばん先のやり直し
+            self.size -= dropped.size()
@@ -0,0 +1,50 @@
+"""クリックされた位置からフレームとブロックを引く索引。
+
+フレームはメインバーに左から順に並び、重ならないので、左端の位置の並びを二分探索すれば
+O(log フレーム数) でフレームが決まります。フレームの中のブロックは番号から位置を計算して
+並べているので、ブロックは割り算1回で求まります (QtFrame.block_at)。
+ウィジェットを widgetAt で探して親をたどる必要はありません。
+
+位置はキャンバス (メインバーのスクロール領域の中身のウィジェット) の座標です。
+フレームの移動やサイズ変更で invalidate() され、次に引くときに作り直します。
+"""
+from bisect import bisect_right
+
+from PySide6.QtCore import QPoint
+
+
+class HitTestIndex:
+    def __init__(self, frames):
+        self.frames = frames # 左から順のQtFrameのリスト (FlairApp.frames をそのまま参照する)
+        self.lefts = [] # 各フレームの左端 (二分探索用)
+        self.rects = [] # 各フレームの (左, 上, 右, 下)
+        self.dirty = True
+
+    # フレームの位置が変わったときに呼びます。
+    def invalidate(self):
+        self.dirty = True
+
+    def rebuild(self):
+        self.lefts = []
+        self.rects = []
+        for frame in self.frames:
+            rect = frame.geometry()
+            self.lefts.append(rect.left())
+            self.rects.append((rect.left(), rect.top(), rect.right(), rect.bottom()))
+        self.dirty = False
+
+    # キャンバスの座標の点にある (フレーム, ブロック番号) を返します。
+    # フレームの外なら (None, None)、フレームの中でもブロックの外ならブロック番号は None です。
+    def hit(self, point):
+        if self.dirty:
+            self.rebuild()
+        x = point.x()
+        y = point.y()
+        position = bisect_right(self.lefts, x) - 1
+        if position < 0:
+            return None, None
+        left, top, right, bottom = self.rects[position]
+        if x > right or y < top or y > bottom:
+            return None, None
+        frame = self.frames[position]
+        return frame, frame.block_at(QPoint(x - left, y - top))
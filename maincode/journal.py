@@ -0,0 +1,335 @@
+"""編集操作のジャーナルによる自動保存と、異常終了した後の復元 (PySide6には依存しません)。
+
+GUIスレッドは操作 (フレームの追加、ブロックの追加、テキストの変更、幅の変更) を
+キューに入れるだけで、ファイルへの書き込みはすべて書き込みスレッドで行います。
+書き込みスレッドは操作を少しの間ためてから、追記専用のジャーナル (1行1操作のJSON) に
+まとめて書き込みます。同じブロックへの続けての入力は、最後のテキストだけを書きます。
+元に戻す操作も、ブロックやフレームを取り除く操作としてジャーナルに書きます。
+
+書き込みスレッドは操作を自分のドキュメント (GUIのドキュメントとは別のもの) にも反映していて、
+操作が COMPACT_OPS 個たまると、それを flairb 形式のスナップショットとして書き出し、
+ジャーナルを空にします。どちらも一時ファイルに書いてから置き換えるので、
+途中で止まっても前の状態のファイルが残ります。
+
+ジャーナルはタブごとに、保存先の下の tab-<番号> ディレクトリに書きます。
+ディレクトリの中身:
+    snapshot-<番号>.flairb : <番号> 番目の操作までを反映したドキュメント
+    journal.log            : 先頭はスナップショットの番号とフレームの幅、その後に操作が続く
+"""
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+import flairb
+from document import Block, Document, Frame, atomic_write, iter_file_frames, normalize_kind
+
+JOURNAL_NAME = "journal.log"
+SNAPSHOT_PREFIX = "snapshot-"
+TAB_PREFIX = "tab-"
+FLUSH_INTERVAL = 0.5 # 最初の操作からこの時間 (秒) だけ待って、続く操作をまとめて書く
+COMPACT_OPS = 2000 # この数の操作を書いたら、スナップショットにまとめる
+
+# --- 操作の種類 ---
+ADD_FRAME = "add_frame"
+ADD_BLOCK = "add_block"
+POP_BLOCK = "pop_block" # 末尾のブロックを取り除く (ブロックの追加を元に戻したとき)
+SET_TEXT = "set_text"
+RESIZE = "resize"
+TRUNCATE = "truncate" # 読み込みの中止や失敗で、フレームが途中までしか追加されなかったとき
+SNAPSHOT = "snapshot" # ジャーナルの先頭行
+
+# 書き込みスレッドへの指示 (ジャーナルには書かない)
+_RESET = "reset"
+_CLOSE = "close"
+
+
+# 既定の保存先 (ユーザーごと) を返します。
+def default_recovery_dir():
+    return Path.home() / ".flair" / "recovery"
+
+
+# 前回、正常に終了しなかったときの編集内容が残っているかを返します。
+def has_recovery(directory):
+    return (Path(directory) / JOURNAL_NAME).exists()
+
+
+# 保存先の中で、前回の編集内容が残っているジャーナルのディレクトリを、タブの順に返します。
+# 保存先そのものに残っているもの (タブごとに分ける前のジャーナル) は先頭にします。
+def recovery_dirs(directory):
+    directory = Path(directory)
+    tabs = [path for path in directory.glob(TAB_PREFIX + "*") if path.name[len(TAB_PREFIX):].isdigit() and has_recovery(path)]
+    tabs.sort(key=lambda path: int(path.name[len(TAB_PREFIX):]))
+    return ([directory] if has_recovery(directory) else []) + tabs
+
+
+# 保存先の中で、まだ使われていないタブのジャーナルのディレクトリを返します。
+def new_journal_dir(directory):
+    number = 0
+    while (Path(directory) / f"{TAB_PREFIX}{number}").exists():
+        number += 1
+    return Path(directory) / f"{TAB_PREFIX}{number}"
+
+
+# 残っている編集内容を削除します。ディレクトリが空になれば、ディレクトリも消します。
+def discard_recovery(directory):
+    directory = Path(directory)
+    for path in [directory / JOURNAL_NAME, *directory.glob(SNAPSHOT_PREFIX + "*")]:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+    try:
+        directory.rmdir()
+    except OSError:
+        pass
+
+
+# スナップショットとジャーナルからドキュメントを組み立て、(ドキュメント, 最後の操作の番号) を返します。
+def read_recovery(directory):
+    directory = Path(directory)
+    document = Document()
+    seq = 0
+    snapshots = sorted(directory.glob(SNAPSHOT_PREFIX + "*" + flairb.SUFFIX))
+    if snapshots:
+        latest = snapshots[-1]
+        seq = int(latest.stem[len(SNAPSHOT_PREFIX):])
+        document = load_document(latest)
+
+    last = seq
+    for op in read_journal(directory / JOURNAL_NAME):
+        kind = op["op"]
+        if kind == SNAPSHOT:
+            for frame, width in op["widths"]:
+                apply_width(document, frame, width)
+        elif kind == RESIZE:
+            # 幅は何度設定しても同じ結果になるので、スナップショットより前のものも使う
+            # (スナップショットを書いた直後、ジャーナルを作り直す前に止まった場合の幅も残る)
+            apply_width(document, op["frame"], op["width"])
+            last = max(last, op["seq"])
+        elif op["seq"] > seq:
+            apply_op(document, op)
+            last = op["seq"]
+    return document, last
+
+
+# ジャーナルの操作を順に返します。最後の行が書きかけで読めなければ、そこで終わります。
+def read_journal(path):
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            try:
+                op = json.loads(line)
+            except ValueError:
+                return
+            yield op
+
+
+# ファイルを読み、全フレームの中身まで読み込んだドキュメントを返します。
+# 途中で読めなくなったときは、そこまでのフレームを返します (ローダーで表示されるフレームと同じ)。
+def load_document(filepath):
+    document = Document()
+    try:
+        for frame, _ in iter_file_frames(filepath):
+            frame.blocks # 元のファイルが後で書き換えられても困らないように、ここで読んでおく
+            document.frames.append(frame)
+    except (OSError, ValueError) as e:
+        print(f"ジャーナル: {filepath} を途中までしか読めませんでした: {e}", file=sys.stderr)
+    return document
+
+
+# 操作を1つドキュメントに反映します。
+def apply_op(document, op):
+    kind = op["op"]
+    if kind == ADD_FRAME:
+        document.add_frame()
+    elif kind == ADD_BLOCK:
+        document.frames[op["frame"]].append_block(op["text"], op["kind"])
+    elif kind == POP_BLOCK:
+        document.frames[op["frame"]].pop_block()
+    elif kind == SET_TEXT:
+        document.frames[op["frame"]].set_text(op["block"], op["text"])
+    elif kind == RESIZE:
+        apply_width(document, op["frame"], op["width"])
+    elif kind == TRUNCATE:
+        del document.frames[op["count"]:]
+
+
+def apply_width(document, frame, width):
+    if frame < len(document.frames):
+        document.frames[frame].width = width
+
+
+# フレームの中身を、書き込みスレッドに渡せる形にします (GUIスレッドで呼びます)。
+# まだ読んでいない flairb のフレームはバイト列のまま渡し、読み込み済みのものはエンコードせずにテキストと種類を写します。
+def frame_snapshot(frame):
+    unread = frame.unread_source()
+    if unread is not None:
+        return unread
+    return [(block.text, block.kind) for block in frame.blocks]
+
+
+# frame_snapshot の結果からフレームを作ります (書き込みスレッドで呼びます)。
+def snapshot_frame(snapshot):
+    if isinstance(snapshot, tuple):
+        return Frame.from_binary(*snapshot)
+    return Frame([Block(text, kind) for text, kind in snapshot])
+
+
+class Journal:
+    """操作を受け取り、書き込みスレッドでジャーナルとスナップショットに書きます。"""
+
+    def __init__(self, directory, flush_interval=FLUSH_INTERVAL, compact_ops=COMPACT_OPS):
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.compact_ops = compact_ops
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+        # 以下は書き込みスレッドだけが使う
+        self.document = None # 書き込み済みの操作をすべて反映したドキュメント
+        self.seq = 0 # 最後に書いた操作の番号
+        self.ops_since_snapshot = 0
+        self.file = None
+
+    # 書き込みスレッドを開始します。ディレクトリに前回の内容があれば、その続きから書きます。
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.thread.start()
+
+    # --- GUIスレッドから呼ぶ操作 (キューに入れるだけ) ---
+
+    def add_frame(self):
+        self.queue.put({"op": ADD_FRAME})
+
+    def add_block(self, frame, text="", kind=None):
+        self.queue.put({"op": ADD_BLOCK, "frame": frame, "text": text, "kind": normalize_kind(kind)})
+
+    def pop_block(self, frame):
+        self.queue.put({"op": POP_BLOCK, "frame": frame})
+
+    def set_text(self, frame, block, text):
+        self.queue.put({"op": SET_TEXT, "frame": frame, "block": block, "text": text})
+
+    def resize(self, frame, width):
+        self.queue.put({"op": RESIZE, "frame": frame, "width": width})
+
+    def truncate(self, count):
+        self.queue.put({"op": TRUNCATE, "count": count})
+
+    # ドキュメントを開いたとき: ジャーナルをそのファイルの内容 (None なら空のドキュメント) から始め直します。
+    # frames に frame_snapshot の並びを渡すと、ファイルの代わりにその内容から始めます。
+    def reset(self, filepath=None, frames=None):
+        self.queue.put({"op": _RESET, "path": filepath, "frames": frames})
+
+    # 残りの操作を書いてスレッドを止めます。discard なら書いた内容を削除します。
+    def close(self, discard=False, timeout=5):
+        self.queue.put({"op": _CLOSE, "discard": discard})
+        self.thread.join(timeout)
+
+    # --- 書き込みスレッド ---
+
+    def run(self):
+        try:
+            self.document, self.seq = read_recovery(self.directory)
+            self.compact()
+            while self.write_batch(self.next_batch()):
+                if self.ops_since_snapshot >= self.compact_ops:
+                    self.compact()
+        except Exception as e: # 書き込みに失敗しても、編集は続けられるようにする
+            print(f"ジャーナルの書き込みを中止しました: {e}", file=sys.stderr)
+        finally:
+            if self.file is not None:
+                self.file.close()
+
+    # 次の操作を待ち、そこから flush_interval の間に来た操作をまとめて返します。
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while batch[-1]["op"] != _CLOSE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    # 操作をドキュメントに反映してジャーナルに書きます。終了の指示があれば False を返します。
+    def write_batch(self, batch):
+        lines = []
+        for op in coalesce(batch):
+            kind = op["op"]
+            if kind == _CLOSE:
+                self.write_lines(lines)
+                self.file.close()
+                self.file = None
+                if op["discard"]:
+                    discard_recovery(self.directory)
+                return False
+            if kind == _RESET:
+                # これより前の操作は、開いたファイルの内容で置き換わる
+                lines.clear()
+                if op["frames"] is not None:
+                    self.document = Document([snapshot_frame(snapshot) for snapshot in op["frames"]])
+                elif op["path"]:
+                    self.document = load_document(op["path"])
+                else:
+                    self.document = Document()
+                self.compact()
+                continue
+            apply_op(self.document, op)
+            self.seq += 1
+            op["seq"] = self.seq
+            lines.append(json.dumps(op, ensure_ascii=False))
+        self.write_lines(lines)
+        self.ops_since_snapshot += len(lines)
+        return True
+
+    def write_lines(self, lines):
+        if not lines:
+            return
+        self.file.write("\n".join(lines) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    # 今のドキュメントをスナップショットに書き、ジャーナルを作り直します。
+    def compact(self):
+        frames = self.document.frames
+        snapshot = self.directory / f"{SNAPSHOT_PREFIX}{self.seq:012d}{flairb.SUFFIX}"
+        with atomic_write(snapshot, "wb") as f:
+            flairb.dump([(frame.to_binary(), len(frame)) for frame in frames], f)
+
+        header = {"op": SNAPSHOT, "seq": self.seq, "widths": [[index, frame.width] for index, frame in enumerate(frames) if frame.width is not None]}
+        if self.file is not None:
+            self.file.close()
+        journal_path = self.directory / JOURNAL_NAME
+        with atomic_write(journal_path) as f:
+            f.write(json.dumps(header) + "\n")
+        self.file = open(journal_path, "a", encoding="utf-8")
+        self.ops_since_snapshot = 0
+
+        # 新しいスナップショットとジャーナルがそろってから、古いスナップショットを消す
+        for path in self.directory.glob(SNAPSHOT_PREFIX + "*" + flairb.SUFFIX):
+            if path != snapshot:
+                path.unlink()
+
+
+# 同じブロックへ続けて入力した操作は、最後のテキストの1つにまとめます。
+def coalesce(batch):
+    result = []
+    for op in batch:
+        if op["op"] == SET_TEXT and result:
+            last = result[-1]
+            if last["op"] == SET_TEXT and last["frame"] == op["frame"] and last["block"] == op["block"]:
+                result[-1] = op
+                continue
+        result.append(op)
+    return result
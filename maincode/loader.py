@@ -0,0 +1,101 @@
+"""ファイルの読み込みをGUIスレッドを止めずに行うローダー。
+
+ファイルの解析 (flairb 形式ならフレーム表の読み込み) はワーカースレッドで行い、解析できたフレームから順にキューに入れます。
+GUIスレッドはタイマーで少しずつキューを取り出し、1回あたりの処理時間を
+time_slice_ms 以内に抑えながらフレームを追加していきます。
+"""
+import queue
+import threading
+import time
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+from document import iter_file_frames
+
+
+class DocumentLoader(QObject):
+    frame_loaded = Signal(object) # 読み込まれたフレーム (document.Frame)
+    progress = Signal(int) # 0 - 100
+    finished = Signal()
+    failed = Signal(str)
+
+    # ローダーを初期化します。start() を呼ぶまで読み込みは始まりません。
+    def __init__(self, filepath, time_slice_ms=8, parent=None):
+        super().__init__(parent)
+        self.filepath = filepath
+        self.time_slice = time_slice_ms / 1000
+        self.queue = queue.SimpleQueue()
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self.parse, daemon=True)
+        self.last_progress = -1
+        self.draining = False
+
+        self.drain_timer = QTimer(self)
+        self.drain_timer.setInterval(0)
+        self.drain_timer.timeout.connect(self.drain)
+
+    # ワーカースレッドでの解析と、GUIスレッドでの取り出しを開始します。
+    def start(self):
+        self.thread.start()
+        self.drain_timer.start()
+
+    # 読み込みを中止します。すでに追加されたフレームはそのまま残ります。
+    def cancel(self):
+        self.cancel_event.set()
+        self.drain_timer.stop()
+
+    def is_running(self):
+        return self.drain_timer.isActive()
+
+    # ワーカースレッド: ファイルを読み、フレームごとにキューへ送ります。
+    def parse(self):
+        try:
+            for frame, percent in iter_file_frames(self.filepath):
+                if self.cancel_event.is_set():
+                    return
+                self.queue.put(("frame", frame, percent))
+        except Exception as e: # ワーカーの例外はGUIスレッドに伝えないと読み込みが終わらない
+            self.queue.put(("error", str(e), None))
+            return
+        self.queue.put(("done", None, 100))
+
+    # GUIスレッド: 時間の許す限りキューからフレームを取り出して通知します。
+    # 通知の先 (モーダルの QProgressDialog.setValue など) がイベントを処理すると、その中でタイマーが
+    # drain をもう一度呼ぶことがあります。取り出したフレームより後のものが先に届かないように、入れ子では何もしません。
+    def drain(self):
+        if self.draining:
+            return
+        self.draining = True
+        try:
+            self.drain_queue()
+        finally:
+            self.draining = False
+
+    def drain_queue(self):
+        deadline = time.perf_counter() + self.time_slice
+        while not self.cancel_event.is_set():
+            try:
+                kind, value, percent = self.queue.get_nowait()
+            except queue.Empty:
+                # 解析待ちの間はタイマーの間隔を空けて、空回りを避ける
+                self.drain_timer.setInterval(10)
+                return
+            self.drain_timer.setInterval(0)
+
+            if kind == "error":
+                self.drain_timer.stop()
+                self.failed.emit(value)
+                return
+
+            if percent != self.last_progress:
+                self.last_progress = percent
+                self.progress.emit(percent)
+
+            if kind == "done":
+                self.drain_timer.stop()
+                self.finished.emit()
+                return
+
+            self.frame_loaded.emit(value)
+            if time.perf_counter() >= deadline:
+                return # 残りは次のイベントループで処理して、再描画の機会を作る
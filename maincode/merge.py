@@ -0,0 +1,381 @@
+"""Flair のドキュメントの構造の差分と3方向のマージ (PySide6には依存しません)。
+
+保存したJSONを git で行ごとにマージすると、フレームやブロックの区切りをまたいで衝突の印が入り、読めないファイルになります。
+ここではフレーム → ブロック → テキストの行 の順に構造をたどってマージします。
+    - フレームは中身のハッシュで、ブロックは (テキスト, 種類) で、共通の祖先 (base) と両方の版を対応づける
+    - 片方だけが変えた部分はその版を使う。両方が変えた部分は、フレーム・ブロックを組にできれば1つずつ下の段でマージする
+    - ブロックのテキストは行ごとにマージする
+対応づけは patience diff と同じく、両方に1回だけ現れる要素を目印にして最長増加部分列をとるので、
+ほぼ線形の時間で済みます (目印のない小さな範囲だけ difflib で対応づけます)。
+
+解決できない衝突も、Flair で開けるドキュメントとして書き出します。
+    テキストの衝突 : ブロックのテキストの中に git と同じ印 (<<<<<<< ours / ======= / >>>>>>> theirs) を入れる
+    ブロックの衝突 : 印だけを書いたブロックで、両方の版のブロックを囲む
+    フレームの衝突 : 両方の版のフレームを並べ、それぞれの先頭に印のブロックを入れる
+                     (片方が削除したときは、残った側のフレームのブロックを印で囲む)
+Flair は印のあるブロックを強調して表示します (has_conflict)。
+
+flair コマンド (flair_cli.py) の diff / merge から使います。merge は git のマージドライバーになります。
+    git config merge.flair.driver "./flair merge %O %A %B"
+    .gitattributes に  test_json/*.json merge=flair
+"""
+import difflib
+import hashlib
+from bisect import bisect_left
+from collections import Counter
+
+from doctools import CONFLICT_MARKER
+from document import Block, Document, Frame
+
+OURS_MARKER = "<<<<<<< ours"
+SEPARATOR_MARKER = "======="
+THEIRS_MARKER = ">>>>>>> theirs"
+MAX_FALLBACK_CELLS = 1 << 16 # 目印のない範囲を difflib で対応づける大きさ (両方の要素数の積) の上限
+MAX_PAIR_CELLS = 1 << 12 # 残った要素を似ているもの同士で組にする範囲の大きさ (両方の要素数の積) の上限
+SIMILAR_RATIO = 0.5 # 片方が変えた要素とみなす、base の要素との似ている度合い (0〜1) の下限
+
+_CONFLICT = object() # merge_value で両方が違う値に変えたとき
+
+
+# テキストに解決されていない衝突の印があるかを返します。
+def has_conflict(text):
+    return CONFLICT_MARKER.search(text) is not None
+
+
+# フレームの中身のハッシュ (flairb のバイト列から求めるので、読んでいない flairb のフレームは読まない)
+def frame_key(frame):
+    return hashlib.blake2b(frame.to_binary(), digest_size=16).digest()
+
+
+def block_key(block):
+    return block.text, block.kind
+
+
+# 2つのフレームの似ている度合い (共通のブロックの割合、0〜1)
+def frame_similarity(a, b):
+    if not len(a) and not len(b):
+        return 1.0
+    common = Counter(map(block_key, a.blocks)) & Counter(map(block_key, b.blocks))
+    return 2 * sum(common.values()) / (len(a) + len(b))
+
+
+# 2つのブロックのテキストの似ている度合い (0〜1)
+def block_similarity(a, b):
+    matcher = difflib.SequenceMatcher(None, a.text, b.text)
+    if matcher.real_quick_ratio() < SIMILAR_RATIO or matcher.quick_ratio() < SIMILAR_RATIO:
+        return 0.0
+    return matcher.ratio()
+
+
+# 2つの並び a, b (ハッシュできる要素) で同じ要素の対応 (i, j) を、i と j がともに増える順に返します。
+def match_sequences(a, b):
+    matches = []
+    ranges = [(0, len(a), 0, len(b))]
+    while ranges:
+        a0, a1, b0, b1 = ranges.pop()
+        # 先頭と末尾の同じ部分 (ほとんどの変更は一部だけなので、ここで大半が片付く)
+        while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+            matches.append((a0, b0))
+            a0 += 1
+            b0 += 1
+        while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+            a1 -= 1
+            b1 -= 1
+            matches.append((a1, b1))
+        if a0 == a1 or b0 == b1:
+            continue
+        anchors = unique_anchors(a, a0, a1, b, b0, b1)
+        if anchors:
+            # 目印の間を同じように対応づける
+            i, j = a0, b0
+            for anchor_i, anchor_j in anchors:
+                matches.append((anchor_i, anchor_j))
+                ranges.append((i, anchor_i, j, anchor_j))
+                i, j = anchor_i + 1, anchor_j + 1
+            ranges.append((i, a1, j, b1))
+        elif (a1 - a0) * (b1 - b0) <= MAX_FALLBACK_CELLS:
+            matcher = difflib.SequenceMatcher(None, a[a0:a1], b[b0:b1], autojunk=False)
+            for i, j, size in matcher.get_matching_blocks():
+                matches.extend((a0 + i + k, b0 + j + k) for k in range(size))
+        # 目印がなく大きい範囲は、全体を置き換えたものとして扱う
+    matches.sort()
+    return matches
+
+
+# a[a0:a1] と b[b0:b1] の両方に1回だけ現れる要素の対応のうち、順序の保たれる最長のものを返します。
+def unique_anchors(a, a0, a1, b, b0, b1):
+    in_a = {} # 要素 -> a での位置 (2回以上現れたら -1)
+    for i in range(a0, a1):
+        in_a[a[i]] = -1 if a[i] in in_a else i
+    in_b = {}
+    for j in range(b0, b1):
+        if b[j] in in_a:
+            in_b[b[j]] = -1 if b[j] in in_b else j
+    pairs = sorted((in_a[item], j) for item, j in in_b.items() if j >= 0 and in_a[item] >= 0)
+    return longest_increasing(pairs)
+
+
+# i の順に並んだ対応 (i, j) から、j も増える最長の部分列を返します (O(n log n))。
+def longest_increasing(pairs):
+    tails = [] # 長さごとの、最後の j の最小値
+    tail_positions = []
+    previous = [None] * len(pairs)
+    for position, (_, j) in enumerate(pairs):
+        length = bisect_left(tails, j)
+        if length == len(tails):
+            tails.append(j)
+            tail_positions.append(position)
+        else:
+            tails[length] = j
+            tail_positions[length] = position
+        previous[position] = tail_positions[length - 1] if length else None
+    result = []
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        result.append(pairs[position])
+        position = previous[position]
+    result.reverse()
+    return result
+
+
+# a から b への変わった範囲 ((a0, a1), (b0, b1)) を順に返します。
+def changed_ranges(a, b):
+    i = j = 0
+    for match_i, match_j in match_sequences(a, b) + [(len(a), len(b))]:
+        if (match_i, match_j) != (i, j):
+            yield (i, match_i), (j, match_j)
+        i, j = match_i + 1, match_j + 1
+
+
+# 3つの並びを base との対応でまとまりに分け、(変わっていないか, base, ours, theirs の範囲) を順に返します。
+def diff3(base, ours, theirs):
+    to_ours = dict(match_sequences(base, ours))
+    to_theirs = dict(match_sequences(base, theirs))
+    anchors = [(k, to_ours[k], to_theirs[k]) for k in to_ours if k in to_theirs]
+    anchors.append((len(base), len(ours), len(theirs)))
+    i = o = t = 0
+    stable_from = None # 変わっていない要素の続きの始まり
+    for k, ko, kt in anchors:
+        if (k, ko, kt) != (i, o, t):
+            if stable_from is not None:
+                yield True, (stable_from[0], i), (stable_from[1], o), (stable_from[2], t)
+                stable_from = None
+            yield False, (i, k), (o, ko), (t, kt)
+        if k == len(base):
+            break
+        if stable_from is None:
+            stable_from = (k, ko, kt)
+        i, o, t = k + 1, ko + 1, kt + 1
+    if stable_from is not None:
+        yield True, (stable_from[0], i), (stable_from[1], o), (stable_from[2], t)
+
+
+# 3つの並びをマージした並びを返します。keys は比べるための要素の値の並び (base, ours, theirs)。
+# 両方が変えた部分は resolve(merged, base の部分, ours の部分, theirs の部分) が merged に加えます。
+def merge_sequences(base, ours, theirs, keys, resolve):
+    base_keys, ours_keys, theirs_keys = keys
+    merged = []
+    for stable, (b0, b1), (o0, o1), (t0, t1) in diff3(base_keys, ours_keys, theirs_keys):
+        if stable or ours_keys[o0:o1] == theirs_keys[t0:t1] or theirs_keys[t0:t1] == base_keys[b0:b1]:
+            merged.extend(ours[o0:o1])
+        elif ours_keys[o0:o1] == base_keys[b0:b1]:
+            merged.extend(theirs[t0:t1])
+        else:
+            resolve(merged, base[b0:b1], ours[o0:o1], theirs[t0:t1])
+    return merged
+
+
+# 1つの値の3方向のマージ。両方が違う値に変えたときは _CONFLICT を返します。
+def merge_value(base, ours, theirs):
+    if ours == theirs or theirs == base:
+        return ours
+    if ours == base:
+        return theirs
+    return _CONFLICT
+
+
+# テキストを行ごとにマージし、(テキスト, 衝突があったか) を返します。衝突した行は印で囲みます。
+def merge_text(base, ours, theirs):
+    conflicted = False
+
+    def resolve(merged, base_lines, ours_lines, theirs_lines):
+        nonlocal conflicted
+        conflicted = True
+        merged.extend([OURS_MARKER, *ours_lines, SEPARATOR_MARKER, *theirs_lines, THEIRS_MARKER])
+
+    lines = (base.split("\n"), ours.split("\n"), theirs.split("\n"))
+    return "\n".join(merge_sequences(*lines, lines, resolve)), conflicted
+
+
+# 両方が変えた部分の要素を、base の要素ごとの (base, ours, theirs) の組にします。
+# 片方が同じ数の要素を変え、もう片方が追加・削除・変更をしたとき (隣り合う変更) も組にします。
+# 追加した要素は (None, 要素, None) か (None, None, 要素)、削除した要素はその側が None です。組にできなければ None を返します。
+def pair_chunk(base, ours, theirs, key, similarity):
+    if len(ours) == len(base) == len(theirs):
+        return list(zip(base, ours, theirs))
+    if len(theirs) == len(base):
+        return align_moved(base, ours, theirs, key, similarity)
+    if len(ours) == len(base):
+        return [(b, o, t) for b, t, o in align_moved(base, theirs, ours, key, similarity)]
+    return None
+
+
+# moved (追加・削除・変更をした側) を base と対応づけ、(base, moved, edited) の組の並びにします。
+# 同じ要素の間に残った要素は、moved が変えたものとして似ているもの同士を組にします。
+def align_moved(base, moved, edited, key, similarity):
+    pairs = []
+    k = j = 0
+    for match_k, match_j in match_sequences([key(item) for item in base], [key(item) for item in moved]) + [(len(base), len(moved))]:
+        for base_index, moved_item in pair_leftovers(base, k, match_k, moved[j:match_j], similarity):
+            if base_index is None:
+                pairs.append((None, moved_item, None))
+            else:
+                pairs.append((base[base_index], moved_item, edited[base_index]))
+        if match_k < len(base):
+            pairs.append((base[match_k], moved[match_j], edited[match_k]))
+        k, j = match_k + 1, match_j + 1
+    return pairs
+
+
+# base[start:stop] と moved_items を順序を保って組にし、(base の位置, moved の要素) の並びを返します。
+# 組にならない base の要素は moved の要素が None (削除)、moved の要素は base の位置が None (追加) です。
+def pair_leftovers(base, start, stop, moved_items, similarity):
+    count = stop - start
+    if count == len(moved_items):
+        return list(zip(range(start, stop), moved_items))
+    if not count or not moved_items or count * len(moved_items) > MAX_PAIR_CELLS:
+        return [(index, None) for index in range(start, stop)] + [(None, item) for item in moved_items]
+    # 似ている度合いの合計が最大になる組を求める (編集距離と同じ動的計画法)
+    scores = [[0.0] * (len(moved_items) + 1) for _ in range(count + 1)]
+    for i in range(1, count + 1):
+        for j in range(1, len(moved_items) + 1):
+            best = max(scores[i - 1][j], scores[i][j - 1])
+            ratio = similarity(base[start + i - 1], moved_items[j - 1])
+            if ratio >= SIMILAR_RATIO:
+                best = max(best, scores[i - 1][j - 1] + ratio)
+            scores[i][j] = best
+    result = []
+    i, j = count, len(moved_items)
+    while i and j:
+        if scores[i][j] == scores[i - 1][j]:
+            i -= 1
+            result.append((start + i, None))
+        elif scores[i][j] == scores[i][j - 1]:
+            j -= 1
+            result.append((None, moved_items[j]))
+        else:
+            i -= 1
+            j -= 1
+            result.append((start + i, moved_items[j]))
+    result.extend((start + index, None) for index in reversed(range(i)))
+    result.extend((None, moved_items[index]) for index in reversed(range(j)))
+    result.reverse()
+    return result
+
+
+class Merger:
+    """3つのドキュメント (共通の祖先, ours, theirs) をマージします。"""
+    def __init__(self):
+        self.conflicts = [] # マージした結果での衝突の位置 (フレーム, ブロック)。フレームの衝突はブロックが None
+        self.frame_index = 0 # マージしているフレームの、結果での位置
+
+    # マージしたドキュメントを返します。変わっていないフレームは ours (か theirs) のものを使います。
+    def merge(self, base, ours, theirs):
+        documents = (base, ours, theirs)
+        keys = tuple([frame_key(frame) for frame in document.frames] for document in documents)
+        return Document(merge_sequences(*(document.frames for document in documents), keys, self.resolve_frames))
+
+    # 両方が変えた部分を、組にできれば要素ごとに merge_item でマージし、できなければ conflict で両方の版を並べます。
+    def resolve(self, merged, base, ours, theirs, key, similarity, merge_item, conflict):
+        pairs = pair_chunk(base, ours, theirs, key, similarity)
+        if pairs is None:
+            conflict(merged, ours, theirs)
+            return
+        for base_item, ours_item, theirs_item in pairs:
+            if base_item is None:
+                merged.append(ours_item if ours_item is not None else theirs_item) # 追加
+            elif ours_item is not None and theirs_item is not None:
+                merge_item(merged, base_item, ours_item, theirs_item)
+            elif key(ours_item if ours_item is not None else theirs_item) != key(base_item):
+                # 片方が削除し、もう片方が変えた
+                conflict(merged, [ours_item] if ours_item is not None else [], [theirs_item] if theirs_item is not None else [])
+
+    def resolve_frames(self, merged, base, ours, theirs):
+        self.resolve(merged, base, ours, theirs, frame_key, frame_similarity, self.merge_frame, self.frame_conflict)
+
+    def resolve_blocks(self, merged, base, ours, theirs):
+        self.resolve(merged, base, ours, theirs, block_key, block_similarity, self.merge_block, self.block_conflict)
+
+    def merge_frame(self, merged, base, ours, theirs):
+        self.frame_index = len(merged)
+        frames = (base, ours, theirs)
+        keys = tuple([block_key(block) for block in frame.blocks] for frame in frames)
+        merged.append(Frame(merge_sequences(*(frame.blocks for frame in frames), keys, self.resolve_blocks)))
+
+    # 1つのブロックをマージします。種類を両方が違うものに変えたときは、両方の版を並べます。
+    def merge_block(self, merged, base, ours, theirs):
+        kind = merge_value(base.kind, ours.kind, theirs.kind)
+        if kind is _CONFLICT:
+            self.block_conflict(merged, [ours], [theirs])
+            return
+        text = merge_value(base.text, ours.text, theirs.text)
+        if text is _CONFLICT:
+            text, conflicted = merge_text(base.text, ours.text, theirs.text)
+            if conflicted:
+                self.conflicts.append((self.frame_index, len(merged)))
+        merged.append(Block(text, kind))
+
+    # 両方の版のフレームを並べ、それぞれの先頭に印のブロックを入れます。
+    # 片方が削除したときは、残った側のフレームのブロックを印で囲み、削除した側を空にします。
+    def frame_conflict(self, merged, ours, theirs):
+        if not ours or not theirs:
+            for frame in ours or theirs:
+                self.conflicts.append((len(merged), None))
+                sides = (frame.blocks, []) if ours else ([], frame.blocks)
+                merged.append(Frame([Block(OURS_MARKER), *sides[0], Block(SEPARATOR_MARKER), *sides[1], Block(THEIRS_MARKER)]))
+            return
+        for frames, marker in ((ours, OURS_MARKER), (theirs, THEIRS_MARKER)):
+            for frame in frames:
+                self.conflicts.append((len(merged), None))
+                merged.append(Frame([Block(marker), *frame.blocks]))
+
+    # 両方の版のブロックを、印のブロックで囲んで並べます。
+    def block_conflict(self, merged, ours, theirs):
+        self.conflicts.append((self.frame_index, len(merged)))
+        merged.extend([Block(OURS_MARKER), *ours, Block(SEPARATOR_MARKER), *theirs, Block(THEIRS_MARKER)])
+
+
+# 2つのドキュメントの構造の差分を、変更ごとの辞書で順に返します。
+# 同じ数のフレームが変わったところはブロックの差分を、それ以外はフレームの追加・削除・置き換えを返します。
+def diff_documents(old, new):
+    old_keys = [frame_key(frame) for frame in old.frames]
+    new_keys = [frame_key(frame) for frame in new.frames]
+    for (a0, a1), (b0, b1) in changed_ranges(old_keys, new_keys):
+        if a1 - a0 != b1 - b0:
+            yield {"op": change_op(a0, a1, b0, b1), "frame": a0, "frames": a1 - a0, "new_frame": b0, "new_frames": b1 - b0}
+            continue
+        for offset in range(a1 - a0):
+            old_blocks = old.frames[a0 + offset].blocks
+            new_blocks = new.frames[b0 + offset].blocks
+            old_block_keys = [block_key(block) for block in old_blocks]
+            new_block_keys = [block_key(block) for block in new_blocks]
+            for (i0, i1), (j0, j1) in changed_ranges(old_block_keys, new_block_keys):
+                yield {
+                    "op": change_op(i0, i1, j0, j1),
+                    "frame": a0 + offset,
+                    "new_frame": b0 + offset,
+                    "block": i0,
+                    "blocks": i1 - i0,
+                    "new_block": j0,
+                    "new_blocks": j1 - j0,
+                    "old": [block.to_data() for block in old_blocks[i0:i1]],
+                    "new": [block.to_data() for block in new_blocks[j0:j1]],
+                }
+
+
+def change_op(a0, a1, b0, b1):
+    if a0 == a1:
+        return "insert"
+    if b0 == b1:
+        return "delete"
+    return "replace"
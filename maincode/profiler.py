@@ -0,0 +1,179 @@
+"""Flairの処理時間の計測 (PySide6には依存しません)。
+
+環境変数 FLAIR_PROFILE か、コマンドラインの --profile で有効にします。
+有効にしたときだけ主なハンドラを時間を測るラッパーに置き換えるので、
+無効のときは何も置き換えず、余分な処理は一切ありません。
+
+計測した区間は Chrome のトレース形式 (chrome://tracing や Perfetto で開けるJSON) で書き出し、
+ハンドラごとの回数と p50/p99 の一覧もいつでも出力できます。
+    FLAIR_PROFILE=trace.json python maincode/Flair.py
+    python maincode/Flair.py --profile trace.json
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+ENV_VAR = "FLAIR_PROFILE"
+CLI_FLAG = "--profile"
+DEFAULT_TRACE_PATH = "flair-trace.json"
+MAX_EVENTS = 1_000_000 # これを超えた区間はトレースには書かない (集計には含める)
+
+_profiler = None
+
+
+class Profiler:
+    def __init__(self, trace_path=DEFAULT_TRACE_PATH, max_events=MAX_EVENTS):
+        self.trace_path = trace_path
+        self.max_events = max_events
+        self.origin = time.perf_counter_ns()
+        self.events = [] # (名前, 分類, 開始 ns, 時間 ns, スレッド)
+        self.counter_events = [] # (名前, 時刻 ns, その時点の値)
+        self.durations = {} # 名前 -> 時間 (ns) のリスト
+        self.counters = {} # 名前 -> 回数
+        self.dropped = 0
+
+    # 計測した区間を1つ記録します。
+    def record(self, name, category, start, duration):
+        durations = self.durations.get(name)
+        if durations is None:
+            durations = self.durations[name] = []
+        durations.append(duration)
+        if len(self.events) < self.max_events:
+            self.events.append((name, category, start, duration, threading.get_ident()))
+        else:
+            self.dropped += 1
+
+    # 回数を数えます (ウィジェットの生成、スタイルシートの適用など)。
+    def count(self, name, amount=1):
+        value = self.counters.get(name, 0) + amount
+        self.counters[name] = value
+        if len(self.counter_events) < self.max_events:
+            self.counter_events.append((name, time.perf_counter_ns(), value))
+
+    # with の中の処理を1つの区間として記録します。
+    @contextlib.contextmanager
+    def span(self, name, category="app"):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, time.perf_counter_ns() - start)
+
+    # ハンドラごとの (名前, 回数, 合計 ms, p50 ms, p99 ms, 最大 ms) を、合計の大きい順に返します。
+    def summary_rows(self):
+        rows = []
+        for name, durations in self.durations.items():
+            ordered = sorted(durations)
+            count = len(ordered)
+            rows.append((
+                name,
+                count,
+                sum(ordered) / 1e6,
+                ordered[(count - 1) // 2] / 1e6,
+                ordered[min(count - 1, int(count * 0.99))] / 1e6,
+                ordered[-1] / 1e6,
+            ))
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows
+
+    # 集計を表にした文字列を返します。
+    def summary(self):
+        lines = [f"{'handler':<40} {'count':>8} {'total ms':>10} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        for name, count, total, p50, p99, longest in self.summary_rows():
+            lines.append(f"{name:<40} {count:>8} {total:>10.2f} {p50:>9.3f} {p99:>9.3f} {longest:>9.3f}")
+        if self.counters:
+            lines.append("")
+            lines.append(f"{'counter':<40} {'count':>8}")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"{name:<40} {value:>8}")
+        if self.dropped:
+            lines.append(f"(トレースの上限を超えた {self.dropped} 区間は集計だけに含まれています)")
+        return "\n".join(lines)
+
+    # Chrome のトレース形式のデータを返します。
+    def chrome_trace(self):
+        pid = os.getpid()
+        trace_events = []
+        for name, category, start, duration, thread in self.events:
+            trace_events.append({
+                "name": name, "cat": category, "ph": "X", "pid": pid, "tid": thread,
+                "ts": (start - self.origin) / 1000, "dur": duration / 1000,
+            })
+        for name, timestamp, value in self.counter_events:
+            trace_events.append({
+                "name": name, "ph": "C", "pid": pid, "tid": 0,
+                "ts": (timestamp - self.origin) / 1000, "args": {"count": value},
+            })
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    # トレースをファイルに書き出し、書き出したパスを返します。
+    def export(self, path=None):
+        path = path or self.trace_path
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+
+# コマンドラインか環境変数で計測が指定されていれば、トレースの出力先を返します。指定がなければ None。
+def requested_trace_path(argv):
+    for position, arg in enumerate(argv):
+        if arg == CLI_FLAG:
+            following = argv[position + 1] if position + 1 < len(argv) else None
+            return following if following and not following.startswith("-") else DEFAULT_TRACE_PATH
+        if arg.startswith(CLI_FLAG + "="):
+            return arg.split("=", 1)[1] or DEFAULT_TRACE_PATH
+    value = os.environ.get(ENV_VAR)
+    if not value or value == "0":
+        return None
+    return DEFAULT_TRACE_PATH if value == "1" else value
+
+
+def enable(trace_path=DEFAULT_TRACE_PATH):
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(trace_path)
+    return _profiler
+
+
+def enabled():
+    return _profiler is not None
+
+
+# 有効なときのプロファイラを返します。無効なら None。
+def get():
+    return _profiler
+
+
+# owner (クラスまたはモジュール) の関数を、時間を測るラッパーに置き換えます。
+# Qtが呼ぶ仮想関数 (paintEvent など) も置き換えられるように、ウィジェットを作る前に呼びます。
+def instrument(owner, names, category):
+    for name in names:
+        function = getattr(owner, name)
+        setattr(owner, name, _timed(function, f"{owner.__name__}.{name}", category))
+
+
+# owner の関数が呼ばれた回数を counter として数えるようにします。
+def count_calls(owner, name, counter):
+    function = getattr(owner, name)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        _profiler.count(counter)
+        return function(*args, **kwargs)
+    setattr(owner, name, wrapper)
+
+
+def _timed(function, name, category):
+    perf_counter_ns = time.perf_counter_ns
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _profiler.record(name, category, start, perf_counter_ns() - start)
+    return wrapper
@@ -0,0 +1,178 @@
+"""フレームのドラッグによるリサイズと、ビューポートの端での自動スクロール。
+
+マウスの移動やタイマーでは目標の幅とスクロール量を記録するだけにして、
+実際の反映 (隣のフレームの幅、自分の幅、スクロール位置) は表示フレームごとに
+1回だけまとめて行います。幅はまずモデル (document.Frame.width) に書き、
+変わるのはドラッグしている1〜2個のフレームだけなので、他のフレームは並べ直されません。
+"""
+from PySide6.QtCore import QEvent, QObject, QRect, QTimer, Signal
+from PySide6.QtWidgets import QApplication
+
+from frame_clock import FRAME_INTERVAL_MS, shared_clock
+
+EDGE_ZONE_WIDTH = 40 # 自動スクロールを始める、ビューポートの端からの距離
+MIN_SPEED = 2 # 1表示フレームあたりのスクロール量 (px) の下限
+MAX_SPEED = 60 # 1表示フレームあたりのスクロール量 (px) の上限
+SPEED_PER_PIXEL = 0.5 # 端の領域にカーソルが1px入るごとに増える速さ
+
+
+class FrameResizeEngine(QObject):
+    frames_resized = Signal(list) # ドラッグを終えたときに、幅が変わった (QtFrame, 前の幅) の並びを送る
+
+    def __init__(self, scroll_area, parent=None):
+        super().__init__(parent)
+        self.scroll_area = scroll_area
+        self.frame = None # リサイズ中のフレーム
+        self.prev_frame = None # 左端をドラッグしているときの、左隣のフレーム
+        self.edge = None # 'left' または 'right'
+        self.start_x = 0
+        self.original_width = 0
+        self.original_prev_width = 0
+
+        # 次の表示フレームで反映する値
+        self.target_width = None
+        self.target_prev_width = None
+        self.scroll_delta = 0
+        self.original_widths = {} # このドラッグで幅が変わったフレーム -> ドラッグ前のモデルの幅
+
+        self.speed = 0 # 自動スクロールの速さ (px/表示フレーム)。0なら自動スクロールしていない
+        self.autoscroll_timer = QTimer(self)
+        self.autoscroll_timer.setInterval(FRAME_INTERVAL_MS)
+        self.autoscroll_timer.timeout.connect(self.autoscroll_step)
+
+    def is_active(self):
+        return self.frame is not None
+
+    # ドラッグを開始します。
+    def begin(self, frame, edge, global_x, prev_frame=None):
+        self.frame = frame
+        self.edge = edge
+        self.prev_frame = prev_frame if edge == 'left' else None
+        self.rebase(global_x)
+
+    # 現在の幅とカーソルの位置を、以降のドラッグの基準にします。
+    def rebase(self, global_x):
+        self.start_x = global_x
+        self.original_width = self.current_width(self.frame)
+        if self.prev_frame is not None:
+            self.original_prev_width = self.current_width(self.prev_frame)
+
+    # マウスの移動: 目標の幅か、自動スクロールの速さを更新します。
+    def move(self, global_x):
+        if not self.is_active():
+            return
+        viewport = self.scroll_area.viewport()
+        viewport_rect = QRect(viewport.mapToGlobal(viewport.rect().topLeft()), viewport.mapToGlobal(viewport.rect().bottomRight()))
+
+        # 端の領域に深く入るほど速くスクロールする
+        right_depth = global_x - (viewport_rect.right() - EDGE_ZONE_WIDTH)
+        left_depth = (viewport_rect.left() + EDGE_ZONE_WIDTH) - global_x
+        if right_depth > 0:
+            self.start_autoscroll(self.speed_for(right_depth))
+            return
+        if left_depth > 0:
+            self.start_autoscroll(-self.speed_for(left_depth))
+            return
+
+        if self.speed:
+            # 自動スクロールで幅が変わっているので、ここから手動のリサイズをやり直す
+            self.stop_autoscroll()
+            self.rebase(global_x)
+
+        delta = global_x - self.start_x
+        if self.edge == 'right':
+            new_width = self.original_width + delta
+            if new_width > 0:
+                self.target_width = new_width
+        elif self.edge == 'left' and self.prev_frame is not None:
+            new_prev_width = self.original_prev_width + delta
+            new_width = self.original_width - delta
+            if new_prev_width > 0 and new_width > 0:
+                self.target_prev_width = new_prev_width
+                self.target_width = new_width
+        self.request_apply()
+
+    # ドラッグを終了します。
+    def end(self):
+        if not self.is_active():
+            return
+        self.stop_autoscroll()
+        self.apply()
+        original_widths, self.original_widths = self.original_widths, {}
+        self.frame = None
+        self.prev_frame = None
+        self.edge = None
+        if original_widths:
+            self.frames_resized.emit(list(original_widths.items()))
+
+    def speed_for(self, depth):
+        return min(MAX_SPEED, MIN_SPEED + int(depth * SPEED_PER_PIXEL))
+
+    def start_autoscroll(self, speed):
+        self.speed = speed
+        if not self.autoscroll_timer.isActive():
+            self.autoscroll_timer.start()
+
+    def stop_autoscroll(self):
+        self.speed = 0
+        self.autoscroll_timer.stop()
+
+    # 自動スクロールの1表示フレーム分: 幅とスクロール量を進めて反映します。
+    def autoscroll_step(self):
+        if not self.is_active() or not self.speed:
+            return
+        step = abs(self.speed)
+        width = self.pending_width(self.frame, self.target_width)
+        if self.speed > 0:
+            # 右端へ: 自分の幅を広げ、その分スクロールする
+            self.target_width = width + step
+            self.scroll_delta += step
+        elif self.prev_frame is not None:
+            # 左端へ: 左隣を狭めて自分を広げ、その分スクロールを戻す
+            prev_width = self.pending_width(self.prev_frame, self.target_prev_width)
+            if prev_width > step:
+                self.target_prev_width = prev_width - step
+                self.target_width = width + step
+                self.scroll_delta -= step
+        self.apply()
+
+    def request_apply(self):
+        shared_clock().request(self, self.apply)
+
+    # 記録した幅とスクロール量を、1回のレイアウトでまとめて反映します。
+    def apply(self):
+        shared_clock().cancel(self)
+        if self.frame is None:
+            return
+        changed = False
+        if self.target_prev_width is not None and self.prev_frame is not None:
+            changed |= self.set_width(self.prev_frame, self.target_prev_width)
+        if self.target_width is not None:
+            changed |= self.set_width(self.frame, self.target_width)
+        self.target_width = None
+        self.target_prev_width = None
+
+        if changed:
+            # スクロール範囲が広がってから位置を設定しないと、途中で値が切り詰められてしまう
+            QApplication.sendPostedEvents(None, QEvent.Type.LayoutRequest)
+        if self.scroll_delta:
+            scroll_bar = self.scroll_area.horizontalScrollBar()
+            scroll_bar.setValue(scroll_bar.value() + self.scroll_delta)
+            self.scroll_delta = 0
+
+    def current_width(self, frame):
+        if frame.model.width is not None:
+            return frame.model.width
+        return frame.width()
+
+    def pending_width(self, frame, target):
+        return target if target is not None else self.current_width(frame)
+
+    # モデルの幅を更新し、フレームに反映します。変わったときはTrueを返します。
+    def set_width(self, frame, width):
+        if frame.model.width == width and frame.width() == width:
+            return False
+        self.original_widths.setdefault(frame, frame.model.width)
+        frame.model.width = width
+        frame.setFixedWidth(width)
+        return True
@@ -0,0 +1,175 @@
+"""サイドバーの実行パネル。
+
+生成したコードの関数を executor.ExecutionPool で別のプロセスで実行します。
+プールの監視スレッドからのイベントは event_received (シグナル) でGUIスレッドに渡し、
+出力は届いたものから表示して、それを出したブロックと一緒に block_output で知らせます。
+実行が終わると、ブロックごとの実行回数と時間を hot_spots で知らせます (ホットスポットの表示用)。
+"""
+import ast
+
+from PySide6.QtCore import Signal
+from PySide6.QtGui import QFontDatabase, QTextCursor
+from PySide6.QtWidgets import (
+    QCheckBox, QComboBox, QDoubleSpinBox, QHBoxLayout, QLabel, QLineEdit, QPlainTextEdit, QPushButton, QVBoxLayout, QWidget
+)
+
+import executor
+
+MAX_OUTPUT_BLOCKS = 5000 # 出力の表示に残す行数
+
+
+class RunPanel(QWidget):
+    event_received = Signal(object) # プールのイベント (監視スレッドから)
+    block_output = Signal(int, int, str) # フレームの位置, ブロックの番号, 出力
+    hot_spots = Signal(object, object) # (フレームの位置, ブロックの番号) -> 実行回数 / 時間 (秒)
+    error_block = Signal(int, int) # 例外が起きたブロック
+    run_started = Signal()
+
+    # generate は、今のドキュメントから生成したコード (codegen.ModuleCode) を返す関数です。
+    def __init__(self, generate, parent=None):
+        super().__init__(parent)
+        self.generate = generate
+        self.pool = None # 最初に実行するときに作る
+        self.run_id = None # 実行中の番号
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.entry_combo = QComboBox()
+        self.args_edit = QLineEdit()
+        self.args_edit.setPlaceholderText("Arguments (e.g. 3, 'a')")
+        self.timeout_spin = QDoubleSpinBox()
+        self.timeout_spin.setRange(0.1, 3600)
+        self.timeout_spin.setValue(executor.DEFAULT_TIMEOUT)
+        self.timeout_spin.setSuffix(" s")
+        self.profile_check = QCheckBox("Hot spots")
+        self.profile_check.setChecked(True)
+        self.status_label = QLabel()
+        self.status_label.setWordWrap(True)
+        self.output = QPlainTextEdit()
+        self.output.setReadOnly(True)
+        self.output.setMaximumBlockCount(MAX_OUTPUT_BLOCKS)
+        self.output.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.output.setMinimumHeight(300)
+
+        options_layout = QHBoxLayout()
+        options_layout.addWidget(self.timeout_spin)
+        options_layout.addWidget(self.profile_check)
+        buttons_layout = QHBoxLayout()
+        self.run_button = self.add_button(buttons_layout, "Run", self.run)
+        self.stop_button = self.add_button(buttons_layout, "Stop", self.stop)
+        self.stop_button.setEnabled(False)
+
+        layout.addWidget(self.entry_combo)
+        layout.addWidget(self.args_edit)
+        layout.addLayout(options_layout)
+        layout.addLayout(buttons_layout)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.output)
+
+        self.event_received.connect(self.on_event)
+
+    def add_button(self, layout, text, slot):
+        button = QPushButton(text)
+        button.setProperty("role", "sidebar-button")
+        button.clicked.connect(lambda checked=False: slot())
+        layout.addWidget(button)
+        return button
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh_entries()
+
+    # 呼び出せる関数 (フレームごとの関数) の一覧を更新します。
+    def refresh_entries(self, module=None):
+        module = module or self.generate()
+        current = self.entry_combo.currentText()
+        names = [code.name for code in module.frames]
+        self.entry_combo.blockSignals(True)
+        self.entry_combo.clear()
+        self.entry_combo.addItems(names)
+        if current in names:
+            self.entry_combo.setCurrentText(current)
+        self.entry_combo.blockSignals(False)
+
+    # フレームの位置を指定して、その関数を選びます。
+    def select_entry(self, position):
+        if 0 <= position < self.entry_combo.count():
+            self.entry_combo.setCurrentIndex(position)
+
+    # 選んだ関数を実行します。前の実行が終わっていなければ取り消します。
+    def run(self):
+        module = self.generate()
+        self.refresh_entries(module)
+        entry = self.entry_combo.currentText()
+        if not entry:
+            self.status_label.setText("実行する関数がありません")
+            return
+        try:
+            args = self.parse_args()
+        except (ValueError, SyntaxError) as e:
+            self.status_label.setText(f"引数を読めません: {e}")
+            return
+
+        if self.pool is None:
+            self.pool = executor.ExecutionPool(on_event=lambda *event: self.event_received.emit(event))
+        if self.run_id is not None:
+            self.pool.cancel(self.run_id)
+        self.output.clear()
+        self.run_started.emit()
+        self.run_id = self.pool.submit(
+            module.source, entry, args, timeout=self.timeout_spin.value(),
+            profile=self.profile_check.isChecked(), line_blocks=module.line_map(),
+        )
+        self.status_label.setText(f"{entry} を実行しています...")
+        self.stop_button.setEnabled(True)
+
+    # 引数の欄を Python のリテラルとして読み、タプルで返します。
+    def parse_args(self):
+        text = self.args_edit.text().strip()
+        if not text:
+            return ()
+        value = ast.literal_eval(f"({text},)")
+        return tuple(value)
+
+    def stop(self):
+        if self.pool is not None and self.run_id is not None:
+            self.pool.cancel(self.run_id)
+
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    # GUIスレッド: プールからのイベントを処理します。
+    def on_event(self, event):
+        kind, run_id = event[0], event[1]
+        if run_id != self.run_id:
+            return # 取り消した前の実行
+        if kind == executor.OUTPUT:
+            frame, block, text = event[2:]
+            cursor = self.output.textCursor()
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertText(text)
+            self.output.setTextCursor(cursor)
+            if frame is not None:
+                self.block_output.emit(frame, block, text)
+        elif kind == executor.FINISHED:
+            self.show_result(event[2])
+
+    def show_result(self, result):
+        self.run_id = None
+        self.stop_button.setEnabled(False)
+        if result.status == executor.OK:
+            message = f"完了 ({result.elapsed * 1000:.1f} ms): {result.value}"
+        elif result.status == executor.CANCELLED:
+            message = "取り消しました"
+        else:
+            message = f"{result.status}: {result.error}"
+        if result.error_block is not None:
+            frame, block = result.error_block
+            message += f" (Frame {frame + 1}, block {block + 1})"
+            self.error_block.emit(frame, block)
+        self.status_label.setText(message)
+        if result.counts:
+            self.hot_spots.emit(result.counts, result.timings)
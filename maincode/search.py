@@ -0,0 +1,272 @@
+"""ドキュメント全体のブロックのテキストを検索する索引 (PySide6には依存しません)。
+
+ブロックのテキストを小文字にした3文字ずつの組 (trigram) から、それを含むブロックへの転置索引を作ります。
+3文字以上の文字列の検索は、検索語の3文字の組をすべて含むブロックだけを候補にして、
+候補のテキストだけを実際に照合します。正規表現と2文字以下の検索語は、索引が持つテキストを順に照合します
+(どちらの場合もウィジェットの toPlainText は使いません)。
+
+索引の更新はGUIスレッドから操作をキューに入れるだけで、索引を作る処理は別スレッドで行います。
+検索するときはキューに残っている操作を先に反映するので、直前の編集も必ず結果に入ります。
+    index = SearchIndex()
+    index.start()
+    index.add_frame(0, frame)            # ファイルを開いたときなど (document.Frame)
+    index.set_text(0, 3, "new text")     # ブロックの textChanged から
+    index.find("text")                   # -> [(フレーム, ブロック, 開始, 終了), ...]
+
+on_change を渡すと、操作をキューに入れるたびに (GUIスレッドで) 呼ばれます。検索結果の更新に使います。
+"""
+import re
+import threading
+from collections import deque
+
+import flairb
+
+NGRAM = 3
+MAX_MATCHES = 10000 # これより多い一致は返さない (ライブ検索の結果が大きくなりすぎないように)
+APPLY_BATCH = 64 # 書き込みスレッドが1回ロックを取る間に反映する操作の数
+
+# キューに入れる操作
+_FRAME = "frame" # (フレーム, テキストの並びか (flairb のバイト列, ブロック数))
+_TEXT = "text" # (フレーム, ブロック, テキスト)。ブロックが末尾の次なら追加
+_POP = "pop" # (フレーム,)
+_TRUNCATE = "truncate" # (残すフレーム数,)
+
+
+# テキストに含まれる (小文字にした) 3文字の組の集合を返します。
+def ngrams(text):
+    text = text.lower()
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+# 検索語を正規表現にします。regex が False なら文字列そのものを探します。正しくない正規表現は re.error。
+def compile_pattern(pattern, regex=False, case_sensitive=False):
+    flags = 0 if case_sensitive else re.IGNORECASE
+    return re.compile(pattern if regex else re.escape(pattern), flags)
+
+
+# フレームの中身を、索引のスレッドに渡せる形にします。
+# まだ読んでいない flairb のフレームは、デコードせずにバイト列のまま渡して索引のスレッドで読みます。
+def frame_snapshot(frame):
+    unread = frame.unread_source()
+    if unread is not None:
+        return unread
+    return [block.text for block in frame.blocks]
+
+
+class SearchIndex:
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self.lock = threading.Lock() # texts と postings を守る
+        self.pending = deque() # まだ反映していない操作
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.closing = False
+        self.texts = [] # フレームごとの、ブロックのテキストのリスト
+        self.postings = {} # 3文字の組 -> それを含む (フレーム, ブロック) の集合
+
+    # 索引を作るスレッドを開始します。開始しなくても、検索のときにまとめて反映されます。
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="flair-search", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.closing = True
+        self.wakeup.set()
+        self.thread.join()
+        self.thread = None
+
+    # --- GUIスレッドから呼ぶ操作 (キューに入れるだけ) ---
+
+    # フレーム (document.Frame) を frame_index の位置に入れます。
+    def add_frame(self, frame_index, frame):
+        self.enqueue((_FRAME, frame_index, frame_snapshot(frame)))
+
+    # ブロックのテキストを変えます。index がフレームのブロック数と同じならブロックを追加します。
+    def set_text(self, frame_index, index, text):
+        self.enqueue((_TEXT, frame_index, index, text))
+
+    def pop_block(self, frame_index):
+        self.enqueue((_POP, frame_index))
+
+    # フレームを先頭から count 個だけ残します。
+    def truncate(self, count):
+        self.enqueue((_TRUNCATE, count))
+
+    def enqueue(self, op):
+        self.pending.append(op)
+        self.wakeup.set()
+        if self.on_change is not None:
+            self.on_change()
+
+    # --- 検索 ---
+
+    # 一致した範囲を (フレーム, ブロック, 開始, 終了) の並びで、ドキュメントの順に返します。
+    def find(self, pattern, regex=False, case_sensitive=False, limit=MAX_MATCHES):
+        if not pattern:
+            return []
+        compiled = compile_pattern(pattern, regex, case_sensitive)
+        matches = []
+        with self.lock:
+            self.apply_pending()
+            for frame_index, index in self.keys(pattern, regex):
+                for match in compiled.finditer(self.texts[frame_index][index]):
+                    if match.end() == match.start():
+                        continue # 空文字列に一致する正規表現は、一致として数えない
+                    matches.append((frame_index, index, match.start(), match.end()))
+                    if len(matches) >= limit:
+                        return matches
+        return matches
+
+    # 一致をすべて置き換えたときに変わるブロックを、(フレーム, ブロック, 前のテキスト, 新しいテキスト) の並びで返します。
+    # regex が True なら replacement の \1 や \g<name> は一致した部分に置き換わります。
+    def replacements(self, pattern, replacement, regex=False, case_sensitive=False):
+        if not pattern:
+            return []
+        compiled = compile_pattern(pattern, regex, case_sensitive)
+        expand = _expander(replacement, regex)
+        changes = []
+        with self.lock:
+            self.apply_pending()
+            for frame_index, index in self.keys(pattern, regex):
+                old_text = self.texts[frame_index][index]
+                text = compiled.sub(expand, old_text)
+                if text != old_text:
+                    changes.append((frame_index, index, old_text, text))
+        return changes
+
+    # 1つの一致 (find の結果の1つ) を置き換えたときの (前のテキスト, 新しいテキスト) を返します。
+    # その後の編集で一致しなくなっていれば None を返します。
+    def replace_match(self, match, pattern, replacement, regex=False, case_sensitive=False):
+        frame_index, index, start, end = match
+        compiled = compile_pattern(pattern, regex, case_sensitive)
+        with self.lock:
+            self.apply_pending()
+            if frame_index >= len(self.texts) or index >= len(self.texts[frame_index]):
+                return None
+            old_text = self.texts[frame_index][index]
+        found = compiled.match(old_text, start)
+        if found is None or found.end() != end:
+            return None
+        return old_text, old_text[:start] + _expander(replacement, regex)(found) + old_text[end:]
+
+    # ブロックのテキストを返します。
+    def text(self, frame_index, index):
+        with self.lock:
+            self.apply_pending()
+            return self.texts[frame_index][index]
+
+    # 照合するブロックを、ドキュメントの順に返します。
+    def keys(self, pattern, regex):
+        if regex or len(pattern) < NGRAM:
+            return [(f, b) for f, texts in enumerate(self.texts) for b in range(len(texts))]
+        return sorted(self.candidates(pattern))
+
+    # 検索語の3文字の組をすべて含むブロックの集合を返します。
+    def candidates(self, pattern):
+        postings = []
+        for gram in ngrams(pattern):
+            keys = self.postings.get(gram)
+            if not keys:
+                return set()
+            postings.append(keys)
+        postings.sort(key=len)
+        return postings[0].intersection(*postings[1:])
+
+    # 索引にあるブロックの数を返します。
+    def block_count(self):
+        with self.lock:
+            self.apply_pending()
+            return sum(len(texts) for texts in self.texts)
+
+    # --- 索引の更新 (ロックを取ってから呼ぶ) ---
+
+    def apply_pending(self):
+        while self.pending:
+            self.apply(self.pending.popleft())
+
+    def apply(self, op):
+        kind = op[0]
+        if kind == _TEXT:
+            _, frame_index, index, text = op
+            texts = self.texts[frame_index]
+            if index == len(texts):
+                texts.append("")
+            self.replace_text(frame_index, index, text)
+        elif kind == _FRAME:
+            _, frame_index, payload = op
+            if isinstance(payload, tuple):
+                payload = [text for text, _ in flairb.decode_blocks(*payload)]
+            if frame_index < len(self.texts):
+                self.remove_frames(frame_index, frame_index + 1)
+                self.texts[frame_index] = []
+            else:
+                self.texts.append([])
+            texts = self.texts[frame_index]
+            for text in payload:
+                texts.append("")
+                self.replace_text(frame_index, len(texts) - 1, text)
+        elif kind == _POP:
+            _, frame_index = op
+            texts = self.texts[frame_index]
+            self.replace_text(frame_index, len(texts) - 1, "")
+            texts.pop()
+        elif kind == _TRUNCATE:
+            count = op[1]
+            if count == 0:
+                self.texts = []
+                self.postings = {}
+            else:
+                self.remove_frames(count, len(self.texts))
+                del self.texts[count:]
+
+    def replace_text(self, frame_index, index, text):
+        texts = self.texts[frame_index]
+        old_grams = ngrams(texts[index])
+        new_grams = ngrams(text)
+        key = (frame_index, index)
+        for gram in old_grams - new_grams:
+            keys = self.postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[gram]
+        for gram in new_grams - old_grams:
+            keys = self.postings.get(gram)
+            if keys is None:
+                keys = self.postings[gram] = set()
+            keys.add(key)
+        texts[index] = text
+
+    # first から last の手前までのフレームのブロックを索引から取り除きます (テキストのリストは残す)。
+    def remove_frames(self, first, last):
+        for frame_index in range(first, last):
+            for index in range(len(self.texts[frame_index])):
+                self.replace_text(frame_index, index, "")
+
+    # --- 索引のスレッド ---
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            while True:
+                with self.lock:
+                    # 大きなフレームの間も検索が待たされすぎないように、少しずつロックを離す
+                    for _ in range(APPLY_BATCH):
+                        if not self.pending:
+                            break
+                        self.apply(self.pending.popleft())
+                    if not self.pending:
+                        break
+            if self.closing:
+                return
+
+
+# 一致した部分を置き換える文字列を返す関数を作ります。空文字列への一致は置き換えません (find と同じ)。
+def _expander(replacement, regex):
+    def expand(match):
+        if match.end() == match.start():
+            return ""
+        return match.expand(replacement) if regex else replacement
+    return expand
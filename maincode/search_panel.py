@@ -0,0 +1,212 @@
+"""サイドバーの検索パネル。
+
+検索語を入力するたびに SearchIndex で探し直し (表示フレームごとに1回にまとめる)、一致の一覧を表示します。
+次へ・前へで一致を順に選び、match_activated でフレームとブロックの位置を知らせます。
+置き換えたブロックのテキストは texts_replaced で (フレーム, ブロック, 前のテキスト, 新しいテキスト) の並びとして知らせ、
+モデル・ジャーナル・履歴への反映は受け取った側 (FlairApp) が行います。
+"""
+import re
+from bisect import bisect_left
+
+from PySide6.QtCore import Signal
+from PySide6.QtWidgets import (
+    QCheckBox, QHBoxLayout, QLabel, QLineEdit, QListWidget, QPushButton, QVBoxLayout, QWidget
+)
+
+from frame_clock import shared_clock
+
+MAX_LISTED = 200 # 一覧に並べる一致の数 (次へ・前へはすべての一致を回る)
+SNIPPET_CONTEXT = 24 # 一覧で一致の前後に表示する文字数
+
+
+class SearchPanel(QWidget):
+    match_activated = Signal(int, int, int, int) # フレーム, ブロック, 開始, 終了
+    texts_replaced = Signal(list) # (フレーム, ブロック, 前のテキスト, 新しいテキスト) の並び
+
+    def __init__(self, index, parent=None):
+        super().__init__(parent)
+        self.index = index # search.SearchIndex
+        self.matches = [] # (フレーム, ブロック, 開始, 終了) の並び
+        self.current = -1 # 選んでいる一致の位置 (-1 なら未選択)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.find_edit = QLineEdit()
+        self.find_edit.setPlaceholderText("Find")
+        self.replace_edit = QLineEdit()
+        self.replace_edit.setPlaceholderText("Replace")
+        self.regex_check = QCheckBox("Regex")
+        self.case_check = QCheckBox("Match case")
+        self.status_label = QLabel()
+        self.status_label.setWordWrap(True)
+
+        options_layout = QHBoxLayout()
+        options_layout.addWidget(self.regex_check)
+        options_layout.addWidget(self.case_check)
+
+        navigation_layout = QHBoxLayout()
+        previous_button = self.add_button(navigation_layout, "Previous", self.find_previous)
+        next_button = self.add_button(navigation_layout, "Next", self.find_next)
+        replace_layout = QHBoxLayout()
+        self.add_button(replace_layout, "Replace", self.replace_current)
+        self.add_button(replace_layout, "Replace All", self.replace_all)
+
+        self.results = QListWidget()
+        self.results.setMinimumHeight(200)
+
+        layout.addWidget(self.find_edit)
+        layout.addLayout(options_layout)
+        layout.addLayout(navigation_layout)
+        layout.addWidget(self.replace_edit)
+        layout.addLayout(replace_layout)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.results)
+
+        self.find_edit.textChanged.connect(self.schedule_search)
+        self.find_edit.returnPressed.connect(self.find_next)
+        self.regex_check.toggled.connect(self.schedule_search)
+        self.case_check.toggled.connect(self.schedule_search)
+        self.results.currentRowChanged.connect(self.on_result_row_changed)
+        previous_button.setToolTip("Shift+F3")
+        next_button.setToolTip("F3")
+
+    def add_button(self, layout, text, slot):
+        button = QPushButton(text)
+        button.setProperty("role", "sidebar-button")
+        button.clicked.connect(lambda checked=False: slot())
+        layout.addWidget(button)
+        return button
+
+    # 検索の条件を (検索語, 正規表現か, 大文字と小文字を区別するか) で返します。
+    def options(self):
+        return self.find_edit.text(), self.regex_check.isChecked(), self.case_check.isChecked()
+
+    # 検索語を入力欄に入れて、すぐに探せるようにします。
+    def focus_find(self):
+        self.find_edit.setFocus()
+        self.find_edit.selectAll()
+
+    # 次の表示フレームで探し直します。表示されていないときは、表示されたときに探します。
+    def schedule_search(self, *args):
+        if self.isVisible() and self.find_edit.text():
+            shared_clock().request(("search", id(self)), self.run_search)
+        elif not self.find_edit.text():
+            self.set_matches([])
+            self.status_label.clear()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.schedule_search()
+
+    def run_search(self):
+        pattern, regex, case_sensitive = self.options()
+        try:
+            matches = self.index.find(pattern, regex, case_sensitive)
+        except re.error as e:
+            self.set_matches([])
+            self.status_label.setText(f"正しくない正規表現です: {e}")
+            return
+        self.set_matches(matches)
+        self.update_status()
+
+    # 一致の一覧を入れ替えます。選んでいた一致があれば、その位置 (なければその手前) を選んだままにします。
+    def set_matches(self, matches):
+        previous = self.matches[self.current] if 0 <= self.current < len(self.matches) else None
+        self.matches = matches
+        if previous is None:
+            self.current = -1
+        else:
+            position = bisect_left(matches, previous)
+            found = position < len(matches) and matches[position] == previous
+            self.current = position if found else position - 1
+
+        self.results.blockSignals(True) # 一覧を作り直す間は、行の選択で一致に移動しない
+        self.results.clear()
+        for frame_index, index, start, end in matches[:MAX_LISTED]:
+            self.results.addItem(f"{frame_index + 1}:{index + 1}  {self.snippet(frame_index, index, start, end)}")
+        if 0 <= self.current < MAX_LISTED:
+            self.results.setCurrentRow(self.current)
+        self.results.blockSignals(False)
+
+    # 一覧に表示する、一致の前後のテキストを返します。
+    def snippet(self, frame_index, index, start, end):
+        text = self.index.text(frame_index, index)
+        before = text[max(0, start - SNIPPET_CONTEXT):start]
+        after = text[end:end + SNIPPET_CONTEXT]
+        return " ".join(f"{before}[{text[start:end]}]{after}".split())
+
+    def update_status(self):
+        total = len(self.matches)
+        if not total:
+            self.status_label.setText("見つかりません")
+        elif self.current < 0:
+            self.status_label.setText(f"{total} 件")
+        else:
+            self.status_label.setText(f"{self.current + 1} / {total} 件")
+
+    # --- 次へ・前へ ---
+
+    def find_next(self):
+        self.ensure_searched()
+        if self.matches:
+            self.activate((self.current + 1) % len(self.matches))
+
+    def find_previous(self):
+        self.ensure_searched()
+        if self.matches:
+            self.activate((self.current - 1) % len(self.matches) if self.current >= 0 else len(self.matches) - 1)
+
+    # 探し直しが予約されていれば、すぐに探します (入力してすぐ Enter を押したとき)。
+    def ensure_searched(self):
+        key = ("search", id(self))
+        if key in shared_clock().pending:
+            shared_clock().cancel(key)
+            self.run_search()
+
+    def activate(self, position):
+        self.current = position
+        if position < MAX_LISTED:
+            self.results.blockSignals(True)
+            self.results.setCurrentRow(position)
+            self.results.blockSignals(False)
+        self.update_status()
+        self.match_activated.emit(*self.matches[position])
+
+    def on_result_row_changed(self, row):
+        if 0 <= row < len(self.matches):
+            self.activate(row)
+
+    # --- 置き換え ---
+
+    # 選んでいる一致を置き換えて、次の一致に進みます。
+    def replace_current(self):
+        self.ensure_searched()
+        if not 0 <= self.current < len(self.matches):
+            self.find_next()
+            return
+        pattern, regex, case_sensitive = self.options()
+        match = self.matches[self.current]
+        try:
+            replaced = self.index.replace_match(match, pattern, self.replace_edit.text(), regex, case_sensitive)
+        except re.error as e:
+            self.status_label.setText(f"置き換えられません: {e}")
+            return
+        if replaced is not None:
+            frame_index, index, _, _ = match
+            self.texts_replaced.emit([(frame_index, index, *replaced)])
+        self.run_search()
+        self.find_next()
+
+    # ドキュメント全体の一致をすべて置き換えます。元に戻すときは1回の操作として戻ります。
+    def replace_all(self):
+        pattern, regex, case_sensitive = self.options()
+        try:
+            changes = self.index.replacements(pattern, self.replace_edit.text(), regex, case_sensitive)
+        except re.error as e:
+            self.status_label.setText(f"置き換えられません: {e}")
+            return
+        if changes:
+            self.texts_replaced.emit(changes)
+        self.run_search()
+        self.status_label.setText(f"{len(changes)} 個のブロックを置き換えました")
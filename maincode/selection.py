@@ -0,0 +1,131 @@
+"""フレームとブロックの選択状態を管理するモデル (PySide6に依存しません)。
+
+選択が変わったときは、状態が変わった項目だけをコールバックで通知します。
+そのため、選択を1つ動かすコストはドキュメントの大きさに依存しません。
+"""
+
+
+class SelectionModel:
+    # on_frame_changed(frame, selected) と on_block_changed(frame, index, selected) は
+    # 選択状態が変わった項目ごとに呼ばれます。
+    def __init__(self, on_frame_changed=None, on_block_changed=None):
+        self.on_frame_changed = on_frame_changed
+        self.on_block_changed = on_block_changed
+        self.current_frame = None
+        self.current_block = None # current_frame 内でのブロック番号
+        self.anchor = None # 範囲選択の起点 (frame, index)
+        self.blocks = {} # frame -> 選択されているブロック番号の集合
+
+    # --- フレーム ---
+
+    # フレームを選択します。前に選択されていたフレームと新しいフレームだけが通知されます。
+    def select_frame(self, frame):
+        previous = self.current_frame
+        if previous is frame:
+            return
+        self.current_frame = frame
+        self.current_block = None
+        if previous is not None:
+            self.notify_frame(previous, False)
+        if frame is not None:
+            self.notify_frame(frame, True)
+
+    # --- ブロック ---
+
+    def is_block_selected(self, frame, index):
+        return index in self.blocks.get(frame, ())
+
+    # 選択されているブロックを (frame, index) の並びで返します。
+    def selected_blocks(self):
+        for frame, indexes in self.blocks.items():
+            for index in sorted(indexes):
+                yield frame, index
+
+    # ブロックを1つだけ選択します (他の選択は解除)。
+    def select_block(self, frame, index):
+        keep = {(frame, index)} if frame is not None and index is not None else set()
+        self.clear_blocks(keep=keep)
+        if keep:
+            self.add_block(frame, index)
+        self.set_current(frame, index)
+        self.anchor = (frame, index) if keep else None
+
+    # ブロックの選択を切り替えます (Ctrl+クリック)。
+    def toggle_block(self, frame, index):
+        if self.is_block_selected(frame, index):
+            self.remove_block(frame, index)
+        else:
+            self.add_block(frame, index)
+        self.set_current(frame, index)
+        self.anchor = (frame, index)
+
+    # 起点から指定したブロックまでを選択します (Shift+クリック)。
+    # 範囲は同じフレームの中だけで、起点が別のフレームにあるときは1つだけ選択します。
+    def select_range(self, frame, index):
+        if self.anchor is None or self.anchor[0] is not frame:
+            self.select_block(frame, index)
+            return
+        anchor_index = self.anchor[1]
+        first, last = sorted((anchor_index, index))
+        wanted = {(frame, i) for i in range(first, last + 1)}
+        self.clear_blocks(keep=wanted)
+        for i in range(first, last + 1):
+            self.add_block(frame, i)
+        self.set_current(frame, index)
+
+    # すべてのブロックの選択を解除します。keep に含まれるものは残します。
+    def clear_blocks(self, keep=()):
+        for frame, indexes in list(self.blocks.items()):
+            for index in list(indexes):
+                if (frame, index) not in keep:
+                    self.remove_block(frame, index)
+        if not keep:
+            self.current_block = None
+            self.anchor = None
+
+    # ブロックが取り除かれたときに、そのブロックの選択を解除します。
+    def forget_block(self, frame, index):
+        self.remove_block(frame, index)
+        if self.current_frame is frame and self.current_block == index:
+            self.current_block = None
+        if self.anchor == (frame, index):
+            self.anchor = None
+
+    # フレームが取り除かれたときに、そのフレームの選択を忘れます (通知はしません)。
+    def forget_frame(self, frame):
+        self.blocks.pop(frame, None)
+        if self.current_frame is frame:
+            self.current_frame = None
+            self.current_block = None
+        if self.anchor is not None and self.anchor[0] is frame:
+            self.anchor = None
+
+    def add_block(self, frame, index):
+        indexes = self.blocks.setdefault(frame, set())
+        if index in indexes:
+            return
+        indexes.add(index)
+        self.notify_block(frame, index, True)
+
+    def remove_block(self, frame, index):
+        indexes = self.blocks.get(frame)
+        if not indexes or index not in indexes:
+            return
+        indexes.discard(index)
+        if not indexes:
+            del self.blocks[frame]
+        self.notify_block(frame, index, False)
+
+    # 操作の対象になる (キーボードで移動する) ブロックを設定します。
+    def set_current(self, frame, index):
+        if frame is not None and frame is not self.current_frame:
+            self.select_frame(frame)
+        self.current_block = index
+
+    def notify_frame(self, frame, selected):
+        if self.on_frame_changed is not None:
+            self.on_frame_changed(frame, selected)
+
+    def notify_block(self, frame, index, selected):
+        if self.on_block_changed is not None:
+            self.on_block_changed(frame, index, selected)
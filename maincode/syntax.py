@@ -0,0 +1,175 @@
+"""コードを持つブロックのテキストの字句解析 (PySide6には依存しません)。
+
+if / while / for / function / return のブロックのテキストはPythonのコードの一部なので、
+キーワード・組み込み関数・文字列・数値・コメントに色を付けるためのトークンを求めます。
+ブロックのテキストは式や文の断片で ast や tokenize では読めないことが多いため、1行ずつ正規表現で区切ります。
+複数行にまたがる三重引用符の文字列だけは、行の終わりの状態として次の行に引き継ぎます。
+
+字句解析は SyntaxCache のスレッドで行い、結果はテキストのハッシュをキーにしてキャッシュします。
+GUIスレッドは request でキャッシュを引き、なければキューに入れて、できたときに on_ready で知らされます
+(on_ready はスレッドから呼ばれるので、GUIへはシグナルなどで渡してください)。
+    cache = SyntaxCache(on_ready=lambda keys: ...)
+    cache.start()
+    cache.request("while i < n")    # -> 行ごとのトークンの並び、まだなければ None
+1行ごとの結果も覚えておくので、編集したブロックを解析し直すときは変わった行だけを区切ります。
+"""
+import builtins
+import hashlib
+import keyword
+import re
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+CODE_KINDS = ("if", "while", "for", "function", "return") # テキストがコードのブロックの種類
+MAX_CACHED = 8192 # キャッシュしておくブロックのテキストの数
+MAX_CACHED_LINES = 16384 # 覚えておく1行ごとの結果の数
+BATCH = 64 # スレッドが1回に解析してから知らせるテキストの数
+
+# --- トークンの種類 ---
+KEYWORD = "keyword"
+BUILTIN = "builtin"
+STRING = "string"
+NUMBER = "number"
+COMMENT = "comment"
+
+KEYWORDS = frozenset(keyword.kwlist)
+BUILTINS = frozenset(name for name in dir(builtins) if not name.startswith("_"))
+TRIPLE_QUOTES = ("'''", '"""') # 行の終わりの状態は 0 (文字列の外) か、この位置 + 1
+
+TOKEN = re.compile(r"""
+    (?P<comment>\#.*)
+  | (?P<triple>[rRbBuUfF]{0,2}(?:'''|\"\"\"))
+  | (?P<string>[rRbBuUfF]{0,2}(?:"(?:[^"\\]|\\.)*"?|'(?:[^'\\]|\\.)*'?))
+  | (?P<number>\b(?:0[xXoObB][0-9a-fA-F_]+|\d[\d_]*\.?[\d_]*(?:[eE][+-]?\d+)?[jJ]?)\b|\.\d[\d_]*(?:[eE][+-]?\d+)?[jJ]?\b)
+  | (?P<name>[^\W\d]\w*)
+""", re.VERBOSE)
+
+
+# 1行を区切り、((開始, 長さ, 種類), ...) と行の終わりの状態を返します。state は前の行の終わりの状態です。
+@lru_cache(maxsize=MAX_CACHED_LINES)
+def tokenize_line(line, state=0):
+    tokens = []
+    position = 0
+    if state:
+        # 前の行から続く三重引用符の文字列
+        end = line.find(TRIPLE_QUOTES[state - 1])
+        if end < 0:
+            return ((0, len(line), STRING),) if line else (), state
+        position = end + 3
+        tokens.append((0, position, STRING))
+        state = 0
+
+    while True:
+        match = TOKEN.search(line, position)
+        if match is None:
+            break
+        start, position = match.span()
+        group = match.lastgroup
+        if group == "name":
+            word = match.group()
+            if word in KEYWORDS:
+                tokens.append((start, position - start, KEYWORD))
+            elif word in BUILTINS:
+                tokens.append((start, position - start, BUILTIN))
+        elif group == "triple":
+            quote = line[position - 3:position]
+            end = line.find(quote, position)
+            if end < 0:
+                tokens.append((start, len(line) - start, STRING))
+                return tuple(tokens), TRIPLE_QUOTES.index(quote) + 1
+            position = end + 3
+            tokens.append((start, position - start, STRING))
+        else:
+            tokens.append((start, position - start, group))
+    return tuple(tokens), state
+
+
+# テキスト全体を区切り、行ごとのトークンの並びを返します。
+def tokenize_text(text):
+    lines = []
+    state = 0
+    for line in text.split("\n"):
+        tokens, state = tokenize_line(line, state)
+        lines.append(tokens)
+    return tuple(lines)
+
+
+# テキストのキャッシュのキー
+def text_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class SyntaxCache:
+    def __init__(self, on_ready=None, max_cached=MAX_CACHED):
+        self.on_ready = on_ready # on_ready(キーの並び)。スレッドから呼ばれる
+        self.max_cached = max_cached
+        self.lock = threading.Lock() # cache と pending を守る
+        self.cache = OrderedDict() # ハッシュ -> 行ごとのトークン (最近使ったものが後ろ)
+        self.pending = deque() # まだ解析していない (ハッシュ, テキスト)
+        self.queued = set() # pending にあるハッシュ (同じテキストを2回入れない)
+        self.wake = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.tokenized = 0 # スレッドで解析したテキストの数
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+
+    # キャッシュにあれば行ごとのトークンを返します。なければ None。
+    def lookup(self, text, key=None):
+        key = key or text_key(text)
+        with self.lock:
+            tokens = self.cache.get(key)
+            if tokens is not None:
+                self.cache.move_to_end(key)
+            return tokens
+
+    # キャッシュにあれば行ごとのトークンを返し、なければスレッドの解析のキューに入れて None を返します。
+    def request(self, text, key=None):
+        key = key or text_key(text)
+        with self.lock:
+            tokens = self.cache.get(key)
+            if tokens is not None:
+                self.cache.move_to_end(key)
+                return tokens
+            if key not in self.queued:
+                self.queued.add(key)
+                self.pending.append((key, text))
+                self.idle.clear()
+                self.wake.set()
+        return None
+
+    # キューが空になるまで待ちます (ベンチマーク用)。待ちきれたら True。
+    def wait_idle(self, timeout=None):
+        return self.idle.wait(timeout)
+
+    # スレッド: キューのテキストを BATCH 個ずつ解析してキャッシュに入れ、on_ready で知らせます。
+    def run(self):
+        while not self.closed:
+            self.wake.wait()
+            self.wake.clear()
+            while not self.closed:
+                with self.lock:
+                    batch = [self.pending.popleft() for _ in range(min(BATCH, len(self.pending)))]
+                if not batch:
+                    break
+                results = [(key, tokenize_text(text)) for key, text in batch]
+                with self.lock:
+                    for key, tokens in results:
+                        self.cache[key] = tokens
+                        self.queued.discard(key)
+                    while len(self.cache) > self.max_cached:
+                        self.cache.popitem(last=False)
+                    self.tokenized += len(results)
+                if self.on_ready is not None:
+                    self.on_ready([key for key, tokens in results])
+            with self.lock:
+                if not self.pending:
+                    self.idle.set()
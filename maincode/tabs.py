@@ -0,0 +1,32 @@
+"""開いているドキュメントのタブ (PySide6には依存しません)。
+
+ウィジェットがあるのは表示しているタブのフレームだけで、切り替えるときは widget_pool で使い回します。
+タブごとに、ドキュメント・元に戻す履歴・検索の索引・ジャーナル・保存したか・スクロール位置・選択を覚えておきます。
+"""
+from pathlib import Path
+
+from document import Document
+from history import History
+
+UNTITLED = "Untitled"
+
+
+class DocumentTab:
+    __slots__ = ("document", "history", "search_index", "journal", "modified", "path", "scroll", "selection")
+
+    def __init__(self, document=None, path=None, search_index=None, journal=None):
+        self.document = document if document is not None else Document()
+        self.history = History()
+        self.search_index = search_index # このタブのドキュメントの検索の索引 (search.SearchIndex)
+        self.journal = journal # このタブの編集を自動保存する journal.Journal (自動保存しないときは None)
+        self.modified = False
+        self.path = path # 開いた・保存したファイル (なければ None)
+        self.scroll = (0, 0) # (横, 縦) のスクロール位置
+        self.selection = (None, None) # (フレームの位置, ブロックの番号)
+
+    def title(self):
+        return Path(self.path).name if self.path else UNTITLED
+
+    # 何も入っておらず、編集もしていないタブ (ファイルを開くときにそのまま使う)
+    def is_blank(self):
+        return not self.document.frames and not self.modified
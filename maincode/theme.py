@@ -0,0 +1,140 @@
+"""アプリ全体のスタイルシート。
+
+ウィジェットごとに setStyleSheet を呼ぶと、そのたびにスタイルシートの解析と
+再polishが走ります。ここではアプリに1つだけスタイルシートを設定し、
+選択などの状態はウィジェットの動的プロパティ (selected など) を切り替えて表します。
+"""
+from PySide6.QtWidgets import QApplication
+
+# --- 色 ---
+MENUBAR_COLOR = "#1C1C1C"
+SIDEBAR_COLOR = "#1F1F1F"
+SIDEBAR_BUTTON_COLOR = "#65F4D4"
+MAINBAR_COLOR = "#222222"
+FRAME_COLOR = "#2C2C2C"
+BLOCK_COLOR = "#333333"
+BORDER_COLOR = "#4A4A4A"
+BUTTON_BORDER_COLOR = "#555555"
+SELECTED_COLOR = "#4A90E2"
+CONTROL_COLOR = "#E2A54A" # if / while / for
+FUNCTION_COLOR = "#65F4D4" # function / return
+TITLE_TEXT_COLOR = "#AAAAAA"
+CONFLICT_COLOR = "#D7BA7D" # マージで解決されていない衝突の印のあるブロック (merge.py)
+CONFLICT_BLOCK_COLOR = "#3D3522"
+HEAT_COLORS = {"1": "#6B5A2E", "2": "#B0702E", "3": "#E24A4A"} # 実行したときのホットスポットの段階 (3 が最も時間がかかった)
+SYNTAX_COLORS = {"keyword": "#C586C0", "builtin": "#DCDCAA", "string": "#CE9178", "number": "#B5CEA8", "comment": "#6A9955"} # コードを持つブロックのトークン (syntax.py の種類)
+
+# role プロパティでメニューバー・サイドバー・メインバーを区別します。
+# 以前のウィジェットごとのスタイルシートは子ウィジェットにも効いていたので、同じように "*" で子にも適用します。
+# フレームとブロックの規則はメインバーの規則より詳細度を高くして、必ず優先されるようにしています。
+APP_STYLESHEET = f"""
+QFrame[role="menubar"], QFrame[role="menubar"] * {{
+    background-color: {MENUBAR_COLOR};
+}}
+QScrollArea[role="sidebar"], QScrollArea[role="sidebar"] * {{
+    background-color: {SIDEBAR_COLOR};
+    border: none;
+}}
+QScrollArea[role="sidebar"] QPushButton[role="sidebar-button"] {{
+    background-color: {SIDEBAR_BUTTON_COLOR};
+    color: #000000;
+    border: 1px solid {BUTTON_BORDER_COLOR};
+    border-radius: 4px;
+    padding: 5px;
+}}
+QTabBar[role="tabs"] {{
+    background-color: {MAINBAR_COLOR};
+}}
+QTabBar[role="tabs"]::tab {{
+    background-color: {MENUBAR_COLOR};
+    color: {TITLE_TEXT_COLOR};
+    border: 1px solid {BORDER_COLOR};
+    padding: 4px 12px;
+}}
+QTabBar[role="tabs"]::tab:selected {{
+    background-color: {FRAME_COLOR};
+    border-bottom: 2px solid {SELECTED_COLOR};
+}}
+QScrollArea[role="mainbar"], QScrollArea[role="mainbar"] * {{
+    background-color: {MAINBAR_COLOR};
+    border: none;
+}}
+QScrollArea[role="mainbar"] QtFrame, QScrollArea[role="mainbar"] QtFrame * {{
+    background-color: {FRAME_COLOR};
+    border: 1px solid {BORDER_COLOR};
+    border-radius: 5px;
+}}
+QScrollArea[role="mainbar"] QtFrame[selected="true"] {{
+    border: 2px solid {SELECTED_COLOR};
+}}
+QScrollArea[role="mainbar"] QtFrame QLabel {{
+    color: {TITLE_TEXT_COLOR};
+    padding: 5px;
+}}
+QScrollArea[role="mainbar"] QtFrame[selected="true"] QLabel {{
+    border: 2px solid {SELECTED_COLOR};
+}}
+QScrollArea[role="mainbar"] QtFrame QWidget[role="block-area"] {{
+    background-color: transparent;
+    border: none;
+}}
+QScrollArea[role="mainbar"] QtBlock, QScrollArea[role="mainbar"] QtBlock * {{
+    background-color: {BLOCK_COLOR};
+    border: 1px solid {BORDER_COLOR};
+    border-radius: 4px;
+}}
+QScrollArea[role="mainbar"] QtBlock[heat="1"] {{
+    border: 2px solid {HEAT_COLORS["1"]};
+}}
+QScrollArea[role="mainbar"] QtBlock[heat="2"] {{
+    border: 2px solid {HEAT_COLORS["2"]};
+}}
+QScrollArea[role="mainbar"] QtBlock[heat="3"] {{
+    border: 2px solid {HEAT_COLORS["3"]};
+}}
+QScrollArea[role="mainbar"] QtBlock[kind="if"],
+QScrollArea[role="mainbar"] QtBlock[kind="while"],
+QScrollArea[role="mainbar"] QtBlock[kind="for"] {{
+    border-left: 4px solid {CONTROL_COLOR};
+}}
+QScrollArea[role="mainbar"] QtBlock[kind="function"],
+QScrollArea[role="mainbar"] QtBlock[kind="return"] {{
+    border-left: 4px solid {FUNCTION_COLOR};
+}}
+QScrollArea[role="mainbar"] QtBlock[conflict="true"] {{
+    background-color: {CONFLICT_BLOCK_COLOR};
+    border: 2px solid {CONFLICT_COLOR};
+}}
+QScrollArea[role="mainbar"] QtBlock[selected="true"] {{
+    border: 2px solid {SELECTED_COLOR};
+}}
+QScrollArea[role="mainbar"] QtFrame QTextEdit[role="block-editor"],
+QScrollArea[role="mainbar"] QtFrame QTextEdit[role="block-editor"] * {{
+    background-color: {BLOCK_COLOR};
+    border: none;
+}}
+"""
+
+
+# アプリ全体にスタイルシートを設定します。
+def apply(app=None):
+    app = app or QApplication.instance()
+    app.setStyleSheet(APP_STYLESHEET)
+
+
+# ウィジェットの状態プロパティを変更し、そのウィジェットだけスタイルを再計算します。
+# 値が変わらないときは何もしません。
+def set_state(widget, name, value):
+    if widget.property(name) == value:
+        return False
+    widget.setProperty(name, value)
+    repolish(widget)
+    return True
+
+
+# プロパティの変更をスタイルに反映します。子ウィジェットは再計算しません。
+def repolish(widget):
+    style = widget.style()
+    style.unpolish(widget)
+    style.polish(widget)
+    widget.update()
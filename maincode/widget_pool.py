@@ -0,0 +1,49 @@
+"""フレームのウィジェット (QtFrame) の使い回し。
+
+ファイルを開いたりタブを切り替えたりするときに、フレームのウィジェットを作り直さず、
+使わなくなったフレームを隠してここに返し、次のドキュメントのデータに結び付け直して使います。
+フレームは画面外に出たブロックのウィジェット (spare_blocks) を持ったまま返されるので、ブロックも作り直しません。
+上限を超えたフレームとブロックは deleteLater で消します。すべてのタブが同じプールを使います。
+"""
+
+MAX_SPARE_FRAMES = 64 # プールに残すフレームの数
+MAX_SPARE_BLOCKS = 48 # プールのフレーム1つに残すブロックのウィジェットの数 (1つのフレームで見える分より少し多く)
+
+
+class WidgetPool:
+    # create_frame(number, model) は新しい QtFrame を作って返す関数です (シグナルの接続もそこで行う)。
+    def __init__(self, create_frame, max_frames=MAX_SPARE_FRAMES, max_blocks=MAX_SPARE_BLOCKS):
+        self.create_frame = create_frame
+        self.max_frames = max_frames
+        self.max_blocks = max_blocks
+        self.spare_frames = []
+        self.created = 0 # 作ったフレームの数
+        self.reused = 0 # 使い回したフレームの数
+        self.deleted = 0 # 上限を超えて消したフレームとブロックの数
+
+    # 番号とデータを結び付けたフレームを返します。
+    def acquire(self, number, model):
+        if self.spare_frames:
+            frame = self.spare_frames.pop()
+            frame.rebind(number, model)
+            self.reused += 1
+            return frame
+        self.created += 1
+        return self.create_frame(number, model)
+
+    # 使わなくなったフレームを返します。レイアウトから外すのは呼ぶ側で行います。
+    def release(self, frame):
+        frame.unbind()
+        if len(self.spare_frames) >= self.max_frames:
+            self.deleted += 1 + len(frame.spare_blocks)
+            frame.deleteLater()
+            return
+        self.deleted += frame.trim_spare_blocks(self.max_blocks)
+        self.spare_frames.append(frame)
+
+    # プールのフレームをすべて消します。
+    def clear(self):
+        for frame in self.spare_frames:
+            frame.deleteLater()
+        self.deleted += len(self.spare_frames)
+        self.spare_frames.clear()
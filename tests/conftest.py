@@ -0,0 +1,11 @@
+"""テストの共通の設定。
+
+maincode のモジュールを import できるようにし、Qt を使うテストは画面なし (offscreen) で動かします。
+    python -m pytest -q
+"""
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "maincode"))
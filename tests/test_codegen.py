@@ -0,0 +1,132 @@
+"""codegen.py (フローチャートからのコード生成と、フレームごとのキャッシュ) のテスト。"""
+import ast
+
+import pytest
+
+import codegen
+from codegen import CodeGenerator, frame_key, generate_frame, strip_keyword
+from document import Document
+
+DATA = [
+    [["def f(a)", "function"], ["while a > 0", "while"], ["a -= 1"], ["return a", "return"]],
+    [["if x > 0:", "if"], ["", "true"], ["y = 1"], ["", "false"], ["return y", "return"]],
+    [["print('frame 3')"]],
+]
+
+
+@pytest.mark.parametrize("text, kind, expected", [
+    ("return x", "return", "x"),
+    ("returned", "return", "returned"), # キーワードの一部ではない
+    ("  if x > 0:", "if", "x > 0"),
+    ("x > 0", "if", "x > 0"),
+    ("while  a:  ", "while", "a"),
+    ("for i in range(3):", "for", "i in range(3)"),
+    ("x[1:]", "return", "x[1:]"), # return の後ろの「:」は残す
+])
+def test_strip_keyword(text, kind, expected):
+    assert strip_keyword(text, kind) == expected
+
+
+def test_generate_frame_structure():
+    function = generate_frame(1, [("def f(a)", "function"), ("while a > 0", "while"), ("a -= 1", None), ("return a", "return")])
+    assert function.name == "f"
+    assert function.source == "def f(a):\n    while a > 0:\n        a -= 1\n    return a"
+    assert function.line_blocks == [0, 1, 2, 3]
+    assert function.error is None
+
+    branch = generate_frame(2, [("if x > 0:", "if"), ("", "true"), ("y = 1", None), ("", "false"), ("return y", "return")])
+    assert branch.name == "frame_2"
+    assert branch.source == "def frame_2():\n    if x > 0:\n        y = 1\n    else:\n        return y"
+    assert branch.line_blocks == [None, 0, 2, 3, 4]
+
+    assert generate_frame(3, []).source == "def frame_3():\n    pass"
+
+
+def test_syntax_error_points_to_block():
+    code = generate_frame(1, [("x = 1", None), ("y = (", None), ("z = 2", None)])
+    assert code.error is not None
+    assert code.error[0] == 1
+
+
+def test_module_maps_lines_to_blocks():
+    module = CodeGenerator().generate(Document.from_data(DATA))
+    ast.parse(module.source)
+    assert module.errors() == []
+    lines = module.source.split("\n")
+    for lineno, line in enumerate(lines, 1):
+        if "a -= 1" in line:
+            assert module.locate(lineno) == (0, 2)
+        if "print(" in line:
+            assert module.locate(lineno) == (2, 0)
+    assert module.locate(1) is None # 先頭のコメント
+    assert len(module.line_map()) == module.source.count("\n")
+
+
+def test_unchanged_frames_come_from_cache():
+    document = Document.from_data(DATA)
+    generator = CodeGenerator()
+    first = generator.generate(document)
+    assert generator.generated == 3
+
+    second = generator.generate(document)
+    assert generator.generated == 3
+    assert second.source == first.source
+
+    # 1つのブロックを編集すると、そのフレームだけを作り直す
+    document.frames[1].set_text(2, "y = 2")
+    third = generator.generate(document)
+    assert generator.generated == 4
+    assert third.frames[0] is first.frames[0]
+    assert third.frames[2] is first.frames[2]
+    assert "y = 2" in third.source
+
+    # 元に戻すと、前に作ったコードを使う
+    document.frames[1].set_text(2, "y = 1")
+    assert generator.generate(document).source == first.source
+    assert generator.generated == 4
+
+
+def test_cache_key_includes_frame_number():
+    # 同じ中身でも、位置が変われば関数の名前が変わる
+    document = Document.from_data([[["pass"]], [["pass"]]])
+    generator = CodeGenerator()
+    module = generator.generate(document)
+    assert [code.name for code in module.frames] == ["frame_1", "frame_2"]
+    assert generator.generated == 2
+    assert frame_key(1, document.frames[0]) != frame_key(2, document.frames[0])
+    assert frame_key(1, document.frames[0]) == frame_key(1, document.frames[1])
+
+    # フレームを消すと、後ろのフレームは番号が変わるので作り直す
+    del document.frames[0]
+    assert [code.name for code in generator.generate(document).frames] == ["frame_1"]
+    assert len(generator.seen) == 1
+
+
+def test_cache_is_bounded():
+    generator = CodeGenerator(max_cached=2)
+    document = Document.from_data(DATA)
+    generator.generate(document)
+    assert len(generator.cache) == 2
+    document.frames[2].set_text(0, "print('changed')")
+    generator.generate(document)
+    assert len(generator.cache) == 2
+
+
+def test_unread_flairb_frames_are_not_loaded(tmp_path):
+    path = tmp_path / "doc.flairb"
+    Document.from_data(DATA).save(path)
+    document = Document.load(path)
+    module = CodeGenerator().generate(document)
+    assert module.source == CodeGenerator().generate(Document.from_data(DATA)).source
+    assert not any(frame.is_loaded() for frame in document.frames)
+
+
+def test_command_line_check(tmp_path, capsys):
+    good = tmp_path / "good.json"
+    bad = tmp_path / "bad.json"
+    Document.from_data(DATA).save(good)
+    Document.from_data([[["x = 1"], ["y = ("]]]).save(bad)
+    assert codegen.main([str(good), "--output-dir", str(tmp_path / "out")]) == 0
+    assert (tmp_path / "out" / "good.py").read_text(encoding="utf-8").startswith(codegen.HEADER)
+    assert codegen.main([str(good), str(bad), "--check"]) == 1
+    assert "bad.json: Frame 1, block 2" in capsys.readouterr().err
@@ -0,0 +1,112 @@
+"""document.py と flairb.py (PySide6 を使わないドキュメントモデル) のテスト。"""
+import json
+
+import flairb
+from document import Document, iter_frames
+
+DATA = [
+    [["x = 1"], ["x > 0", "if"], ["print('正')", None], ["return x", "return"]],
+    [],
+    [["複数行\n  のテキスト\t", "while"], ["", "false"], ["絵文字 😀"]],
+]
+
+
+def expected_json(data):
+    return json.dumps(Document.from_data(data).to_data(), indent=2, ensure_ascii=False)
+
+
+def test_dumps_matches_json_dumps():
+    document = Document.from_data(DATA)
+    assert document.dumps() == expected_json(DATA)
+    assert Document().dumps() == json.dumps([], indent=2)
+
+
+def test_kind_none_is_not_saved():
+    document = Document.from_data([[["a", "none"], ["b", ""], ["c", "if"]]])
+    assert document.to_data() == [[["a"], ["b"], ["c", "if"]]]
+
+
+def test_cached_json_is_rebuilt_after_edit():
+    document = Document.from_data(DATA)
+    before = document.dumps()
+    frame = document.frames[0]
+    revision = frame.revision
+    frame.set_text(0, "x = 2")
+    assert frame.revision > revision
+    assert document.dumps() == json.dumps(document.to_data(), indent=2, ensure_ascii=False)
+    assert document.dumps() != before
+
+    frame.append_block("y", "while")
+    frame.set_kind(0, "if")
+    assert document.dumps() == json.dumps(document.to_data(), indent=2, ensure_ascii=False)
+    frame.pop_block()
+    assert document.dumps() == json.dumps(document.to_data(), indent=2, ensure_ascii=False)
+
+
+def test_same_text_does_not_change_revision():
+    frame = Document.from_data(DATA).frames[0]
+    revision = frame.revision
+    frame.set_text(0, frame.text(0))
+    frame.set_kind(1, "if")
+    assert frame.revision == revision
+
+
+def test_json_save_load_round_trip(tmp_path):
+    path = tmp_path / "doc.json"
+    Document.from_data(DATA).save(path)
+    assert path.read_text(encoding="utf-8") == expected_json(DATA)
+    assert Document.load(path).to_data() == Document.from_data(DATA).to_data()
+
+
+def test_flairb_save_load_round_trip(tmp_path):
+    path = tmp_path / "doc.flairb"
+    Document.from_data(DATA).save(path)
+    assert flairb.is_binary_file(path)
+    loaded = Document.load(path)
+    # 中身は使うときに読むが、ブロック数は読まずに分かる
+    assert [len(frame) for frame in loaded.frames] == [4, 0, 3]
+    assert not any(frame.is_loaded() for frame in loaded.frames if len(frame))
+    assert loaded.to_data() == Document.from_data(DATA).to_data()
+
+
+def test_flairb_keeps_lone_surrogates(tmp_path):
+    # 貼り付けなどで入った、対になっていないサロゲートもそのまま残す
+    path = tmp_path / "doc.flairb"
+    Document.from_data([[["\ud800 壊れた文字"]]]).save(path)
+    assert Document.load(path).to_data() == [[["\ud800 壊れた文字"]]]
+
+
+def test_flairb_unread_frames_are_copied_without_decoding(tmp_path):
+    path = tmp_path / "doc.flairb"
+    Document.from_data(DATA).save(path)
+    loaded = Document.load(path)
+    copy_path = tmp_path / "copy.flairb"
+    loaded.save(copy_path)
+    assert not loaded.frames[0].is_loaded()
+    assert copy_path.read_bytes() == path.read_bytes()
+
+
+def test_flairb_overwrite_own_file(tmp_path):
+    path = tmp_path / "doc.flairb"
+    Document.from_data(DATA).save(path)
+    loaded = Document.load(path)
+    loaded.frames[2].set_text(0, "changed")
+    loaded.save(path)
+    data = Document.from_data(DATA).to_data()
+    data[2][0][0] = "changed"
+    assert Document.load(path).to_data() == data
+
+
+def test_json_and_flairb_convert_both_ways(tmp_path):
+    Document.from_data(DATA).save(tmp_path / "a.flairb")
+    Document.load(tmp_path / "a.flairb").save(tmp_path / "b.json")
+    Document.load(tmp_path / "b.json").save(tmp_path / "c.flairb")
+    assert (tmp_path / "b.json").read_text(encoding="utf-8") == expected_json(DATA)
+    assert Document.load(tmp_path / "c.flairb").to_data() == Document.from_data(DATA).to_data()
+
+
+def test_iter_frames_reads_frames_in_order():
+    text = expected_json(DATA)
+    frames = list(iter_frames(text))
+    assert [frame.to_data() for frame, _ in frames] == Document.from_data(DATA).to_data()
+    assert frames[-1][1] < len(text)
@@ -0,0 +1,193 @@
+"""history.py (差分で持つ元に戻す・やり直しの履歴) のテスト。"""
+import random
+
+from document import Document, Frame
+from history import COALESCE_SECONDS, AddBlock, AddFrame, EditGroup, EditText, History, LoadDocument, ResizeFrames, apply_diff, text_diff
+
+
+class Editor:
+    """FlairApp の代わりに、ドキュメントのモデルだけを変える editor。"""
+
+    def __init__(self, document):
+        self.document = document
+        self.cursor = None
+
+    def append_frame(self, frame):
+        self.document.frames.append(frame)
+
+    def remove_last_frame(self):
+        self.document.frames.pop()
+
+    def append_block(self, frame_index, block):
+        self.document.frames[frame_index].push_block(block)
+
+    def remove_last_block(self, frame_index):
+        return self.document.frames[frame_index].pop_block()
+
+    def block_text(self, frame_index, index):
+        return self.document.frames[frame_index].text(index)
+
+    def set_block_text(self, frame_index, index, text, cursor):
+        self.document.frames[frame_index].set_text(index, text)
+        self.cursor = cursor
+
+    def set_frame_width(self, frame_index, width):
+        self.document.frames[frame_index].width = width
+
+    def replace_document(self, document):
+        self.document = document
+
+
+# ブロックのテキストを変え、その操作を履歴に入れます (FlairApp で入力したときと同じ)。
+def type_text(history, editor, frame_index, index, text):
+    old = editor.block_text(frame_index, index)
+    editor.document.frames[frame_index].set_text(index, text)
+    history.push(EditText(frame_index, index, old, text))
+
+
+def make_editor(data=(((("",),),))):
+    return Editor(Document.from_data([[list(block) for block in frame] for frame in data]))
+
+
+def test_text_diff_round_trip():
+    rng = random.Random(1)
+    for _ in range(2000):
+        old = "".join(rng.choice("ab\n") for _ in range(rng.randrange(8)))
+        new = "".join(rng.choice("ab\n") for _ in range(rng.randrange(8)))
+        start, removed, inserted = text_diff(old, new)
+        assert old[start:start + len(removed)] == removed
+        assert apply_diff(old, start, removed, inserted) == new
+        assert apply_diff(new, start, inserted, removed) == old
+
+
+def test_continuous_typing_is_one_command():
+    history = History()
+    editor = make_editor()
+    for text in ("h", "he", "hel", "help", "hel", "hell", "hello"):
+        type_text(history, editor, 0, 0, text)
+    assert len(history.undo_stack) == 1
+    assert history.undo(editor)
+    assert editor.block_text(0, 0) == ""
+    assert editor.cursor == 0
+    assert history.redo(editor)
+    assert editor.block_text(0, 0) == "hello"
+    assert editor.cursor == 5
+
+
+def test_typing_after_pause_or_elsewhere_is_separate():
+    history = History()
+    editor = make_editor((((("abc"),), (("xyz"),)),))
+    type_text(history, editor, 0, 0, "abcd")
+    history.undo_stack[-1].time -= COALESCE_SECONDS + 1
+    type_text(history, editor, 0, 0, "abcde")
+    type_text(history, editor, 0, 1, "xyz!") # 別のブロック
+    type_text(history, editor, 0, 1, "Xyz!") # 同じブロックの離れた場所
+    assert len(history.undo_stack) == 4
+    for expected in (("abcde", "xyz!"), ("abcde", "xyz"), ("abcd", "xyz"), ("abc", "xyz")):
+        history.undo(editor)
+        assert (editor.block_text(0, 0), editor.block_text(0, 1)) == expected
+
+
+def test_merged_edits_undo_to_original_text():
+    rng = random.Random(2)
+    for _ in range(300):
+        history = History()
+        original = "".join(rng.choice("abc") for _ in range(rng.randrange(6)))
+        editor = make_editor((((original,),),))
+        texts = [original]
+        for _ in range(rng.randrange(1, 6)):
+            text = texts[-1]
+            position = rng.randrange(len(text) + 1)
+            if text and rng.random() < 0.4:
+                text = text[:position] + text[position + 1:]
+            else:
+                text = text[:position] + rng.choice("xyz") + text[position:]
+            texts.append(text)
+            type_text(history, editor, 0, 0, text)
+        while history.undo(editor):
+            pass
+        assert editor.block_text(0, 0) == original
+        while history.redo(editor):
+            pass
+        assert editor.block_text(0, 0) == texts[-1]
+
+
+def test_push_after_undo_drops_redo():
+    history = History()
+    editor = make_editor()
+    type_text(history, editor, 0, 0, "a")
+    history.undo(editor)
+    assert history.can_redo()
+    type_text(history, editor, 0, 0, "b")
+    assert not history.can_redo()
+    assert history.size == sum(command.size() for command in history.undo_stack)
+
+
+def test_structure_commands_undo_and_redo():
+    history = History()
+    editor = make_editor()
+    frame = editor.document.add_frame()
+    history.push(AddFrame(frame))
+    editor.document.frames[1].append_block("new", "if")
+    history.push(AddBlock(1))
+    editor.set_frame_width(0, 300)
+    history.push(ResizeFrames([(0, None, 300)]))
+    after = editor.document.to_data()
+
+    for _ in range(3):
+        history.undo(editor)
+    assert editor.document.to_data() == [[[""]]]
+    assert editor.document.frames[0].width is None
+    for _ in range(3):
+        history.redo(editor)
+    assert editor.document.to_data() == after
+    assert editor.document.frames[1] is frame # やり直すと同じフレームが戻る
+    assert editor.document.frames[0].width == 300
+
+
+def test_edit_group_undoes_all_at_once():
+    history = History()
+    editor = make_editor((((("a"),), (("b"),)),))
+    commands = []
+    for index, text in ((0, "A"), (1, "B")):
+        commands.append(EditText(0, index, editor.block_text(0, index), text))
+        editor.document.frames[0].set_text(index, text)
+    history.push(EditGroup(commands))
+    history.undo(editor)
+    assert editor.document.to_data() == [[["a"], ["b"]]]
+    history.redo(editor)
+    assert editor.document.to_data() == [[["A"], ["B"]]]
+
+
+def test_load_document_swaps_documents():
+    history = History()
+    editor = make_editor()
+    old = editor.document
+    new = Document([Frame.from_data([["loaded"]])])
+    history.push(LoadDocument(old, new))
+    editor.replace_document(new)
+    history.undo(editor)
+    assert editor.document is old
+    history.redo(editor)
+    assert editor.document is new
+
+
+def test_budget_evicts_oldest_but_keeps_last():
+    history = History(memory_budget=1000)
+    editor = make_editor()
+    for number in range(50):
+        type_text(history, editor, 0, 0, f"{number}" * 20)
+        history.can_merge = False # 1回ずつ別のコマンドにする
+    assert history.size <= 1000
+    assert history.size == sum(command.size() for command in history.undo_stack)
+    assert 1 < len(history.undo_stack) < 50
+    # 残っている分は元に戻せる
+    count = len(history.undo_stack)
+    for _ in range(count):
+        history.undo(editor)
+    assert editor.block_text(0, 0) == f"{50 - count - 1}" * 20
+
+    # 1つのコマンドが予算より大きくても、直前のものは残る
+    history = History(memory_budget=10)
+    type_text(history, editor, 0, 0, "x" * 100)
+    assert len(history.undo_stack) == 1
@@ -0,0 +1,123 @@
+"""journal.py (編集操作のジャーナルと、異常終了した後の復元) のテスト。"""
+import json
+
+import journal
+from document import Document
+from journal import JOURNAL_NAME, Journal, coalesce, frame_snapshot, read_recovery
+
+
+# 書き込みスレッドを待たずにすぐ書く Journal を開始します。
+def start_journal(directory, **kwargs):
+    writer = Journal(directory, flush_interval=0.001, **kwargs)
+    writer.start()
+    return writer
+
+
+def edit(writer):
+    writer.add_frame()
+    writer.add_block(0, "a")
+    writer.add_block(0, "x > 0", "if")
+    writer.set_text(0, 0, "ab")
+    writer.set_text(0, 0, "abc")
+    writer.resize(0, 320)
+    writer.add_frame()
+    writer.add_block(1, "b")
+    writer.pop_block(1)
+
+
+def test_recover_after_close_without_discard(tmp_path):
+    writer = start_journal(tmp_path)
+    edit(writer)
+    writer.close()
+    document, seq = read_recovery(tmp_path)
+    assert document.to_data() == [[["abc"], ["x > 0", "if"]], []]
+    assert document.frames[0].width == 320
+    assert seq > 0
+
+
+def test_recover_across_compaction(tmp_path):
+    writer = start_journal(tmp_path, compact_ops=2)
+    edit(writer)
+    writer.close()
+    assert len(list(tmp_path.glob(journal.SNAPSHOT_PREFIX + "*"))) == 1
+    document, _ = read_recovery(tmp_path)
+    assert document.to_data() == [[["abc"], ["x > 0", "if"]], []]
+    assert document.frames[0].width == 320
+
+
+def test_writer_continues_previous_journal(tmp_path):
+    writer = start_journal(tmp_path)
+    writer.add_frame()
+    writer.add_block(0, "first")
+    writer.close()
+    writer = start_journal(tmp_path)
+    writer.add_block(0, "second")
+    writer.close()
+    assert read_recovery(tmp_path)[0].to_data() == [[["first"], ["second"]]]
+
+
+def test_half_written_last_line_is_ignored(tmp_path):
+    writer = start_journal(tmp_path)
+    writer.add_frame()
+    writer.add_block(0, "kept")
+    writer.close()
+    with open(tmp_path / JOURNAL_NAME, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"op": journal.ADD_BLOCK, "frame": 0, "text": "lost", "kind": None, "seq": 99})[:20])
+    assert read_recovery(tmp_path)[0].to_data() == [[["kept"]]]
+
+
+def test_discard_removes_journal_and_directory(tmp_path):
+    directory = tmp_path / "tab-0"
+    writer = start_journal(directory)
+    edit(writer)
+    writer.close(discard=True)
+    assert not journal.has_recovery(directory)
+    assert not directory.exists()
+
+
+def test_reset_from_file(tmp_path):
+    path = tmp_path / "doc.flairb"
+    Document.from_data([[["f1"], ["f2", "while"]]]).save(path)
+    writer = start_journal(tmp_path / "journal")
+    writer.add_frame() # ファイルを開く前の編集は、開いたファイルの内容で置き換わる
+    writer.reset(str(path))
+    writer.add_block(0, "after")
+    writer.close()
+    assert read_recovery(tmp_path / "journal")[0].to_data() == [[["f1"], ["f2", "while"], ["after"]]]
+
+
+def test_reset_from_snapshots_of_read_and_unread_frames(tmp_path):
+    path = tmp_path / "doc.flairb"
+    Document.from_data([[["a"]], [["b", "if"]]]).save(path)
+    document = Document.load(path)
+    document.frames[0].set_text(0, "edited")
+    snapshots = [frame_snapshot(frame) for frame in document.frames]
+    assert isinstance(snapshots[1], tuple) # 読んでいないフレームはバイト列のまま渡す
+    assert not document.frames[1].is_loaded()
+
+    writer = start_journal(tmp_path / "journal")
+    writer.reset(frames=snapshots)
+    document.frames[0].set_text(0, "later") # 写しなので、後の変更は入らない
+    writer.close()
+    assert read_recovery(tmp_path / "journal")[0].to_data() == [[["edited"]], [["b", "if"]]]
+
+
+def test_recovery_dirs_in_tab_order(tmp_path):
+    for name in ("tab-10", "tab-2", "tab-x", "tab-3"):
+        (tmp_path / name).mkdir()
+    for name in ("tab-10", "tab-2", "tab-x"):
+        (tmp_path / name / JOURNAL_NAME).write_text("")
+    (tmp_path / JOURNAL_NAME).write_text("") # タブごとに分ける前のジャーナル
+    assert journal.recovery_dirs(tmp_path) == [tmp_path, tmp_path / "tab-2", tmp_path / "tab-10"]
+    assert journal.new_journal_dir(tmp_path) == tmp_path / "tab-0"
+
+
+def test_coalesce_keeps_last_text_of_same_block():
+    ops = [
+        {"op": journal.SET_TEXT, "frame": 0, "block": 0, "text": "a"},
+        {"op": journal.SET_TEXT, "frame": 0, "block": 0, "text": "ab"},
+        {"op": journal.SET_TEXT, "frame": 0, "block": 1, "text": "c"},
+        {"op": journal.ADD_BLOCK, "frame": 0, "text": "", "kind": None},
+        {"op": journal.SET_TEXT, "frame": 0, "block": 1, "text": "cd"},
+    ]
+    assert [op.get("text") for op in coalesce(ops)] == ["ab", "c", "", "cd"]
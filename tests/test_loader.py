@@ -0,0 +1,137 @@
+"""DocumentLoader (読み込みを GUI スレッドを止めずに行うローダー) のテスト。画面なし (offscreen) で動きます。"""
+import json
+import time
+
+import pytest
+
+pytest.importorskip("PySide6")
+
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+from document import Document  # noqa: E402
+from loader import DocumentLoader  # noqa: E402
+
+FRAMES = 100
+BLOCKS_PER_FRAME = 200
+TIMEOUT = 60 # 秒
+
+
+@pytest.fixture(scope="module")
+def qapp():
+    return QApplication.instance() or QApplication([])
+
+
+# 大きいドキュメントを suffix (.json / .flairb) の形式で書き出します。
+def write_large_document(directory, suffix):
+    data = [[[f"frame {f} block {b}"] for b in range(BLOCKS_PER_FRAME)] for f in range(FRAMES)]
+    path = directory / f"large{suffix}"
+    if suffix == ".json":
+        path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    else:
+        Document.from_data(data).save(path)
+    return path
+
+
+# 読み込みが終わるまでイベントループを回します。
+def run_until_stopped(qapp, loader, on_iteration=None):
+    deadline = time.monotonic() + TIMEOUT
+    while loader.is_running():
+        assert time.monotonic() < deadline, "読み込みが終わりません"
+        qapp.processEvents()
+        if on_iteration is not None:
+            on_iteration()
+
+
+@pytest.mark.parametrize("suffix", [".json", ".flairb"])
+def test_frames_arrive_before_loading_finishes(qapp, tmp_path, suffix):
+    path = write_large_document(tmp_path, suffix)
+    events = []
+    frames = []
+    loader = DocumentLoader(str(path), time_slice_ms=0) # 1回の取り出しで1フレームずつ
+    loader.frame_loaded.connect(lambda frame: (frames.append(frame), events.append("frame")))
+    loader.finished.connect(lambda: events.append("finished"))
+    loader.failed.connect(lambda message: events.append(message))
+
+    # 読み込みの途中で、フレームがすでに届いているイベントループの回があること
+    partial = []
+    loader.start()
+    run_until_stopped(qapp, loader, lambda: partial.append(bool(frames) and loader.is_running()))
+
+    assert events[0] == "frame"
+    assert events[-1] == "finished"
+    assert any(partial)
+    assert len(frames) == FRAMES
+    assert sum(len(frame) for frame in frames) == FRAMES * BLOCKS_PER_FRAME
+    assert [frame.text(0) for frame in frames] == [f"frame {f} block 0" for f in range(FRAMES)]
+
+
+def test_nested_event_processing_keeps_frame_order(qapp, tmp_path):
+    # モーダルの QProgressDialog.setValue のように、通知の中でイベントを処理されても順序が変わらないこと
+    path = write_large_document(tmp_path, ".json")
+    frames = []
+    loader = DocumentLoader(str(path), time_slice_ms=0) # 1回の取り出しで1フレームずつ
+    loader.frame_loaded.connect(frames.append)
+    loader.progress.connect(lambda percent: qapp.processEvents())
+    loader.start()
+    run_until_stopped(qapp, loader)
+    assert [frame.text(0) for frame in frames] == [f"frame {f} block 0" for f in range(FRAMES)]
+
+
+def test_broken_file_reports_failure(qapp, tmp_path):
+    path = tmp_path / "broken.json"
+    path.write_text('[[["a"]], [["b"', encoding="utf-8")
+    events = []
+    loader = DocumentLoader(str(path))
+    loader.frame_loaded.connect(lambda frame: events.append("frame"))
+    loader.finished.connect(lambda: events.append("finished"))
+    loader.failed.connect(lambda message: events.append("failed"))
+    loader.start()
+    run_until_stopped(qapp, loader)
+    assert events == ["frame", "failed"]
+
+
+def test_cancel_keeps_loaded_frames(qapp, tmp_path):
+    path = write_large_document(tmp_path, ".json")
+    frames = []
+    loader = DocumentLoader(str(path), time_slice_ms=0) # 1回の取り出しで1フレームずつ
+    loader.frame_loaded.connect(frames.append)
+    loader.start()
+    deadline = time.monotonic() + TIMEOUT
+    while not frames:
+        assert time.monotonic() < deadline
+        qapp.processEvents()
+    loader.cancel()
+    count = len(frames)
+    for _ in range(20):
+        qapp.processEvents()
+    assert not loader.is_running()
+    assert 0 < len(frames) == count
+
+
+def test_window_shows_first_frame_before_loading_finishes(qapp, tmp_path):
+    from Flair import FlairApp
+
+    path = write_large_document(tmp_path, ".json")
+    window = FlairApp()
+    window.resize(1200, 800)
+    window.show()
+    try:
+        start = time.perf_counter()
+        window.load_file(str(path))
+        first_frame = []
+
+        def check():
+            if window.frames and not first_frame and window.loader.is_running():
+                first_frame.append(time.perf_counter() - start)
+
+        run_until_stopped(qapp, window.loader, check)
+        total = time.perf_counter() - start
+        qapp.processEvents()
+
+        assert first_frame and first_frame[0] < total
+        assert len(window.frames) == FRAMES
+        assert window.document.block_count() == FRAMES * BLOCKS_PER_FRAME
+        assert [frame.text(0) for frame in window.document.frames] == [f"frame {f} block 0" for f in range(FRAMES)]
+        assert [frame.model for frame in window.frames] == window.document.frames
+    finally:
+        window.close()
@@ -0,0 +1,182 @@
+"""merge.py (ドキュメントの構造の差分と3方向のマージ) と flair diff / merge のテスト。"""
+import json
+import random
+
+import pytest
+
+import flair_cli
+from document import Block, Document
+from merge import OURS_MARKER, SEPARATOR_MARKER, THEIRS_MARKER, Merger, block_similarity, diff_documents, has_conflict, merge_text, pair_leftovers
+
+KINDS = (None, None, None, "if", "while", "return")
+
+
+def merge(base, ours, theirs):
+    merger = Merger()
+    merged = merger.merge(*(Document.from_data(data) for data in (base, ours, theirs)))
+    return merged.to_data(), merger.conflicts
+
+
+def random_block(rng):
+    lines = ["".join(rng.choice("abc") for _ in range(rng.randrange(1, 4))) for _ in range(rng.randrange(1, 4))]
+    kind = rng.choice(KINDS)
+    return ["\n".join(lines), kind] if kind else ["\n".join(lines)]
+
+
+def random_document(rng):
+    return [[random_block(rng) for _ in range(rng.randrange(5))] for _ in range(rng.randrange(1, 5))]
+
+
+# フレーム・ブロックの追加と削除、テキストと種類の変更を count 回したドキュメントを返します。
+def random_edit(rng, data, count):
+    data = json.loads(json.dumps(data))
+    for _ in range(count):
+        choice = rng.random()
+        if choice < 0.1 or not data:
+            data.insert(rng.randrange(len(data) + 1), [random_block(rng)])
+        elif choice < 0.2:
+            del data[rng.randrange(len(data))]
+        else:
+            frame = rng.choice(data)
+            if choice < 0.5 or not frame:
+                frame.insert(rng.randrange(len(frame) + 1), random_block(rng))
+            elif choice < 0.6:
+                del frame[rng.randrange(len(frame))]
+            else:
+                frame[rng.randrange(len(frame))] = random_block(rng)
+    return data
+
+
+def test_one_sided_and_identical_changes_merge_cleanly():
+    rng = random.Random(4)
+    for _ in range(500):
+        base = random_document(rng)
+        changed = random_edit(rng, base, rng.randrange(1, 6))
+        expected = Document.from_data(changed).to_data()
+        for revisions in ((base, base, changed), (base, changed, base), (base, changed, changed)):
+            assert merge(*revisions) == (expected, [])
+
+
+@pytest.mark.parametrize("base, ours, theirs, expected, conflicts", [
+    # 同じフレームの別のブロックを変えた
+    ([[["a"], ["b"], ["c"]]], [[["A"], ["b"], ["c"]]], [[["a"], ["b"], ["C"]]],
+     [[["A"], ["b"], ["C"]]], []),
+    # 別のフレームを変えた
+    ([[["a"]], [["b"]]], [[["a"], ["a2"]], [["b"]]], [[["a"]], [["B"]]],
+     [[["a"], ["a2"]], [["B"]]], []),
+    # 片方がブロックを変え、もう片方が同じブロックの別の行を変えて後ろに追加した
+    ([[["a"], ["l1\nl2\nl3"]]], [[["a"], ["L1\nl2\nl3"]]], [[["a"], ["l1\nl2\nL3"], ["c"]]],
+     [[["a"], ["L1\nl2\nL3"], ["c"]]], []),
+    # 片方がフレームのブロックを変え、もう片方が同じフレームに追加してフレームも追加した
+    ([[["a"], ["b"]]], [[["a"], ["B"]]], [[["a"], ["b"], ["x"]], [["new"]]],
+     [[["a"], ["B"], ["x"]], [["new"]]], []),
+    # 種類とテキストを別々に変えた
+    ([[["if x", "if"]]], [[["if x > 0", "if"]]], [[["if x", "while"]]],
+     [[["if x > 0", "while"]]], []),
+    # 両方が同じ行を違うように変えた (テキストの中に印を入れる)
+    ([[["a"], ["l1\nl2"]]], [[["a"], ["l1\nours"]]], [[["a"], ["l1\ntheirs"]]],
+     [[["a"], [f"l1\n{OURS_MARKER}\nours\n{SEPARATOR_MARKER}\ntheirs\n{THEIRS_MARKER}"]]], [(0, 1)]),
+    # 両方が種類を違うものに変えた (両方のブロックを印で囲む)
+    ([[["x", "if"]]], [[["x", "while"]]], [[["x", "for"]]],
+     [[[OURS_MARKER], ["x", "while"], [SEPARATOR_MARKER], ["x", "for"], [THEIRS_MARKER]]], [(0, 0)]),
+    # 片方が削除したブロックを、もう片方が変えた
+    ([[["a"], ["b"]], [["c"]]], [[["a"]], [["c"]]], [[["a"], ["B"]], [["c2"]]],
+     [[["a"], [OURS_MARKER], [SEPARATOR_MARKER], ["B"], [THEIRS_MARKER]], [["c2"]]], [(0, 1)]),
+    # 片方が変えたブロックを、もう片方が削除した
+    ([[["a"], ["b"]]], [[["a"], ["B"]]], [[["a"]]],
+     [[["a"], [OURS_MARKER], ["B"], [SEPARATOR_MARKER], [THEIRS_MARKER]]], [(0, 1)]),
+    # 片方が削除したフレームを、もう片方が変えた (削除した側も印で示す)
+    ([[["a"]], [["f1"], ["f2"]]], [[["a"]]], [[["a"]], [["f1"], ["F2"]]],
+     [[["a"]], [[OURS_MARKER], [SEPARATOR_MARKER], ["f1"], ["F2"], [THEIRS_MARKER]]], [(1, None)]),
+    # 片方が変えたフレームを、もう片方が削除した
+    ([[["a"]], [["f1"], ["f2"]]], [[["a"]], [["F1"], ["f2"]]], [[["a"]]],
+     [[["a"]], [[OURS_MARKER], ["F1"], ["f2"], [SEPARATOR_MARKER], [THEIRS_MARKER]]], [(1, None)]),
+    # 両方が同じブロックを削除した
+    ([[["a"], ["b"]]], [[["a"]]], [[["a"]]], [[["a"]]], []),
+])
+def test_merge_cases(base, ours, theirs, expected, conflicts):
+    assert merge(base, ours, theirs) == (expected, conflicts)
+
+
+def test_merge_text():
+    assert merge_text("a\nb\nc", "A\nb\nc", "a\nb\nC") == ("A\nb\nC", False)
+    text, conflicted = merge_text("a", "b", "c")
+    assert conflicted
+    assert has_conflict(text)
+    assert not has_conflict("a = 1\n# ======= ではない")
+
+
+def test_pair_leftovers():
+    base = [Block("alpha = 1"), Block("beta = 2"), Block("gamma = 3")]
+    # 数が同じなら順に組にする
+    assert pair_leftovers(base, 0, 2, ["x", "y"], block_similarity) == [(0, "x"), (1, "y")]
+    # 似ているもの同士を組にし、残りは削除と追加にする
+    moved = [Block("beta = 20")]
+    assert pair_leftovers(base, 0, 3, moved, block_similarity) == [(0, None), (1, moved[0]), (2, None)]
+    moved = [Block("alpha = 10"), Block("zzz"), Block("gamma = 30")]
+    assert pair_leftovers(base, 0, 2, moved[:2], block_similarity) == [(0, moved[0]), (1, moved[1])]
+    assert pair_leftovers(base, 0, 1, moved, block_similarity) == [(0, moved[0]), (None, moved[1]), (None, moved[2])]
+    # 片方が空なら全部を削除か追加にする
+    assert pair_leftovers(base, 1, 1, moved[:1], block_similarity) == [(None, moved[0])]
+    assert pair_leftovers(base, 0, 2, [], block_similarity) == [(0, None), (1, None)]
+
+
+def test_diff_documents():
+    old = Document.from_data([[["a"], ["b"], ["c"]], [["d"]]])
+    assert list(diff_documents(old, old)) == []
+
+    new = Document.from_data([[["a"], ["B"], ["c"], ["e", "if"]], [["d"]]])
+    assert list(diff_documents(old, new)) == [
+        {"op": "replace", "frame": 0, "new_frame": 0, "block": 1, "blocks": 1, "new_block": 1, "new_blocks": 1, "old": [["b"]], "new": [["B"]]},
+        {"op": "insert", "frame": 0, "new_frame": 0, "block": 3, "blocks": 0, "new_block": 3, "new_blocks": 1, "old": [], "new": [["e", "if"]]},
+    ]
+
+    new = Document.from_data([[["d"]], [["x"]], [["y"]]])
+    assert list(diff_documents(old, new)) == [
+        {"op": "delete", "frame": 0, "frames": 1, "new_frame": 0, "new_frames": 0},
+        {"op": "insert", "frame": 2, "frames": 0, "new_frame": 1, "new_frames": 2},
+    ]
+
+
+def write(path, data):
+    Document.from_data(data).save(path)
+    return str(path)
+
+
+def test_cli_merge_exit_codes(tmp_path, capsys):
+    base = write(tmp_path / "base.json", [[["a"], ["b"]]])
+    ours = write(tmp_path / "ours.json", [[["A"], ["b"]]])
+    theirs = write(tmp_path / "theirs.json", [[["a"], ["B"]]])
+    output = str(tmp_path / "out.flairb")
+    assert flair_cli.main(["merge", base, ours, theirs, "-o", output]) == 0
+    assert Document.load(output).to_data() == [[["A"], ["B"]]]
+    assert json.loads(capsys.readouterr().out) == {"path": output, "ok": True, "conflicts": []}
+
+    # -o を省略すると ours に書く (git のマージドライバー)
+    conflicting = write(tmp_path / "conflicting.json", [[["X"], ["b"]]])
+    assert flair_cli.main(["merge", base, ours, conflicting]) == 1
+    assert Document.load(ours).to_data() == [[[f"{OURS_MARKER}\nA\n{SEPARATOR_MARKER}\nX\n{THEIRS_MARKER}"], ["b"]]]
+    assert json.loads(capsys.readouterr().out)["conflicts"] == [{"frame": 0, "block": 0}]
+
+    # 共通の祖先がない (空のファイル) ときは、空のドキュメントからマージする
+    empty = tmp_path / "empty"
+    empty.write_bytes(b"")
+    output = str(tmp_path / "added.json")
+    assert flair_cli.main(["merge", str(empty), theirs, str(empty), "-o", output]) == 0
+    assert Document.load(output).to_data() == [[["a"], ["B"]]]
+
+    broken = tmp_path / "broken.json"
+    broken.write_text("{not json", encoding="utf-8")
+    assert flair_cli.main(["merge", base, str(broken), theirs]) == 2
+    assert flair_cli.main(["merge", base, str(tmp_path / "missing.json"), theirs]) == 2
+    assert json.loads(capsys.readouterr().out.splitlines()[-1])["ok"] is False
+
+
+def test_cli_diff_exit_codes(tmp_path, capsys):
+    old = write(tmp_path / "old.json", [[["a"]]])
+    new = write(tmp_path / "new.flairb", [[["a"], ["b"]]])
+    assert flair_cli.main(["diff", old, old]) == 0
+    assert capsys.readouterr().out == ""
+    assert flair_cli.main(["diff", old, new]) == 1
+    assert json.loads(capsys.readouterr().out)["op"] == "insert"
+    assert flair_cli.main(["diff", old, str(tmp_path / "missing.json")]) == 2
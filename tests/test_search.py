@@ -0,0 +1,151 @@
+"""search.py (3文字の組の転置索引による検索) のテスト。"""
+import random
+import re
+
+import pytest
+
+from document import Document
+from search import NGRAM, SearchIndex, compile_pattern, ngrams
+
+
+# 索引を使わずに、テキストを順に照合した結果を返します。
+def brute_force(frames, pattern, regex=False, case_sensitive=False):
+    compiled = compile_pattern(pattern, regex, case_sensitive)
+    return [
+        (frame_index, index, match.start(), match.end())
+        for frame_index, texts in enumerate(frames)
+        for index, text in enumerate(texts)
+        for match in compiled.finditer(text)
+        if match.end() > match.start()
+    ]
+
+
+# 索引の postings がテキストから作り直したものと同じか確かめます。
+def assert_postings_consistent(index):
+    expected = {}
+    for frame_index, texts in enumerate(index.texts):
+        for block_index, text in enumerate(texts):
+            for gram in ngrams(text):
+                expected.setdefault(gram, set()).add((frame_index, block_index))
+    assert index.postings == expected
+
+
+def random_text(rng):
+    return "".join(rng.choice("abAB \n") for _ in range(rng.randrange(10)))
+
+
+# 索引と同じ操作を、リストのリストにも行います。
+def random_edits(rng, index, frames, count):
+    for _ in range(count):
+        choice = rng.random()
+        if choice < 0.1 or not frames:
+            frame = Document.from_data([[[random_text(rng)] for _ in range(rng.randrange(4))]]).frames[0]
+            frame_index = rng.randrange(len(frames) + 1)
+            index.add_frame(frame_index, frame)
+            texts = [block.text for block in frame.blocks]
+            if frame_index < len(frames):
+                frames[frame_index] = texts
+            else:
+                frames.append(texts)
+        elif choice < 0.15:
+            count = rng.randrange(len(frames) + 1)
+            index.truncate(count)
+            del frames[count:]
+        elif choice < 0.25 and any(frames):
+            frame_index = rng.choice([i for i, texts in enumerate(frames) if texts])
+            index.pop_block(frame_index)
+            frames[frame_index].pop()
+        else:
+            frame_index = rng.randrange(len(frames))
+            block = rng.randrange(len(frames[frame_index]) + 1)
+            text = random_text(rng)
+            index.set_text(frame_index, block, text)
+            if block == len(frames[frame_index]):
+                frames[frame_index].append(text)
+            else:
+                frames[frame_index][block] = text
+
+
+@pytest.mark.parametrize("threaded", [False, True])
+def test_find_matches_brute_force(threaded):
+    rng = random.Random(3)
+    index = SearchIndex()
+    if threaded:
+        index.start()
+    frames = []
+    try:
+        for _ in range(100):
+            random_edits(rng, index, frames, rng.randrange(1, 10))
+            for pattern in ("a", "ab", "aba", "ab a", "bab\nA", "zzz"):
+                for case_sensitive in (False, True):
+                    assert index.find(pattern, case_sensitive=case_sensitive) == brute_force(frames, pattern, case_sensitive=case_sensitive)
+            assert index.find("a+b", regex=True) == brute_force(frames, "a+b", regex=True)
+            assert index.block_count() == sum(len(texts) for texts in frames)
+        with index.lock:
+            index.apply_pending()
+            assert index.texts == frames
+            assert_postings_consistent(index)
+    finally:
+        index.close()
+
+
+def test_candidates_need_every_trigram():
+    index = SearchIndex()
+    index.add_frame(0, Document.from_data([[["abcd"], ["bcde"], ["xabc"]]]).frames[0])
+    index.block_count()
+    assert index.candidates("abc") == {(0, 0), (0, 2)}
+    assert index.candidates("abcd") == {(0, 0)}
+    assert index.candidates("ABCD") == {(0, 0)} # 索引は小文字で持つ
+    assert index.candidates("abcz") == set()
+    assert len("ab") < NGRAM and index.find("de") == [(0, 1, 2, 4)]
+
+
+def test_empty_matches_and_limit():
+    index = SearchIndex()
+    index.add_frame(0, Document.from_data([[["aaa"], ["aaa"]]]).frames[0])
+    assert index.find("") == []
+    assert index.find("x*", regex=True) == [] # 空文字列だけに一致する
+    assert index.find("a", limit=4) == [(0, 0, 0, 1), (0, 0, 1, 2), (0, 0, 2, 3), (0, 1, 0, 1)]
+    with pytest.raises(re.error):
+        index.find("(", regex=True)
+
+
+def test_unread_flairb_frame_is_decoded_in_index(tmp_path):
+    path = tmp_path / "doc.flairb"
+    Document.from_data([[["first line"], ["second"]], [["third line"]]]).save(path)
+    document = Document.load(path)
+    index = SearchIndex()
+    index.start()
+    try:
+        for frame_index, frame in enumerate(document.frames):
+            index.add_frame(frame_index, frame)
+        assert index.find("line") == [(0, 0, 6, 10), (1, 0, 6, 10)]
+        assert not any(frame.is_loaded() for frame in document.frames) # 索引のために読まない
+    finally:
+        index.close()
+
+
+def test_replacements_and_replace_match():
+    index = SearchIndex()
+    index.add_frame(0, Document.from_data([[["foo = foo + 1"], ["bar"], ["Foo()"]]]).frames[0])
+    assert index.replacements("foo", "baz") == [
+        (0, 0, "foo = foo + 1", "baz = baz + 1"),
+        (0, 2, "Foo()", "baz()"),
+    ]
+    assert index.replacements("(f)(oo)", r"\2\1", regex=True, case_sensitive=True) == [
+        (0, 0, "foo = foo + 1", "oof = oof + 1"),
+    ]
+    match = index.find("foo")[1]
+    assert index.replace_match(match, "foo", "x") == ("foo = foo + 1", "foo = x + 1")
+    index.set_text(0, 0, "foo = fo + 1")
+    assert index.replace_match(match, "foo", "x") is None # 編集で一致しなくなった
+
+
+def test_on_change_is_called_for_each_edit():
+    calls = []
+    index = SearchIndex(on_change=lambda: calls.append(True))
+    index.add_frame(0, Document.from_data([[["a"]]]).frames[0])
+    index.set_text(0, 1, "b")
+    index.pop_block(0)
+    assert len(calls) == 3
+    assert index.find("b") == []